@@ -0,0 +1,261 @@
+"""
+backup.py — онлайн-бэкап SQLite-баз ботов (notes.db, bot.db) без остановки.
+
+Как работает:
+  - копия снимается через SQLite online backup API (Connection.backup)
+    маленькими порциями страниц, между порциями — пауза, поэтому блокировка
+    на источнике держится миллисекунды и не мешает обработчикам писать;
+  - копия проверяется PRAGMA quick_check, сжимается gzip и рядом кладётся
+    файл .sha256 (формат sha256sum, можно проверить руками: sha256sum -c);
+  - хранится не больше BACKUP_KEEP последних снимков на каждую базу;
+  - восстановление тоже идёт через backup API — в целевую базу, а не
+    подменой файла, так что открытые соединения не увидят «рваный» файл.
+
+Настройки (переменные окружения):
+  BACKUP_DIR            — куда класть снимки (по умолчанию backups/)
+  BACKUP_INTERVAL_SEC   — период фонового бэкапа, 0 — выключен
+  BACKUP_KEEP           — сколько снимков хранить на базу
+  BACKUP_PAGES          — страниц за один шаг backup API
+  BACKUP_SLEEP          — пауза между шагами, сек
+  BACKUP_MAX_RESTARTS   — сколько раз терпим перезапуск копии из-за записей
+
+Запуск вручную:
+  python backup.py backup notes.db bot.db
+  python backup.py list
+  python backup.py restore backups/notes-20250101-090000.db.gz notes.db
+"""
+
+from __future__ import annotations
+import os
+import gzip
+import shutil
+import sqlite3
+import hashlib
+import logging
+import argparse
+import threading
+import time
+from datetime import datetime
+from typing import Iterable, List
+
+log = logging.getLogger(__name__)
+
+BACKUP_DIR = os.getenv("BACKUP_DIR", "backups")
+BACKUP_INTERVAL_SEC = int(os.getenv("BACKUP_INTERVAL_SEC", "0"))
+BACKUP_KEEP = int(os.getenv("BACKUP_KEEP", "7"))
+BACKUP_PAGES = int(os.getenv("BACKUP_PAGES", "64"))
+BACKUP_SLEEP = float(os.getenv("BACKUP_SLEEP", "0.02"))
+BACKUP_MAX_RESTARTS = int(os.getenv("BACKUP_MAX_RESTARTS", "5"))
+
+_SUFFIX = ".db.gz"
+
+
+def _sha256_file(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _online_copy(src_path: str, dst_path: str, pages: int, sleep: float) -> None:
+    """
+    Копирует живую базу порциями по pages страниц.
+    В WAL копия идёт внутри одной читающей транзакции: снимок стабилен,
+    а писатели читателя не ждут. В обычном журнале изменения от других
+    соединений заставляют SQLite начать копию заново — считаем такие
+    перезапуски и после BACKUP_MAX_RESTARTS доделываем копию одним шагом.
+    """
+    state = {"remaining": None, "restarts": 0}
+
+    def progress(status: int, remaining: int, total: int) -> None:
+        prev = state["remaining"]
+        if prev is not None and remaining > prev:
+            state["restarts"] += 1
+        state["remaining"] = remaining
+        if state["restarts"] > BACKUP_MAX_RESTARTS:
+            raise _TooManyRestarts()
+        if remaining and sleep > 0:
+            time.sleep(sleep)  # отдаём блокировку писателям
+
+    src = sqlite3.connect(src_path, timeout=5.0, isolation_level=None)
+    dst = sqlite3.connect(dst_path)
+    try:
+        wal = src.execute("PRAGMA journal_mode").fetchone()[0].lower() == "wal"
+        if wal:
+            src.execute("BEGIN")
+            src.execute("SELECT COUNT(*) FROM sqlite_master").fetchone()  # фиксируем снимок
+        try:
+            src.backup(dst, pages=pages, progress=progress)
+        except _TooManyRestarts:
+            log.warning("Backup %s restarted %d times, finishing in one step", src_path, state["restarts"])
+            src.backup(dst, pages=-1)
+        finally:
+            if wal:
+                src.execute("COMMIT")
+    finally:
+        dst.close()
+        src.close()
+
+
+class _TooManyRestarts(Exception):
+    pass
+
+
+def _snapshot_prefix(db_path: str) -> str:
+    return os.path.splitext(os.path.basename(db_path))[0] + "-"
+
+
+def list_backups(db_path: str | None = None, backup_dir: str = BACKUP_DIR) -> List[str]:
+    """Снимки в каталоге (по возрастанию времени); db_path — только для одной базы."""
+    if not os.path.isdir(backup_dir):
+        return []
+    prefix = _snapshot_prefix(db_path) if db_path else ""
+    paths = [os.path.join(backup_dir, n) for n in os.listdir(backup_dir)
+             if n.endswith(_SUFFIX) and n.startswith(prefix)]
+    return sorted(paths, key=lambda p: (os.path.getmtime(p), p))
+
+
+def _prune(db_path: str, backup_dir: str, keep: int) -> None:
+    old = list_backups(db_path, backup_dir)[:-keep] if keep > 0 else []
+    for path in old:
+        for p in (path, path + ".sha256"):
+            try:
+                os.remove(p)
+            except FileNotFoundError:
+                pass
+        log.info("Backup pruned: %s", path)
+
+
+def backup_db(db_path: str, backup_dir: str = BACKUP_DIR, keep: int = BACKUP_KEEP,
+              pages: int = BACKUP_PAGES, sleep: float = BACKUP_SLEEP) -> str:
+    """Снимает сжатый снимок db_path и возвращает путь к .db.gz."""
+    os.makedirs(backup_dir, exist_ok=True)
+    stamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+    name = f"{_snapshot_prefix(db_path)}{stamp}"
+    n = 1
+    while os.path.exists(os.path.join(backup_dir, name + _SUFFIX)):
+        n += 1
+        name = f"{_snapshot_prefix(db_path)}{stamp}.{n}"
+    raw_path = os.path.join(backup_dir, name + ".db.part")
+    gz_path = os.path.join(backup_dir, name + _SUFFIX)
+
+    started = time.monotonic()
+    try:
+        _online_copy(db_path, raw_path, pages, sleep)
+
+        conn = sqlite3.connect(raw_path)
+        try:
+            # снимок самодостаточный: журнал обычный, WAL не нужен
+            conn.execute("PRAGMA journal_mode = DELETE")
+            ok = conn.execute("PRAGMA quick_check").fetchone()[0]
+        finally:
+            conn.close()
+        if ok != "ok":
+            raise RuntimeError(f"Снимок {db_path} не прошёл quick_check: {ok}")
+
+        with open(raw_path, "rb") as src, gzip.open(gz_path + ".part", "wb", compresslevel=6) as dst:
+            shutil.copyfileobj(src, dst, 1 << 20)
+        os.replace(gz_path + ".part", gz_path)
+    finally:
+        for p in (raw_path, gz_path + ".part"):
+            if os.path.exists(p):
+                os.remove(p)
+
+    with open(gz_path + ".sha256", "w", encoding="utf-8") as f:
+        f.write(f"{_sha256_file(gz_path)}  {os.path.basename(gz_path)}\n")
+
+    log.info("Backup %s -> %s (%.0f ms)", db_path, gz_path, (time.monotonic() - started) * 1000)
+    _prune(db_path, backup_dir, keep)
+    return gz_path
+
+
+def verify_backup(gz_path: str) -> bool:
+    """Сверяет снимок с его .sha256."""
+    try:
+        with open(gz_path + ".sha256", encoding="utf-8") as f:
+            expected = f.read().split()[0]
+    except (FileNotFoundError, IndexError):
+        return False
+    return _sha256_file(gz_path) == expected
+
+
+def restore_db(gz_path: str, db_path: str) -> None:
+    """
+    Восстанавливает db_path из снимка.
+    Содержимое переливается через backup API в целевую базу, поэтому
+    это безопасно даже если файл кем-то открыт (писатели подождут).
+    """
+    if not verify_backup(gz_path):
+        raise RuntimeError(f"Контрольная сумма не совпала: {gz_path}")
+
+    raw_path = db_path + ".restore"
+    try:
+        with gzip.open(gz_path, "rb") as src, open(raw_path, "wb") as dst:
+            shutil.copyfileobj(src, dst, 1 << 20)
+
+        src = sqlite3.connect(raw_path)
+        dst = sqlite3.connect(db_path, timeout=30.0)
+        try:
+            ok = src.execute("PRAGMA quick_check").fetchone()[0]
+            if ok != "ok":
+                raise RuntimeError(f"Снимок повреждён: {ok}")
+            src.backup(dst)
+        finally:
+            dst.close()
+            src.close()
+    finally:
+        if os.path.exists(raw_path):
+            os.remove(raw_path)
+    log.info("Restored %s from %s", db_path, gz_path)
+
+
+# ---------- фоновый бэкап по расписанию ----------
+def backup_loop(db_paths: Iterable[str], interval: int, stop: threading.Event) -> None:
+    db_paths = list(db_paths)
+    log.info("Backup scheduler started: %s every %d s", ", ".join(db_paths), interval)
+    while not stop.wait(interval):
+        for path in db_paths:
+            try:
+                backup_db(path)
+            except Exception as e:
+                log.exception("Backup of %s failed: %r", path, e)
+
+
+def start_backup_scheduler(db_paths: Iterable[str], interval: int = BACKUP_INTERVAL_SEC) -> threading.Event | None:
+    """Запускает фоновый поток бэкапа; при interval <= 0 ничего не делает."""
+    if interval <= 0:
+        return None
+    stop = threading.Event()
+    t = threading.Thread(target=backup_loop, args=(db_paths, interval, stop), name="db-backup", daemon=True)
+    t.start()
+    return stop
+
+
+def main() -> None:
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(name)s: %(message)s")
+    parser = argparse.ArgumentParser(description="Онлайн-бэкап SQLite-баз ботов")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+
+    p = sub.add_parser("backup", help="снять снимки")
+    p.add_argument("db", nargs="+")
+
+    sub.add_parser("list", help="показать снимки")
+
+    p = sub.add_parser("restore", help="восстановить базу из снимка")
+    p.add_argument("archive")
+    p.add_argument("db")
+
+    args = parser.parse_args()
+    if args.cmd == "backup":
+        for path in args.db:
+            print(backup_db(path))
+    elif args.cmd == "list":
+        for path in list_backups():
+            print(f"{path}  {'ok' if verify_backup(path) else 'BAD CHECKSUM'}")
+    elif args.cmd == "restore":
+        restore_db(args.archive, args.db)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,497 @@
+"""
+bench_db_scale.py — слой данных на больших базах: db.py, db3.py и SQL из main.py/crud.py.
+
+Наполняет временные notes.db и bot.db (по умолчанию 10^5 пользователей
+и 10^6 заметок; --notes 10000000 — как в боевой базе через пару лет) и меряет:
+  - каждую публичную функцию db.py и db3.py, а также save_note/get_user_notes
+    (main.py) и get_weekly_stats (crud.py) — в одном потоке, --repeat раз
+    вперемешку; в отчёте медиана p50/p99 по повторам и разброс p50 между ними
+    (по нему видно, какой разнице можно верить);
+  - смеси read-heavy (90% чтений) и write-heavy (70% записей) в --threads
+    потоках: операций/с, p50/p99, ошибки «database is locked», рост WAL,
+    число перезапусков WAL (завершённых checkpoint), записи дольше 10×
+    медианы записи (обычно — autocheckpoint внутри COMMIT) и время ручного
+    checkpoint накопленного WAL;
+  - размеры файлов баз и WAL до и после.
+Для запросов, которые на этой схеме читают таблицу целиком, печатается план
+(EXPLAIN QUERY PLAN: SCAN вместо SEARCH по индексу).
+
+Результат — --json (с коммитом git); --compare старый.json сравнивает p50
+функций и операций/с смесей и завершается с кодом 1, если что-то стало
+хуже больше чем на --threshold процентов и больше разброса — годится как
+проверка регрессий. Сравнивать имеет смысл прогоны с одинаковыми --users/--notes
+на одной машине; на общей (CI, виртуалка с соседями) быстрые функции «плавают»
+на 30–50% между прогонами — там порог нужен выше (--threshold 60).
+
+Запуск: python benchmarks/bench_db_scale.py [--users 100000] [--notes 1000000]
+        [--threads 1 4 8] [--repeat 5] [--json out.json] [--compare base.json]
+"""
+
+from __future__ import annotations
+import os
+import sys
+import json
+import time
+import random
+import sqlite3
+import argparse
+import platform
+import tempfile
+import threading
+import subprocess
+import statistics
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+SIGNS = ["овен", "телец", "близнецы", "рак", "лев", "дева",
+         "весы", "скорпион", "стрелец", "козерог", "водолей", "рыбы"]
+WORDS = ("купить молоко хлеб позвонить маме встреча в пятницу отчёт по проекту оплатить интернет "
+         "записаться к врачу забрать посылку идея для статьи прочитать книгу день рождения").split()
+NOW = time.time()
+
+
+def _pct(sorted_values: list, q: float) -> float:
+    return sorted_values[min(len(sorted_values) - 1, int(q * len(sorted_values)))]
+
+
+def _hot_user(rng: random.Random, users: int) -> int:
+    """Степенное распределение: немногие пользователи пишут большую часть заметок."""
+    return int(users * rng.random() ** 3) + 1
+
+
+def _note_text(rng: random.Random) -> str:
+    if rng.random() < 0.01:  # длинная заметка — хранится сжатой
+        return " ".join(rng.choice(WORDS) for _ in range(rng.randint(250, 600)))
+    return " ".join(rng.choice(WORDS) for _ in range(rng.randint(2, 40)))
+
+
+# ---------- наполнение ----------
+def fill_notes(db, users: int, notes: int, rng: random.Random) -> None:
+    start = datetime.now() - timedelta(days=365)
+    with db._connect() as conn:
+        conn.execute("PRAGMA synchronous = OFF")  # только на время наполнения
+        for lo in range(0, notes, 50_000):
+            rows = []
+            for i in range(lo, min(notes, lo + 50_000)):
+                created = start + timedelta(seconds=365 * 86400 * i // max(notes, 1))
+                rows.append((_hot_user(rng, users), *db._encode_note(conn, _note_text(rng)),
+                             created.strftime("%Y-%m-%d %H:%M:%S")))
+            conn.executemany("INSERT INTO notes (user_id, text, codec, dict_id, body, created_at) "
+                             "VALUES (?, ?, ?, ?, ?, ?)", rows)
+            conn.commit()
+        conn.executemany("INSERT OR IGNORE INTO user_character(telegram_user_id, character_id) VALUES (?, ?)",
+                         ((uid, uid % 11 + 1) for uid in range(1, users + 1, 3)))
+        conn.commit()
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+
+def fill_bot(db3, users: int) -> None:
+    conn = db3._connect()
+    try:
+        with conn:
+            conn.executemany(
+                "INSERT INTO users(user_id, sign, notify_hour, notify_minute, subscribed, tz, next_send_at) "
+                "VALUES (?, ?, ?, ?, ?, 'Europe/Moscow', ?)",
+                ((uid, SIGNS[uid % 12], uid % 24, uid % 60, int(uid % 5 != 0),
+                  int(NOW) - 3600 + uid % 1440 * 60 if uid % 5 != 0 else None)
+                 for uid in range(1, users + 1)))
+            conn.executemany(
+                "INSERT INTO outbox(user_id, sign, send_date, status, available_at) VALUES (?, ?, ?, ?, ?)",
+                ((uid, SIGNS[uid % 12], "2025-01-01", "sent" if uid % 10 else "pending", int(NOW) - uid % 600)
+                 for uid in range(1, users + 1, 2)))
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    finally:
+        conn.close()
+    today = datetime.now().date()
+    db3.save_forecasts(((s, (today + timedelta(days=d)).isoformat(), f"{s} {d}") for s in SIGNS for d in range(31)),
+                       today.isoformat())
+
+
+# ---------- функции по одной ----------
+def single_ops(db, db3, main, crud, users: int, rng: random.Random) -> dict:
+    """Имя -> (вызов(rng), пишет ли в базу)."""
+    uid = lambda r: _hot_user(r, users)  # noqa: E731
+    max_note = [0]
+
+    def note_id(r):
+        if not max_note[0]:
+            with db._connect() as conn:
+                max_note[0] = conn.execute("SELECT MAX(id) FROM notes").fetchone()[0] or 1
+        return r.randint(1, max_note[0])
+
+    today = datetime.now().date().isoformat()
+    owner = "bench"
+
+    def lease_cycle(kind):
+        def run(r):
+            rows = db3.lease_outbox(owner, 10, 60, time.time())
+            ids = [row["id"] for row in rows]
+            if kind == "ack":
+                db3.ack_outbox(ids, owner)
+            elif kind == "retry":
+                db3.retry_outbox(ids, owner, time.time() - 86400, "bench", 5, 1)
+            else:
+                db3.dead_outbox(ids, owner, "bench")
+        return run
+
+    def due_page(r):
+        return next(iter(db3.iter_due(NOW + 86400, 100)), [])
+
+    return {
+        # db.py
+        "db.init_db": (lambda r: db.init_db(), True),
+        "db.list_models": (lambda r: db.list_models(), False),
+        "db.get_active_model": (lambda r: db.get_active_model(), False),
+        "db.set_active_model": (lambda r: db.set_active_model(r.randint(1, 4)), True),
+        "db.add_model": (lambda r: db.add_model(f"bench/model-{r.randint(1, 20)}", "Bench"), True),
+        "db.add_note": (lambda r: db.add_note(uid(r), _note_text(r)), True),
+        "db.list_notes": (lambda r: db.list_notes(uid(r)), False),
+        "db.list_notes preview": (lambda r: db.list_notes(uid(r), preview=True), False),
+        "db.update_note": (lambda r: db.update_note(uid(r), note_id(r), _note_text(r)), True),
+        "db.delete_note": (lambda r: db.delete_note(uid(r), note_id(r)), True),
+        "db.find_notes": (lambda r: db.find_notes(uid(r), r.choice(WORDS)), False),
+        "db.count_notes": (lambda r: db.count_notes(uid(r)), False),
+        "db.train_note_dict": (lambda r: db.train_note_dict(), True),
+        "db.list_characters": (lambda r: db.list_characters(), False),
+        "db.get_character_by_id": (lambda r: db.get_character_by_id(r.randint(1, 11)), False),
+        "db.set_user_character": (lambda r: db.set_user_character(uid(r), r.randint(1, 11)), True),
+        "db.get_user_character": (lambda r: db.get_user_character(uid(r)), False),
+        "db.get_character_prompt_for_user": (lambda r: db.get_character_prompt_for_user(uid(r)), False),
+        # SQL прямо в ботах
+        "main.save_note": (lambda r: main.save_note(uid(r), _note_text(r)), True),
+        "main.get_user_notes": (lambda r: main.get_user_notes(uid(r)), False),
+        "crud.get_weekly_stats": (lambda r: crud.get_weekly_stats(uid(r)), False),
+        # db3.py
+        "db3.init_db": (lambda r: db3.init_db(), True),
+        "db3.valid_tz": (lambda r: db3.valid_tz("Asia/Omsk"), False),
+        "db3.next_send_ts": (lambda r: db3.next_send_ts("Europe/Moscow", 9, 30, time.time()), False),
+        "db3.profile": (lambda r: db3.profile(r.randint(1, users)), False),
+        "db3.ensure_user": (lambda r: db3.ensure_user(r.randint(1, users)), False),
+        "db3.get_user": (lambda r: db3.get_user(r.randint(1, users)), False),
+        "db3.get_user uncached": (lambda r: (db3._cache_drop((u := r.randint(1, users),)), db3.get_user(u)), False),
+        "db3.set_sign": (lambda r: db3.set_sign(r.randint(1, users), r.choice(SIGNS)), True),
+        "db3.set_notify_hour": (lambda r: db3.set_notify_hour(r.randint(1, users), r.randint(0, 23), 30), True),
+        "db3.set_tz": (lambda r: db3.set_tz(r.randint(1, users), "Asia/Omsk"), True),
+        "db3.set_subscribed": (lambda r: db3.set_subscribed(r.randint(1, users), r.random() < .8), True),
+        "db3.iter_due": (due_page, False),
+        "db3.next_due_ts": (lambda r: db3.next_due_ts(), False),
+        "db3.advance_many": (lambda r: db3.advance_many(due_page(r), NOW + 86400), True),
+        "db3.enqueue_due": (lambda r: db3.enqueue_due(due_page(r), NOW + 86400), True),
+        "db3.lease_outbox+ack_outbox": (lease_cycle("ack"), True),
+        "db3.lease_outbox+retry_outbox": (lease_cycle("retry"), True),
+        "db3.lease_outbox+dead_outbox": (lease_cycle("dead"), True),
+        "db3.outbox_next_ready_ts": (lambda r: db3.outbox_next_ready_ts(), False),
+        "db3.outbox_stats": (lambda r: db3.outbox_stats(), False),
+        "db3.acquire_lease": (lambda r: db3.acquire_lease("bench", owner, 15, time.time()), True),
+        "db3.release_lease": (lambda r: db3.release_lease("bench", owner), True),
+        "db3.forecasts_until": (lambda r: db3.forecasts_until(), False),
+        "db3.get_forecasts": (lambda r: db3.get_forecasts(r.choice(SIGNS), today, 30), False),
+        "db3.save_forecasts": (lambda r: db3.save_forecasts([(r.choice(SIGNS), today, "bench")], "2000-01-01"), True),
+    }
+
+
+# каждый вызов добавляет словарь сжатия — за проход хватит нескольких
+CALL_LIMITS = {"db.train_note_dict": 3}
+
+
+def run_singles(ops: dict, repeat: int, n: int, budget: float, rng: random.Random) -> dict:
+    """repeat проходов вперемешку; в каждом — до n вызовов функции, но не дольше budget секунд."""
+    runs = {name: [] for name in ops}
+    errors = {name: [] for name in ops}  # исключения тоже результат: функция на такой базе не работает
+    for _ in range(repeat):
+        for name, (fn, _) in ops.items():
+            times = []
+            deadline = time.perf_counter() + budget
+            limit = CALL_LIMITS.get(name, n)
+            while len(times) < limit and (not times or time.perf_counter() < deadline):
+                t0 = time.perf_counter()
+                try:
+                    fn(rng)
+                except Exception as e:
+                    errors[name].append(f"{type(e).__name__}: {e}")
+                times.append(time.perf_counter() - t0)
+            times.sort()
+            runs[name].append((_pct(times, .5), _pct(times, .99), len(times)))
+    out = {}
+    for name, rows in runs.items():
+        p50s = [r[0] for r in rows]
+        med = statistics.median(p50s)
+        out[name] = {"writes": ops[name][1], "calls": sum(r[2] for r in rows), "errors": len(errors[name]),
+                     "first_error": errors[name][0] if errors[name] else None,
+                     "p50_ms": med * 1000, "best_p50_ms": min(p50s) * 1000, "p99_ms": statistics.median(r[1] for r in rows) * 1000,
+                     "spread_pct": (max(p50s) - min(p50s)) / med * 100 if med else 0.0}
+    return out
+
+
+# ---------- смеси в несколько потоков ----------
+def mix_ops(db, db3, users: int, write_share: float) -> tuple[list, list]:
+    uid = lambda r: _hot_user(r, users)  # noqa: E731
+    reads = [
+        (25, lambda r: db.list_notes(uid(r), preview=True)),
+        (15, lambda r: db.count_notes(uid(r))),
+        (10, lambda r: db.get_user_character(uid(r))),
+        (30, lambda r: db3.get_user(r.randint(1, users))),
+        (20, lambda r: db3.get_forecasts(r.choice(SIGNS), datetime.now().date().isoformat(), 7)),
+    ]
+    writes = [
+        (40, lambda r: db.add_note(uid(r), _note_text(r))),
+        (10, lambda r: db.set_user_character(uid(r), r.randint(1, 11))),
+        (30, lambda r: db3.set_sign(r.randint(1, users), r.choice(SIGNS))),
+        (20, lambda r: db3.set_notify_hour(r.randint(1, users), r.randint(0, 23))),
+    ]
+    scale = lambda items, share: [(w * share, fn) for w, fn in items]  # noqa: E731
+    table = scale(reads, 1 - write_share) + scale(writes, write_share)
+    return [w for w, _ in table], [(fn, i >= len(reads)) for i, (_, fn) in enumerate(table)]
+
+
+def _wal_state(path: str) -> tuple[int, int | None]:
+    """Размер WAL и номер checkpoint из его заголовка (растёт при каждом перезапуске WAL)."""
+    try:
+        with open(path + "-wal", "rb") as f:
+            head = f.read(16)
+        return os.path.getsize(path + "-wal"), int.from_bytes(head[12:16], "big") if len(head) == 16 else None
+    except OSError:
+        return 0, None
+
+
+def run_mix(db, db3, paths: list, users: int, threads: int, write_share: float, seconds: float) -> dict:
+    weights, fns = mix_ops(db, db3, users, write_share)
+    samples: list[list] = [[] for _ in range(threads)]  # (секунды, запись?)
+    errors = [0] * threads
+    stop = threading.Event()
+    wal = {p: {"max": 0, "seq": set()} for p in paths}
+
+    def monitor() -> None:
+        while not stop.is_set():
+            for p in paths:
+                size, seq = _wal_state(p)
+                wal[p]["max"] = max(wal[p]["max"], size)
+                if seq is not None:
+                    wal[p]["seq"].add(seq)
+            time.sleep(0.005)
+
+    def worker(i: int) -> None:
+        r = random.Random(i)
+        while not stop.is_set():
+            fn, is_write = r.choices(fns, weights)[0]
+            t0 = time.perf_counter()
+            try:
+                fn(r)
+            except sqlite3.OperationalError:  # database is locked
+                errors[i] += 1
+                continue
+            samples[i].append((time.perf_counter() - t0, is_write))
+
+    pool = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+    mon = threading.Thread(target=monitor, daemon=True)
+    mon.start()
+    t0 = time.perf_counter()
+    for t in pool:
+        t.start()
+    time.sleep(seconds)
+    stop.set()
+    for t in pool:
+        t.join()
+    wall = time.perf_counter() - t0
+    mon.join()
+
+    checkpoints = {}
+    for p in paths:  # сколько стоит влить накопленный WAL одним ручным checkpoint
+        conn = sqlite3.connect(p)
+        c0 = time.perf_counter()
+        busy, frames, done = conn.execute("PRAGMA wal_checkpoint(PASSIVE)").fetchone()
+        checkpoints[os.path.basename(p)] = {"ms": (time.perf_counter() - c0) * 1000, "frames": frames}
+        conn.close()
+
+    flat = [s for part in samples for s in part]
+    all_t = sorted(s for s, _ in flat)
+    write_t = sorted(s for s, w in flat if w)
+    read_t = sorted(s for s, w in flat if not w)
+    med_w = _pct(write_t, .5) if write_t else 0.0
+    slow = [s for s in write_t if s > 10 * med_w] if med_w else []
+    return {
+        "threads": threads, "write_share": write_share, "ops": len(flat), "ops_per_sec": len(flat) / wall,
+        "p50_ms": _pct(all_t, .5) * 1000 if all_t else 0.0, "p99_ms": _pct(all_t, .99) * 1000 if all_t else 0.0,
+        "read_p99_ms": _pct(read_t, .99) * 1000 if read_t else 0.0,
+        "write_p99_ms": _pct(write_t, .99) * 1000 if write_t else 0.0,
+        "locked_errors": sum(errors),
+        "slow_writes": len(slow), "slow_write_max_ms": max(slow) * 1000 if slow else 0.0,
+        "wal": {os.path.basename(p): {"max_mib": wal[p]["max"] / 2 ** 20,
+                                       "restarts": max(0, len(wal[p]["seq"]) - 1)} for p in paths},
+        "checkpoint": checkpoints,
+    }
+
+
+# ---------- планы и размеры ----------
+PLANS = {
+    "notes WHERE user_id (list_notes, count_notes, find_notes)":
+        ("notes", "SELECT id, text, codec FROM notes WHERE user_id = ? ORDER BY id", (1,)),
+    "notes by user and date (get_weekly_stats)":
+        ("notes", "SELECT DATE(created_at), COUNT(*) FROM notes WHERE user_id = ? AND created_at >= ? "
+                  "GROUP BY DATE(created_at)", (1, "2025-01-01")),
+    "users by hour (прежний планировщик, bench_scheduler.py legacy)":
+        ("bot", "SELECT user_id, sign FROM users WHERE subscribed = 1 AND sign IS NOT NULL AND notify_hour = ? "
+                "AND (last_sent_date IS NULL OR last_sent_date <> ?)", (9, "2025-01-01")),
+    "outbox by status (outbox_stats)":
+        ("bot", "SELECT status, COUNT(*) FROM outbox GROUP BY status", ()),
+}
+
+
+def full_scans(paths: dict) -> dict:
+    out = {}
+    for name, (db_name, sql, params) in PLANS.items():
+        conn = sqlite3.connect(paths[db_name])
+        plan = [row[3] for row in conn.execute("EXPLAIN QUERY PLAN " + sql, params)]
+        conn.close()
+        out[name] = "; ".join(plan)
+    return out
+
+
+def sizes(paths: dict) -> dict:
+    mib = lambda p: os.path.getsize(p) / 2 ** 20 if os.path.exists(p) else 0.0  # noqa: E731
+    return {os.path.basename(p): {"db_mib": mib(p), "wal_mib": mib(p + "-wal")} for p in paths.values()}
+
+
+# ---------- отчёт и сравнение ----------
+def _git_commit() -> str | None:
+    try:
+        out = subprocess.run(["git", "-C", ROOT, "describe", "--always", "--dirty"], capture_output=True, text=True, timeout=10)
+        return out.stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def print_sizes(title: str, data: dict) -> None:
+    print(f"{title}: " + ", ".join(f"{name} {s['db_mib']:.1f} MiB (WAL {s['wal_mib']:.1f})" for name, s in data.items()))
+
+
+def compare(result: dict, base: dict, threshold: float) -> list[str]:
+    """
+    Регрессии: p50 функции или операций/с смеси хуже на threshold% и больше разброса.
+    Функции сравниваются по лучшему p50 из повторов — он меньше всего зависит от соседей по машине.
+    """
+    bad = []
+    for name, cur in result["functions"].items():
+        old = base.get("functions", {}).get(name)
+        if not old or not old["best_p50_ms"]:
+            continue
+        delta = (cur["best_p50_ms"] - old["best_p50_ms"]) / old["best_p50_ms"] * 100
+        noise = max(threshold, cur["spread_pct"], old["spread_pct"])
+        mark = " <-- регрессия" if delta > noise else ""
+        print(f"  {name[:34]:34} p50 {old['best_p50_ms']:9.3f} -> {cur['best_p50_ms']:9.3f} мс ({delta:+.0f}%){mark}")
+        if mark:
+            bad.append(name)
+    old_mixes = {(m["threads"], m["write_share"]): m for m in base.get("mixes", [])}
+    for cur in result["mixes"]:
+        old = old_mixes.get((cur["threads"], cur["write_share"]))
+        if not old or not old["ops_per_sec"]:
+            continue
+        delta = (cur["ops_per_sec"] - old["ops_per_sec"]) / old["ops_per_sec"] * 100
+        name = f"mix {cur['threads']}x write={cur['write_share']:.0%}"
+        mark = " <-- регрессия" if -delta > threshold else ""
+        print(f"  {name:34} {old['ops_per_sec']:9.0f} -> {cur['ops_per_sec']:9.0f} оп/с ({delta:+.0f}%){mark}")
+        if mark:
+            bad.append(name)
+    return bad
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--users", type=int, default=100_000)
+    ap.add_argument("--notes", type=int, default=1_000_000)
+    ap.add_argument("--threads", type=int, nargs="+", default=[1, 4, 8])
+    ap.add_argument("--repeat", type=int, default=5, help="проходов по функциям (медиана и разброс)")
+    ap.add_argument("--ops", type=int, default=200, help="вызовов функции за проход (не больше)")
+    ap.add_argument("--budget", type=float, default=1.0, help="секунд на функцию за проход (не больше)")
+    ap.add_argument("--mix-seconds", type=float, default=5.0)
+    ap.add_argument("--dir", help="каталог для баз (по умолчанию временный)")
+    ap.add_argument("--json", help="сохранить результат в файл")
+    ap.add_argument("--compare", help="сравнить с результатом --json; код 1 при регрессиях")
+    ap.add_argument("--threshold", type=float, default=25.0, help="допустимое ухудшение, %%")
+    args = ap.parse_args()
+
+    workdir = args.dir or tempfile.mkdtemp(prefix="db-scale-")
+    os.makedirs(workdir, exist_ok=True)
+    paths = {"notes": os.path.join(workdir, "notes.db"), "bot": os.path.join(workdir, "bot.db")}
+    for p in paths.values():
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(p + suffix):
+                os.remove(p + suffix)
+    cwd = os.getcwd()
+    os.chdir(workdir)  # main.py пишет characters.db и logs/ относительно текущего каталога
+    os.environ.update({"NOTES_DB_PATH": paths["notes"], "DB_PATH": paths["bot"], "TOKEN": "1:bench",
+                       "LOG_DIR": os.path.join(workdir, "logs")})
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+    os.environ.setdefault("OPENROUTER_API_KEY", "bench")  # main.py создаёт клиента при импорте; запросов нет
+    import db
+    import db3
+    import main as main_bot
+    import crud
+
+    rng = random.Random(42)
+    t0 = time.perf_counter()
+    db.init_db()
+    db3.init_db()
+    fill_notes(db, args.users, args.notes, rng)
+    fill_bot(db3, args.users)
+    print(f"наполнение: {args.users} пользователей, {args.notes} заметок за {time.perf_counter() - t0:.0f} с")
+    before = sizes(paths)
+    print_sizes("до", before)
+
+    print("\nзапросы без индекса (SCAN — вся таблица):")
+    plans = full_scans(paths)
+    for name, plan in plans.items():
+        if "SCAN" in plan:
+            print(f"  {name}: {plan}")
+
+    functions = run_singles(single_ops(db, db3, main_bot, crud, args.users, rng),
+                            args.repeat, args.ops, args.budget, rng)
+    print(f"\n{'функция':34} {'вызовов':>7} {'p50':>9} {'p99':>9} мс {'разброс':>8}")
+    for name, f in functions.items():
+        err = f"  ошибок {f['errors']}: {f['first_error'][:60]}" if f["errors"] else ""
+        print(f"{name[:34]:34} {f['calls']:7} {f['p50_ms']:9.3f} {f['p99_ms']:9.3f}    {f['spread_pct']:6.0f}%{err}")
+
+    mixes = []
+    print(f"\n{'смесь':18} {'потоков':>7} {'оп/с':>8} {'p50':>7} {'p99':>7} {'чт p99':>7} {'зап p99':>7} мс"
+          f" {'locked':>6} {'медл.зап':>8} {'WAL MiB':>8} {'ckpt':>5} {'ckpt мс':>8}")
+    for write_share, label in ((0.1, "read-heavy"), (0.7, "write-heavy")):
+        for threads in args.threads:
+            m = run_mix(db, db3, list(paths.values()), args.users, threads, write_share, args.mix_seconds)
+            mixes.append(m)
+            wal_max = sum(w["max_mib"] for w in m["wal"].values())
+            restarts = sum(w["restarts"] for w in m["wal"].values())
+            ckpt = sum(c["ms"] for c in m["checkpoint"].values())
+            print(f"{label:18} {threads:7} {m['ops_per_sec']:8.0f} {m['p50_ms']:7.2f} {m['p99_ms']:7.2f} "
+                  f"{m['read_p99_ms']:7.2f} {m['write_p99_ms']:7.2f}    {m['locked_errors']:6} "
+                  f"{m['slow_writes']:8} {wal_max:8.1f} {restarts:5} {ckpt:8.1f}")
+    after = sizes(paths)
+    print()
+    print_sizes("после", after)
+
+    result = {"meta": {"commit": _git_commit(), "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                       "python": platform.python_version(), "sqlite": sqlite3.sqlite_version,
+                       "machine": platform.machine(),
+                       "args": {k: v for k, v in vars(args).items() if k not in ("json", "compare", "dir")}},
+              "sizes": {"before": before, "after": after}, "plans": plans,
+              "functions": functions, "mixes": mixes}
+    os.chdir(cwd)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=1)
+        print(f"\nрезультат: {args.json}")
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            base = json.load(f)
+        if base["meta"]["args"].get("notes") != args.notes or base["meta"]["args"].get("users") != args.users:
+            print("\nвнимание: базы разного размера — сравнение условное")
+        print(f"\nсравнение с {base['meta'].get('commit') or '?'} ({base['meta'].get('time', '')}):")
+        bad = compare(result, base, args.threshold)
+        if bad:
+            print(f"\nрегрессии: {', '.join(bad)}")
+            raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+"""
+bench_host.py — память и CPU: три процесса ботов против одного host.py.
+
+Поднимает фейковый Bot API (long polling getUpdates, см. fake_bot_api.py),
+во временном каталоге запускает:
+  - separate: python main.py, python main3.py, python crud.py — три процесса;
+  - host:     python host.py main main3 crud — один процесс;
+и для каждого варианта меряет суммарный RSS и CPU (user+sys) процессов:
+в простое и под нагрузкой (--rate обновлений/с на каждого бота через getUpdates).
+
+Только Linux (читает /proc/<pid>/status и /proc/<pid>/stat).
+
+Запуск: python benchmarks/bench_host.py [--idle 10] [--load 10] [--rate 20]
+"""
+
+from __future__ import annotations
+import os
+import sys
+import time
+import argparse
+import tempfile
+import threading
+import subprocess
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+sys.path.insert(0, HERE)
+
+from fake_bot_api import FakeBotAPI
+
+TOKENS = {"main": "101:main", "main3": "103:main3", "crud": "104:crud"}
+TEXTS = {"main": "/sum 1 2 3", "main3": "/signs", "crud": "/start"}
+TICK = os.sysconf("SC_CLK_TCK")
+
+
+def rss_mb(pid: int) -> float:
+    with open(f"/proc/{pid}/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+
+def cpu_sec(pid: int) -> float:
+    with open(f"/proc/{pid}/stat") as f:
+        fields = f.read().rsplit(")", 1)[1].split()
+    return (int(fields[11]) + int(fields[12])) / TICK  # utime + stime
+
+
+def update(i: int, text: str) -> dict:
+    uid = 5000 + i % 50
+    return {"message": {"message_id": i, "date": int(time.time()), "text": text,
+                        "entities": [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}],
+                        "chat": {"id": uid, "type": "private"},
+                        "from": {"id": uid, "is_bot": False, "first_name": "bench"}}}
+
+
+def feed(api: FakeBotAPI, seconds: float, rate: float) -> None:
+    """rate обновлений/с каждому боту в течение seconds."""
+    end = time.monotonic() + seconds
+    i = 0
+    while time.monotonic() < end:
+        i += 1
+        for name, token in TOKENS.items():
+            api.push_updates(token, [update(i, TEXTS[name])])
+        time.sleep(1.0 / rate)
+
+
+def measure(procs: list, api: FakeBotAPI, warmup: float, idle: float, load: float, rate: float) -> dict:
+    time.sleep(warmup)
+    for p in procs:
+        if p.poll() is not None:
+            raise RuntimeError(f"process {p.args} exited with {p.returncode}")
+    pids = [p.pid for p in procs]
+    c0 = sum(cpu_sec(pid) for pid in pids)
+    time.sleep(idle)
+    c1 = sum(cpu_sec(pid) for pid in pids)
+    sent0 = api.calls["sendMessage"]
+    feeder = threading.Thread(target=feed, args=(api, load, rate))
+    feeder.start()
+    feeder.join()
+    time.sleep(1.0)  # догоняем хвост очереди
+    c2 = sum(cpu_sec(pid) for pid in pids)
+    return {
+        "rss_mb": sum(rss_mb(pid) for pid in pids),
+        "threads": sum(len(os.listdir(f"/proc/{pid}/task")) for pid in pids),
+        "idle_cpu_pct": (c1 - c0) / idle * 100,
+        "load_cpu_sec": c2 - c1,
+        "replies": api.calls["sendMessage"] - sent0,
+    }
+
+
+def run(mode: str, args) -> dict:
+    api = FakeBotAPI().start()
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(os.environ, TELEGRAM_API_URL=api.url, DB_PATH=os.path.join(tmp, "bot.db"),
+                   NOTES_DB_PATH=os.path.join(tmp, "notes.db"), LOG_LEVEL="WARNING")
+        env.update({f"TOKEN_{n.upper()}": t for n, t in TOKENS.items()})
+        if mode == "separate":
+            cmds = [([sys.executable, os.path.join(ROOT, f"{n}.py")], dict(env, TOKEN=t)) for n, t in TOKENS.items()]
+        else:
+            cmds = [([sys.executable, os.path.join(ROOT, "host.py"), *TOKENS], env)]
+        procs = [subprocess.Popen(cmd, cwd=tmp, env=e, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+                 for cmd, e in cmds]
+        try:
+            return measure(procs, api, args.warmup, args.idle, args.load, args.rate)
+        finally:
+            for p in procs:
+                p.terminate()
+            for p in procs:
+                p.wait()
+            api.stop()
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--warmup", type=float, default=3.0)
+    ap.add_argument("--idle", type=float, default=10.0)
+    ap.add_argument("--load", type=float, default=10.0)
+    ap.add_argument("--rate", type=float, default=20.0, help="обновлений/с на каждого бота")
+    args = ap.parse_args()
+
+    print(f"{'mode':9} {'RSS MB':>8} {'threads':>8} {'idle CPU %':>11} {'load CPU s':>11} {'replies':>8}")
+    for mode in ("separate", "host"):
+        r = run(mode, args)
+        print(f"{mode:9} {r['rss_mb']:8.1f} {r['threads']:8d} {r['idle_cpu_pct']:11.2f} "
+              f"{r['load_cpu_sec']:11.2f} {r['replies']:8d}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+"""
+bench_metrics.py — накладные расходы metrics.py на один вызов.
+
+Меряет:
+  - Histogram.labels(...).observe() — наблюдение с поиском метки;
+  - пустая функция без обёртки и с metrics.timed (как функции db.py/db3.py);
+  - реальный вызов db3.get_user (из кэша профилей) без обёртки и с ней;
+  - render() всего реестра (GET /metrics).
+
+Запуск: python benchmarks/bench_metrics.py [-n 200000]
+"""
+
+from __future__ import annotations
+import os
+import sys
+import time
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("TOKEN", "1:bench")
+os.environ["DB_PATH"] = os.path.join(tempfile.mkdtemp(), "bot.db")
+
+import metrics
+import db3
+
+
+def per_call(fn, n: int) -> float:
+    t0 = time.perf_counter()
+    for _ in range(n):
+        fn()
+    return (time.perf_counter() - t0) / n * 1e6
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("-n", type=int, default=200_000)
+    args = ap.parse_args()
+
+    hist = metrics.Histogram("bench_seconds", "bench", ("function",))
+    noop = lambda: None  # noqa: E731
+    timed_noop = metrics.timed(hist, None, "noop")(noop)
+
+    db3.init_db()
+    db3.profile(1)
+    raw_get_user = db3.get_user.__wrapped__
+
+    rows = {
+        "observe()": per_call(lambda: hist.labels("x").observe(0.003), args.n),
+        "noop": per_call(noop, args.n),
+        "noop + timed": per_call(timed_noop, args.n),
+        "db3.get_user raw": per_call(lambda: raw_get_user(1), args.n),
+        "db3.get_user timed": per_call(lambda: db3.get_user(1), args.n),
+        "render()": per_call(metrics.REGISTRY.render, max(1, args.n // 1000)),
+    }
+    print(f"{'case':20} {'us/call':>9}")
+    for name, us in rows.items():
+        print(f"{name:20} {us:9.2f}")
+
+
+if __name__ == "__main__":
+    main()
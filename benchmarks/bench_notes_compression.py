@@ -0,0 +1,87 @@
+"""
+bench_notes_compression.py — размер notes.db и задержка чтения со сжатием и без.
+
+Заполняет временную базу одинаковым набором заметок (много коротких и
+немного «вставленных документов»), затем сравнивает:
+  - размер файла;
+  - list_notes(preview=True) / list_notes() / find_notes() на пользователя.
+
+Запуск: python benchmarks/bench_notes_compression.py [--users 200] [--notes 50]
+"""
+
+from __future__ import annotations
+import os
+import sys
+import random
+import argparse
+import tempfile
+import importlib
+import statistics
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+WORDS = ("заметка купить молоко встреча проект отчёт завтра позвонить идея код "
+         "python база данных телеграм бот сервер задача список важно срочно").split()
+
+
+def _text(rnd: random.Random, words: int) -> str:
+    return " ".join(rnd.choice(WORDS) for _ in range(words))
+
+
+def _fill(db, users: int, notes: int, seed: int = 1) -> None:
+    rnd = random.Random(seed)
+    for uid in range(1, users + 1):
+        for i in range(notes):
+            big = i % 10 == 0  # каждая десятая — большой документ
+            db.add_note(uid, _text(rnd, rnd.randint(800, 3000) if big else rnd.randint(3, 30)))
+
+
+def _timeit(fn, users: int, repeat: int = 3) -> float:
+    samples = []
+    for _ in range(repeat):
+        t = time.perf_counter()
+        for uid in range(1, users + 1):
+            fn(uid)
+        samples.append((time.perf_counter() - t) / users * 1e6)
+    return statistics.median(samples)
+
+
+def run(threshold: int, train: bool, users: int, notes: int) -> dict:
+    path = os.path.join(tempfile.mkdtemp(prefix="notes-bench-"), "notes.db")
+    os.environ["NOTES_DB_PATH"] = path
+    os.environ["NOTE_COMPRESS_THRESHOLD"] = str(threshold)
+    import db
+    db = importlib.reload(db)
+    db.init_db()
+    if train:
+        _fill(db, 5, 20, seed=99)  # «история», на которой учится словарь
+        db.train_note_dict()
+    _fill(db, users, notes)
+    return {
+        "size_kb": os.path.getsize(path) // 1024,
+        "list_preview_us": _timeit(lambda u: db.list_notes(u, preview=True), users),
+        "list_full_us": _timeit(db.list_notes, users),
+        "find_us": _timeit(lambda u: db.find_notes(u, "срочно"), users),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--notes", type=int, default=50)
+    args = parser.parse_args()
+
+    cases = [
+        ("plain", 10 ** 9, False),
+        ("compressed", 1024, False),
+        ("compressed+dict", 1024, True),
+    ]
+    print(f"{'variant':<16}{'size, KB':>10}{'list preview, us':>18}{'list full, us':>15}{'find, us':>10}")
+    for name, threshold, train in cases:
+        r = run(threshold, train, args.users, args.notes)
+        print(f"{name:<16}{r['size_kb']:>10}{r['list_preview_us']:>18.0f}{r['list_full_us']:>15.0f}{r['find_us']:>10.0f}")
+
+
+if __name__ == "__main__":
+    main()
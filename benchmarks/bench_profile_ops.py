@@ -0,0 +1,154 @@
+"""
+bench_profile_ops.py — цена команд DailyZodiakBot на слое данных.
+
+Наполняет временную bot.db N пользователями и прогоняет случайные команды:
+  - legacy: как было — ensure_user + get_user / ensure_user + set_sign,
+    каждый вызов — новое подключение с тремя PRAGMA (включая journal_mode);
+  - cached: db3.profile / db3.set_sign — подключение потока, один upsert
+    с RETURNING, профиль из кэша.
+Печатает мкс на команду и число SQL-инструкций на команду (через trace callback).
+
+Запуск: python benchmarks/bench_profile_ops.py [--users 10000] [--ops 20000]
+"""
+
+from __future__ import annotations
+import os
+import sys
+import time
+import random
+import sqlite3
+import argparse
+import tempfile
+import importlib
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("TOKEN", "bench:token")  # config3 требует токен, в сеть не ходим
+
+SIGNS = ["овен", "телец", "близнецы", "рак", "лев", "дева",
+         "весы", "скорпион", "стрелец", "козерог", "водолей", "рыбы"]
+
+
+def _load_db(path: str):
+    os.environ["DB_PATH"] = path
+    import config3
+    import db3
+    importlib.reload(config3)
+    db3 = importlib.reload(db3)
+    db3.init_db()
+    return db3
+
+
+class Legacy:
+    """Путь до кэша: подключение на вызов, ensure + отдельный запрос."""
+
+    def __init__(self, path: str, db3):
+        self.path = path
+        self.db3 = db3
+        self.statements = 0
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=5.0)
+        conn.row_factory = sqlite3.Row
+        conn.set_trace_callback(self._count)
+        conn.execute("PRAGMA foreign_keys = ON")
+        conn.execute("PRAGMA journal_mode = WAL")
+        conn.execute("PRAGMA busy_timeout = 5000")
+        return conn
+
+    def _count(self, sql: str) -> None:
+        if not sql.startswith(("BEGIN", "COMMIT")):
+            self.statements += 1
+
+    def ensure_user(self, uid: int) -> None:
+        with self._connect() as conn:
+            conn.execute("INSERT OR IGNORE INTO users(user_id, notify_hour, subscribed, tz) "
+                         "VALUES (?, 9, 1, 'Europe/Moscow')", (uid,))
+
+    def get_user(self, uid: int):
+        with self._connect() as conn:
+            return conn.execute("SELECT * FROM users WHERE user_id = ?", (uid,)).fetchone()
+
+    def set_sign(self, uid: int, sign: str) -> None:
+        with self._connect() as conn:
+            row = conn.execute("UPDATE users SET sign = ? WHERE user_id = ? RETURNING *", (sign, uid)).fetchone()
+            nxt = self.db3._next_for_row(row, time.time())
+            conn.execute("UPDATE users SET next_send_at = ? WHERE user_id = ? RETURNING *",
+                         (nxt, uid)).fetchone()
+
+    def today(self, uid: int) -> None:
+        self.ensure_user(uid)
+        self.get_user(uid)
+
+    def pick_sign(self, uid: int, sign: str) -> None:
+        self.ensure_user(uid)
+        self.set_sign(uid, sign)
+
+
+class Cached:
+    def __init__(self, db3):
+        self.db3 = db3
+        self.statements = 0
+        db3._db().set_trace_callback(self._count)
+
+    def _count(self, sql: str) -> None:
+        if not sql.startswith(("BEGIN", "COMMIT")):
+            self.statements += 1
+
+    def today(self, uid: int) -> None:
+        self.db3.profile(uid)
+
+    def pick_sign(self, uid: int, sign: str) -> None:
+        self.db3.set_sign(uid, sign)
+
+
+def _fill(path: str, n: int) -> None:
+    conn = sqlite3.connect(path)
+    with conn:
+        conn.executemany(
+            "INSERT INTO users(user_id, sign, notify_hour, subscribed, tz) VALUES (?, ?, 9, 1, 'Europe/Moscow')",
+            ((uid, SIGNS[uid % 12]) for uid in range(1, n + 1))
+        )
+    conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    conn.close()
+
+
+def run(impl, users: int, ops: int, write_share: float) -> tuple[float, float, float]:
+    rnd = random.Random(1)
+    reads = writes = 0
+    t_read = t_write = 0.0
+    for _ in range(ops):
+        uid = rnd.randint(1, users)
+        if rnd.random() < write_share:
+            sign = rnd.choice(SIGNS)
+            t0 = time.perf_counter()
+            impl.pick_sign(uid, sign)
+            t_write += time.perf_counter() - t0
+            writes += 1
+        else:
+            t0 = time.perf_counter()
+            impl.today(uid)
+            t_read += time.perf_counter() - t0
+            reads += 1
+    return t_read / max(reads, 1) * 1e6, t_write / max(writes, 1) * 1e6, impl.statements / ops
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--users", type=int, default=10_000)
+    ap.add_argument("--ops", type=int, default=20_000)
+    ap.add_argument("--write-share", type=float, default=0.1, help="доля /set_sign среди команд")
+    args = ap.parse_args()
+
+    print(f"{'mode':8} {'/today us':>10} {'/set_sign us':>13} {'stmts/cmd':>10}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for mode in ("legacy", "cached"):
+            path = os.path.join(tmp, f"{mode}.db")
+            db3 = _load_db(path)
+            _fill(path, args.users)
+            impl = Legacy(path, db3) if mode == "legacy" else Cached(db3)
+            read_us, write_us, stmts = run(impl, args.users, args.ops, args.write_share)
+            print(f"{mode:8} {read_us:10.1f} {write_us:13.1f} {stmts:10.2f}")
+
+
+if __name__ == "__main__":
+    main()
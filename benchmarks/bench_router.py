@@ -0,0 +1,97 @@
+"""
+bench_router.py — цена выбора обработчика на одно обновление (main.py).
+
+Два бота с одинаковым набором обработчиков-пустышек (команды и кнопки
+как в main.py), обновления подаются в bot.process_new_updates без сети:
+  - legacy: message_handler(commands=[...]) на каждую команду
+    и lambda m: m.text == "..." на каждую кнопку + обработчик «всё остальное»;
+  - router: один обработчик telebot + Router (поиск в словаре).
+Печатает мкс на обновление для нескольких типов сообщений.
+
+Запуск: python benchmarks/bench_router.py [-n 20000]
+"""
+
+from __future__ import annotations
+import os
+import sys
+import time
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import telebot
+from telebot import types
+
+from router import Router, regex_args
+
+COMMANDS = ["start", "help", "character_name", "ask", "ask_model", "ask_random", "models", "model",
+            "characters", "character", "whoami", "sum", "max", "about", "ping", "hide", "confirm",
+            "weather", "note_add", "note_list", "note_find", "note_edit", "note_del", "note_count",
+            "note_export", "note_stats"]
+LABELS = ["Сумма", "Погода", "Добавить заметку", "show", "О боте", "about", "sum", "hide"]
+CASES = {
+    "first command": "/start",
+    "last command": "/note_stats",
+    "command + args": "/ask_model 7 какая погода в Москве?",
+    "last button": "hide",
+    "plain text": "просто текст, не команда",
+}
+
+
+def legacy_bot(hits: list) -> telebot.TeleBot:
+    bot = telebot.TeleBot("1:bench", threaded=False, validate_token=False)
+    for name in COMMANDS:
+        bot.register_message_handler(lambda m, name=name: hits.append(name), commands=[name])
+    for label in LABELS:
+        bot.register_message_handler(lambda m, label=label: hits.append(label), func=lambda m, label=label: m.text == label)
+    bot.register_message_handler(lambda m: hits.append("*"), func=lambda m: True)
+    return bot
+
+
+def router_bot(hits: list) -> telebot.TeleBot:
+    bot = telebot.TeleBot("1:bench", threaded=False, validate_token=False)
+    router = Router()
+    for name in COMMANDS:
+        parse = regex_args(r"(\d+)\s+(.*)") if name == "ask_model" else None
+        router.command(name, parse=parse)(lambda m, a, name=name: hits.append(name))
+    for label in LABELS:
+        router.text(label)(lambda m, a, label=label: hits.append(label))
+    router.default(lambda m, a: hits.append("*"))
+    router.install(bot)
+    return bot
+
+
+def make_update(i: int, text: str) -> types.Update:
+    entities = [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}] if text.startswith("/") else []
+    return types.Update.de_json({
+        "update_id": i,
+        "message": {"message_id": i, "date": 0, "text": text, "entities": entities,
+                    "chat": {"id": 1, "type": "private"},
+                    "from": {"id": 1, "is_bot": False, "first_name": "bench"}},
+    })
+
+
+def bench(bot: telebot.TeleBot, text: str, n: int) -> float:
+    updates = [make_update(i + 1, text) for i in range(n)]
+    t0 = time.perf_counter()
+    for u in updates:
+        bot.process_new_updates([u])
+    return (time.perf_counter() - t0) / n * 1e6
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("-n", type=int, default=20_000)
+    args = ap.parse_args()
+
+    hits_legacy, hits_router = [], []
+    bots = {"legacy": legacy_bot(hits_legacy), "router": router_bot(hits_router)}
+    print(f"{'case':16} {'legacy us':>10} {'router us':>10}")
+    for case, text in CASES.items():
+        row = [bench(bot, text, args.n) for bot in bots.values()]
+        print(f"{case:16} {row[0]:10.2f} {row[1]:10.2f}")
+    assert hits_legacy == hits_router, "обработчики выбраны по-разному"
+
+
+if __name__ == "__main__":
+    main()
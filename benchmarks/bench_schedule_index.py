@@ -0,0 +1,77 @@
+"""
+bench_schedule_index.py — память и скорость индекса расписания (schedule_index.HourIndex).
+
+Строит индекс на N подписчиков со случайными часами и знаками и печатает:
+  - память под массивы корзин и пиковую память по tracemalloc;
+  - время построения, выборки корзины часа и точечного обновления;
+  - для сравнения — выборку того же часа должников из bot.db диапазоном по
+    next_send_at (db3.iter_due, как планирует main3.py); --no-db — без неё.
+
+Запуск: python benchmarks/bench_schedule_index.py [--users 1000000] [--no-db]
+"""
+
+from __future__ import annotations
+import os
+import sys
+import time
+import random
+import argparse
+import tempfile
+import tracemalloc
+from datetime import date
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from schedule_index import HourIndex  # noqa: E402  (benchmarks/schedule_index.py)
+from bench_scheduler import NOW, SIGNS, _fill, _load_db  # noqa: E402
+
+
+def db_due_hour(users: int) -> tuple[int, float]:
+    """Должники одного часа из bot.db: _fill раскладывает слоты по минутам суток, час — 1/24 базы."""
+    path = os.path.join(tempfile.mkdtemp(prefix="sched-index-bench-"), "bot.db")
+    db = _load_db(path)
+    _fill(path, users)
+    t = time.perf_counter()
+    rows = sum(len(b) for b in db.iter_due(NOW - 60, page_size=1000))
+    return rows, time.perf_counter() - t
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=1_000_000)
+    parser.add_argument("--no-db", action="store_true", help="не сравнивать с выборкой из bot.db")
+    args = parser.parse_args()
+    rnd = random.Random(1)
+    rows = [(uid, SIGNS[rnd.randrange(12)], rnd.randrange(24), None) for uid in range(1, args.users + 1)]
+
+    index = HourIndex(SIGNS)
+    tracemalloc.start()
+    t = time.perf_counter()
+    index.load(rows)
+    build = time.perf_counter() - t
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    today = date.today()
+    t = time.perf_counter()
+    due = index.due(9, today)
+    due_s = time.perf_counter() - t
+
+    t = time.perf_counter()
+    for _ in range(10_000):
+        index.update(rnd.randrange(1, args.users + 1), SIGNS[rnd.randrange(12)], rnd.randrange(24), True)
+    upd_us = (time.perf_counter() - t) / 10_000 * 1e6
+
+    print(f"users:            {len(index)}")
+    print(f"index data:       {index.memory_bytes() / 2**20:.1f} MB ({index.memory_bytes() / len(index):.1f} B/user)")
+    print(f"tracemalloc peak: {peak / 2**20:.1f} MB (build)")
+    print(f"build:            {build:.2f} s")
+    print(f"due(hour):        {len(due)} users in {due_s * 1000:.1f} ms")
+    print(f"update:           {upd_us:.1f} us")
+    if not args.no_db:
+        rows, wall = db_due_hour(args.users)
+        print(f"db iter_due hour: {rows} users in {wall * 1000:.1f} ms (next_send_at, main3.py)")
+
+
+if __name__ == "__main__":
+    main()
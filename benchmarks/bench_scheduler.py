@@ -0,0 +1,135 @@
+"""
+bench_scheduler.py — проход рассылки DailyZodiakBot на больших базах.
+
+Наполняет временную bot.db N подписчиками (слоты равномерно по суткам) и
+меряет без сети (отправка — пустышка):
+  - legacy:  выборка по notify_hour + UPDATE last_sent_date на каждого (прежние
+             db3.list_due_users / mark_sent_today — теперь только здесь);
+  - batched: iter_due страницами + advance_many на страницу (диапазон по next_send_at);
+  - lookup:  выборка фиксированных 1000 должников — время не должно расти с N.
+
+Запуск: python benchmarks/bench_scheduler.py [--users 100000 1000000] [--legacy-max 100000]
+"""
+
+from __future__ import annotations
+import os
+import sys
+import time
+import sqlite3
+import argparse
+import tempfile
+import importlib
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("TOKEN", "bench:token")  # config3 требует токен, в сеть не ходим
+
+HOUR = 9
+TODAY = "2025-01-01"
+NOW = 1735714800  # 2025-01-01 09:00 MSK
+SIGNS = ["овен", "телец", "близнецы", "рак", "лев", "дева",
+         "весы", "скорпион", "стрелец", "козерог", "водолей", "рыбы"]
+
+
+def _load_db(path: str):
+    os.environ["DB_PATH"] = path
+    import config3
+    import db3
+    importlib.reload(config3)
+    db3 = importlib.reload(db3)
+    db3.init_db()
+    return db3
+
+
+def _fill(path: str, n: int) -> None:
+    """Слоты раскиданы по суткам: пользователь uid шлётся в NOW + (uid % 1440) минут - 1 час."""
+    conn = sqlite3.connect(path)
+    with conn:
+        conn.executemany(
+            "INSERT INTO users(user_id, sign, notify_hour, notify_minute, subscribed, tz, next_send_at) "
+            "VALUES (?, ?, ?, ?, 1, 'Europe/Moscow', ?)",
+            ((uid, SIGNS[uid % 12], (8 + uid % 1440 // 60) % 24, uid % 60, NOW - 3600 + uid % 1440 * 60)
+             for uid in range(1, n + 1))
+        )
+    conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")  # как в долгоживущей базе: WAL уже влит
+    conn.close()
+
+
+def _send(user_id: int, sign: str) -> None:
+    pass
+
+
+LEGACY_DUE_SQL = """
+SELECT user_id, sign
+FROM users
+WHERE subscribed = 1
+  AND sign IS NOT NULL
+  AND notify_hour = ?
+  AND (last_sent_date IS NULL OR last_sent_date <> ?)
+"""
+
+
+def list_due_users(db, today_str: str, hour: int) -> list:
+    """Прежняя выборка: подписан, час совпал, сегодня ещё не отправляли, знак задан."""
+    with db._connect() as conn:
+        return conn.execute(LEGACY_DUE_SQL, (hour, today_str)).fetchall()
+
+
+def mark_sent_today(db, user_id: int, today_str: str) -> None:
+    # next_send_at не трогает — так и было до него; в боте слот сдвигает advance_many
+    with db._connect() as conn:
+        conn.execute("UPDATE users SET last_sent_date = ? WHERE user_id = ?", (today_str, user_id))
+
+
+def run_legacy(db) -> int:
+    n = 0
+    for u in list_due_users(db, TODAY, HOUR):
+        _send(u["user_id"], u["sign"])
+        mark_sent_today(db, u["user_id"], TODAY)
+        n += 1
+    return n
+
+
+def run_batched(db, page: int = 500) -> int:
+    n = 0
+    for batch in db.iter_due(NOW, page_size=page):
+        for u in batch:
+            _send(u["user_id"], u["sign"])
+        db.advance_many(batch, NOW)
+        n += len(batch)
+    return n
+
+
+def lookup_1000(db) -> int:
+    # ровно ~1000 должников при любом N: граница диапазона подобрана под _fill
+    cutoff = NOW - 3600 + 1000 // max(1, len_per_minute[0]) * 60
+    return sum(len(b) for b in db.iter_due(cutoff, page_size=1000))
+
+
+len_per_minute = [1]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, nargs="+", default=[100_000, 1_000_000])
+    parser.add_argument("--legacy-max", type=int, default=100_000,
+                        help="не гонять legacy на базах больше этого (слишком долго)")
+    args = parser.parse_args()
+
+    print(f"{'users':>10}{'variant':>10}{'rows':>10}{'wall, s':>10}{'us/row':>10}")
+    for n in args.users:
+        len_per_minute[0] = max(1, n // 1440)
+        variants = [("batched", run_batched), ("lookup", lookup_1000)]
+        if n <= args.legacy_max:
+            variants.insert(0, ("legacy", run_legacy))
+        for name, fn in variants:
+            path = os.path.join(tempfile.mkdtemp(prefix="sched-bench-"), "bot.db")
+            db = _load_db(path)
+            _fill(path, n)
+            t = time.perf_counter()
+            rows = fn(db)
+            wall = time.perf_counter() - t
+            print(f"{n:>10}{name:>10}{rows:>10}{wall:>10.3f}{wall / max(rows, 1) * 1e6:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
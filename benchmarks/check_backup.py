@@ -0,0 +1,147 @@
+"""
+check_backup.py — бэкап (backup.py) под конкурентной записью, без сети.
+
+Временная база, несколько потоков пишут в неё, пока идёт backup_db:
+  - каждая транзакция писателя — строка в items и +1 к его счётчику в totals,
+    поэтому согласованный снимок — это count(items) == totals.n у каждого
+    писателя и номера seq без дыр;
+  - WAL: копия идёт внутри одной читающей транзакции и не перезапускается;
+  - обычный журнал (DELETE): записи перезапускают копию, после
+    BACKUP_MAX_RESTARTS она доделывается одним шагом (_TooManyRestarts) —
+    проверяется, что этот путь действительно пройден.
+Снимок распаковывается и проверяется PRAGMA integrity_check, сверкой строк и
+verify_backup (.sha256); число строк — не меньше, чем было до начала бэкапа.
+
+Запуск: python benchmarks/check_backup.py — печатает OK или падает с AssertionError.
+"""
+
+from __future__ import annotations
+import os
+import sys
+import gzip
+import shutil
+import sqlite3
+import logging
+import tempfile
+import threading
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import backup  # noqa: E402
+
+WRITERS = 4
+PREFILL = 20000  # ~2.5 МБ: копия порциями по 8 страниц идёт десятки шагов
+PAD = "x" * 100
+
+
+class _Records(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.messages: list[str] = []
+
+    def emit(self, record: logging.LogRecord) -> None:
+        self.messages.append(record.getMessage())
+
+
+def _make_db(path: str, journal: str) -> None:
+    conn = sqlite3.connect(path)
+    conn.execute(f"PRAGMA journal_mode = {journal}")
+    with conn:
+        conn.execute("CREATE TABLE items (id INTEGER PRIMARY KEY, writer INTEGER NOT NULL, "
+                     "seq INTEGER NOT NULL, pad TEXT NOT NULL)")
+        conn.execute("CREATE TABLE totals (writer INTEGER PRIMARY KEY, n INTEGER NOT NULL)")
+        conn.executemany("INSERT INTO totals VALUES (?, 0)", ((w,) for w in range(-1, WRITERS)))
+        conn.executemany("INSERT INTO items(writer, seq, pad) VALUES (-1, ?, ?)",
+                         ((i, PAD) for i in range(1, PREFILL + 1)))
+        conn.execute("UPDATE totals SET n = ? WHERE writer = -1", (PREFILL,))
+    conn.close()
+
+
+def _writer(path: str, writer: int, stop: threading.Event, written: list) -> None:
+    conn = sqlite3.connect(path, timeout=30.0)
+    seq = 0
+    while not stop.is_set():
+        seq += 1
+        with conn:
+            conn.execute("INSERT INTO items(writer, seq, pad) VALUES (?, ?, ?)", (writer, seq, PAD))
+            conn.execute("UPDATE totals SET n = n + 1 WHERE writer = ?", (writer,))
+        written[writer] = seq
+    conn.close()
+
+
+def _count(path: str) -> int:
+    conn = sqlite3.connect(path, timeout=30.0)
+    try:
+        return conn.execute("SELECT COUNT(*) FROM items").fetchone()[0]
+    finally:
+        conn.close()
+
+
+def _check_snapshot(gz_path: str, workdir: str, rows_before: int) -> int:
+    assert backup.verify_backup(gz_path), gz_path
+    raw = os.path.join(workdir, "snapshot.db")
+    with gzip.open(gz_path, "rb") as src, open(raw, "wb") as dst:
+        shutil.copyfileobj(src, dst)
+    conn = sqlite3.connect(raw)
+    try:
+        assert conn.execute("PRAGMA integrity_check").fetchone()[0] == "ok"
+        rows = dict(conn.execute("SELECT writer, COUNT(*) FROM items GROUP BY writer").fetchall())
+        for writer, n, first, last in conn.execute(
+                "SELECT t.writer, t.n, MIN(i.seq), MAX(i.seq) FROM totals t "
+                "LEFT JOIN items i ON i.writer = t.writer GROUP BY t.writer"):
+            # строка и счётчик пишутся одной транзакцией — в снимке они обязаны совпасть
+            assert rows.get(writer, 0) == n, (writer, rows.get(writer), n)
+            assert n == 0 or (first, last) == (1, n), (writer, first, last, n)
+        total = sum(rows.values())
+    finally:
+        conn.close()
+        os.remove(raw)
+    assert total >= rows_before, (total, rows_before)
+    return total
+
+
+def check(journal: str, max_restarts: int) -> tuple[int, int, list[str]]:
+    workdir = tempfile.mkdtemp(prefix=f"backup-{journal}-")
+    db_path = os.path.join(workdir, "load.db")
+    _make_db(db_path, journal)
+    rows_before = _count(db_path)
+
+    records = _Records()
+    backup.log.addHandler(records)
+    backup.BACKUP_MAX_RESTARTS = max_restarts
+    stop, written = threading.Event(), [0] * WRITERS
+    threads = [threading.Thread(target=_writer, args=(db_path, w, stop, written), daemon=True)
+               for w in range(WRITERS)]
+    for t in threads:
+        t.start()
+    try:
+        gz_path = backup.backup_db(db_path, backup_dir=os.path.join(workdir, "backups"),
+                                   keep=2, pages=8, sleep=0.005)
+    finally:
+        stop.set()
+        for t in threads:
+            t.join()
+        backup.log.removeHandler(records)
+    during = sum(written)
+    assert during > 0, "писатели не успели ничего записать во время бэкапа"
+    total = _check_snapshot(gz_path, workdir, rows_before)
+    assert total <= _count(db_path)
+    shutil.rmtree(workdir)
+    return total - rows_before, during, records.messages
+
+
+def main() -> None:
+    in_snapshot, during, messages = check("WAL", max_restarts=5)
+    assert not any("restarted" in m for m in messages), messages
+    print(f"WAL:    {during} writes during backup, {in_snapshot} of them in the snapshot")
+
+    in_snapshot, during, messages = check("DELETE", max_restarts=1)
+    assert any("restarted" in m for m in messages), "копия не упёрлась в BACKUP_MAX_RESTARTS"
+    print(f"DELETE: {during} writes during backup, {in_snapshot} of them in the snapshot, "
+          f"finished in one step after restarts")
+    print("OK")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""
+check_log_retention.py — какие файлы логов retention.rotate_logs сжимает и удаляет.
+
+Во временном каталоге — старые файлы обоих видов имён и открытые логи:
+  - <имя>_YYYY-MM-DD.log (дневные файлы прежнего логирования) и
+    <имя>_YYYY-MM-DD_HHMMSS[-n].log (ротация logsetup.py) — сжимаются в .gz;
+  - такие же .gz старше LOG_KEEP_DAYS — удаляются, свежие остаются;
+  - открытые <имя>.log (bot, main3, crud) и свежий закрытый лог не трогаются,
+    какими бы старыми ни были.
+
+Запуск: python benchmarks/check_log_retention.py — печатает OK или падает с AssertionError.
+"""
+
+from __future__ import annotations
+import os
+import sys
+import time
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("NOTES_DB_PATH", os.path.join(tempfile.mkdtemp(prefix="log-retention-"), "notes.db"))
+
+import retention  # noqa: E402
+
+DAY = 86400
+COMPRESS_DAYS, KEEP_DAYS = 3, 30
+
+OLD = 10 * DAY       # старше COMPRESS_DAYS — сжимается
+EXPIRED = 40 * DAY   # старше KEEP_DAYS — архив удаляется
+FILES = {  # имя -> возраст (с)
+    "bot.log": EXPIRED,
+    "main3.log": EXPIRED,
+    "crud.log": OLD,
+    "bot_2025-09-13.log": OLD,
+    "bot_2025-09-20.log": 0,
+    "main3_2025-10-01_000000.log": OLD,
+    "crud_2025-10-01_000000-1.log": OLD,
+    "bot_2025-08-01.log.gz": EXPIRED,
+    "bot_2025-09-01.log.gz": OLD,
+    "main3_2025-08-01_120000.log.gz": EXPIRED,
+    "notes.txt": EXPIRED,
+}
+EXPECTED = {
+    "bot.log", "main3.log", "crud.log", "notes.txt",
+    "bot_2025-09-13.log.gz", "bot_2025-09-20.log",
+    "main3_2025-10-01_000000.log.gz", "crud_2025-10-01_000000-1.log.gz",
+    "bot_2025-09-01.log.gz",
+}
+
+
+def main() -> None:
+    log_dir = tempfile.mkdtemp(prefix="logs-")
+    now = time.time()
+    for name, age in FILES.items():
+        path = os.path.join(log_dir, name)
+        with open(path, "w", encoding="utf-8") as f:
+            f.write("{}\n")
+        os.utime(path, (now - age, now - age))
+    retention.rotate_logs(log_dir, compress_days=COMPRESS_DAYS, keep_days=KEEP_DAYS)
+    left = set(os.listdir(log_dir))
+    assert left == EXPECTED, f"лишние: {sorted(left - EXPECTED)}, пропали: {sorted(EXPECTED - left)}"
+    # сжатый архив наследует возраст лога: следующий проход удалит его по KEEP_DAYS, а не раньше
+    age = now - os.path.getmtime(os.path.join(log_dir, "bot_2025-09-13.log.gz"))
+    assert OLD - 5 < age < OLD + 5, age
+    print("OK")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""
+check_outbox.py — проверка доставки из outbox DailyZodiakBot (main3.py) без сети.
+
+Временная bot.db, отправка — функция-заглушка вместо bot.send_message:
+  - две строки outbox одного пользователя в одной аренде (вчерашний повтор и
+    сегодняшняя) — обе отправлены и обе подтверждены (sent);
+  - пользователь заблокировал бота — все его строки в dead, подписка выключена;
+  - Telegram отвечает 400 (chat not found) — строка сразу в dead, без повторов;
+  - после постановки в очередь просыпаются все ждущие воркеры, а не один.
+
+Запуск: python benchmarks/check_outbox.py — печатает OK или падает с AssertionError.
+"""
+
+from __future__ import annotations
+import os
+import sys
+import time
+import tempfile
+import threading
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+WORKDIR = tempfile.mkdtemp(prefix="outbox-")
+os.environ.update({"DB_PATH": os.path.join(WORKDIR, "bot.db"), "TOKEN": "1002:check-outbox",
+                   "LOG_DIR": os.path.join(WORKDIR, "logs")})
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+os.environ.pop("TELEGRAM_API_URL", None)
+
+import main3  # noqa: E402
+db = main3.db
+
+BLOCKED = 3
+NOT_FOUND = 4
+
+
+class _Blocked(Exception):
+    error_code = 403
+
+
+class _BadRequest(Exception):
+    error_code = 400
+
+
+sent: list[tuple[int, str]] = []
+lock = threading.Lock()
+
+
+def fake_send(chat_id, text, **kwargs):
+    if chat_id == BLOCKED:
+        raise _Blocked("Forbidden: bot was blocked by the user")
+    if chat_id == NOT_FOUND:
+        raise _BadRequest("Bad Request: chat not found")
+    time.sleep(fake_send.delay)
+    with lock:
+        sent.append((chat_id, text))
+
+
+fake_send.delay = 0.0
+
+
+def _put(rows: list[tuple[int, str]], now: int) -> None:
+    conn = db._connect()
+    with conn:
+        conn.executemany("INSERT OR IGNORE INTO users(user_id, sign) VALUES (?, 'лев')", ((u,) for u, _ in rows))
+        conn.executemany("INSERT INTO outbox(user_id, sign, send_date, available_at) VALUES (?, 'лев', ?, ?)",
+                         ((u, day, now) for u, day in rows))
+
+
+def _statuses() -> dict:
+    conn = db._connect()
+    return {(r["user_id"], r["send_date"]): r["status"]
+            for r in conn.execute("SELECT user_id, send_date, status FROM outbox")}
+
+
+def check_same_user_in_one_lease() -> None:
+    now = int(main3._now_ts())
+    _put([(1, "2025-01-01"), (1, "2025-01-02"), (2, "2025-01-02"), (BLOCKED, "2025-01-01"),
+          (BLOCKED, "2025-01-02"), (NOT_FOUND, "2025-01-02")], now)
+    assert main3.deliver_batch("check") == 6
+    st = _statuses()
+    assert st[(1, "2025-01-01")] == st[(1, "2025-01-02")] == "sent", st
+    assert st[(2, "2025-01-02")] == "sent", st
+    assert st[(BLOCKED, "2025-01-01")] == st[(BLOCKED, "2025-01-02")] == "dead", st
+    assert st[(NOT_FOUND, "2025-01-02")] == "dead", st  # не pending на повтор
+    assert sorted(u for u, _ in sent) == [1, 1, 2], sent
+    assert not db.get_user(BLOCKED)["subscribed"]
+    assert db.get_user(NOT_FOUND)["subscribed"]
+
+
+def check_all_workers_wake() -> None:
+    main3.SEND_BATCH = 1     # по строке на аренду: три строки — работа для трёх воркеров
+    main3.OUTBOX_POLL = 30   # без пробуждения воркеры проспали бы дольше проверки
+    fake_send.delay = 0.5
+    for i in range(3):
+        threading.Thread(target=main3.outbox_worker, args=(f"check-{i}",), daemon=True).start()
+    time.sleep(0.5)          # все три разобрали пустую очередь и ждут
+    sent.clear()
+    _put([(10, "2025-01-03"), (11, "2025-01-03"), (12, "2025-01-03")], int(main3._now_ts()))
+    t0 = time.perf_counter()
+    main3._notify_outbox()
+    while len(sent) < 3 and time.perf_counter() - t0 < 5:
+        time.sleep(0.01)
+    elapsed = time.perf_counter() - t0
+    assert len(sent) == 3, sent
+    # один проснувшийся воркер отправил бы три строки подряд: >= 1.5 с
+    assert elapsed < 1.2, f"строки отправлены за {elapsed:.2f} с — проснулись не все воркеры"
+
+
+def main() -> None:
+    main3.broadcaster.send = fake_send
+    main3.broadcaster.chats.interval = 0.0
+    check_same_user_in_one_lease()
+    check_all_workers_wake()
+    print("OK")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,226 @@
+"""
+fake_bot_api.py — локальный фейковый Telegram Bot API для тестов рассылки.
+
+Понимает любые методы вида /bot<token>/<method> (GET и POST, form/json/multipart),
+на sendMessage отвечает сообщением, на остальные — ok/true. Умеет
+изображать задержку сети, лимит Telegram (429 с retry_after), случайные
+5xx и заблокировавших бота пользователей (403).
+
+getUpdates — настоящий long polling: отдаёт обновления, положенные через
+push_updates(token, [...]), или ждёт их до timeout (как Telegram).
+
+Использование:
+  python benchmarks/fake_bot_api.py --port 8081 --rate 30 --latency 0.05
+  TELEGRAM_API_URL=http://127.0.0.1:8081/bot{0}/{1} python main3.py
+
+или из кода: api = FakeBotAPI(rate=30).start(); ...; api.stop(); api.calls
+
+Без сети, в том же процессе (replay-бенчмарк):
+  apihelper.CUSTOM_REQUEST_SENDER = FakeBotAPI().request_sender()
+"""
+
+from __future__ import annotations
+import json
+import time
+import random
+import argparse
+import threading
+from email import policy
+from email.parser import BytesParser
+from collections import Counter, defaultdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+
+def _multipart(ctype: str, body: bytes) -> dict:
+    """Поля multipart/form-data: текст — строкой, файл — (имя файла, байты)."""
+    msg = BytesParser(policy=policy.HTTP).parsebytes(b"Content-Type: " + ctype.encode() + b"\r\n\r\n" + body)
+    fields = {}
+    for part in msg.iter_parts():
+        name = part.get_param("name", header="content-disposition")
+        data = part.get_payload(decode=True) or b""
+        filename = part.get_filename()
+        fields[name] = (filename, data) if filename else data.decode("utf-8")
+    return fields
+
+
+class FakeBotAPI:
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, latency: float = 0.0,
+                 rate: float = 0.0, error_rate: float = 0.0, blocked: set | None = None):
+        self.latency = latency
+        self.rate = rate                # 0 — без лимита
+        self.error_rate = error_rate    # доля ответов 502
+        self.blocked = set(blocked or ())
+        self.calls = Counter()          # method -> число успешных вызовов
+        self.sent = []                  # (chat_id, text) для sendMessage
+        self.documents = []             # (chat_id, имя файла, содержимое) для sendDocument
+        self.lock = threading.Lock()
+        self._window = []               # времена принятых sendMessage за последнюю секунду
+        self._msg_id = 0
+        self._updates = defaultdict(list)   # token -> ожидающие обновления
+        self._update_id = defaultdict(int)
+        self._has_updates = threading.Condition(self.lock)
+        self.server = ThreadingHTTPServer((host, port), self._handler())
+        self.server.daemon_threads = True
+
+    @property
+    def url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}/bot{{0}}/{{1}}"
+
+    def start(self) -> "FakeBotAPI":
+        threading.Thread(target=self.server.serve_forever, name="fake-bot-api", daemon=True).start()
+        return self
+
+    def stop(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+    def request_sender(self):
+        """Функция для apihelper.CUSTOM_REQUEST_SENDER: запросы telebot идут в handle() без HTTP."""
+        api = self
+
+        class _Response:
+            __slots__ = ("status_code", "_payload")
+
+            def __init__(self, status: int, payload: dict):
+                self.status_code = status
+                self._payload = payload
+
+            def json(self) -> dict:
+                return self._payload
+
+            @property
+            def text(self) -> str:
+                return json.dumps(self._payload)
+
+        def send(method, url, params=None, files=None, **kwargs):
+            prefix, _, api_method = url.rpartition("/")
+            fields = dict(params or {})
+            for name, value in (files or {}).items():  # (имя файла, файл/байты) как у requests
+                if isinstance(value, tuple):
+                    filename, data = value[0], value[1]
+                else:
+                    filename, data = getattr(value, "name", name), value
+                fields[name] = (filename, data.read() if hasattr(data, "read") else data)
+            return _Response(*api.handle(api_method, fields, prefix.rpartition("/")[2][3:]))
+
+        return send
+
+    def push_updates(self, token: str, updates: list) -> None:
+        """Кладёт обновления (dict без update_id) в очередь getUpdates бота token."""
+        with self._has_updates:
+            for u in updates:
+                self._update_id[token] += 1
+                self._updates[token].append(dict(u, update_id=self._update_id[token]))
+            self._has_updates.notify_all()
+
+    def _get_updates(self, token: str, params: dict) -> list:
+        offset = int(params.get("offset") or 0)
+        limit = int(params.get("limit") or 100)
+        deadline = time.monotonic() + min(float(params.get("timeout") or 0), 25.0)
+        with self._has_updates:
+            while True:
+                pending = [u for u in self._updates[token] if u["update_id"] >= offset]
+                self._updates[token] = pending  # подтверждённые (< offset) забываем
+                left = deadline - time.monotonic()
+                if pending or left <= 0:
+                    return pending[:limit]
+                self._has_updates.wait(left)
+
+    # ---------- логика ответов ----------
+    def _throttled(self) -> bool:
+        if not self.rate:
+            return False
+        now = time.monotonic()
+        with self.lock:
+            self._window = [t for t in self._window if now - t < 1.0]
+            if len(self._window) >= self.rate:
+                return True
+            self._window.append(now)
+        return False
+
+    def handle(self, method: str, params: dict, token: str = "") -> tuple[int, dict]:
+        if self.latency:
+            time.sleep(self.latency)
+        if self.error_rate and random.random() < self.error_rate:
+            return 502, {"ok": False, "error_code": 502, "description": "Bad Gateway"}
+        chat_id = params.get("chat_id")
+        if method == "sendMessage":
+            if chat_id is not None and int(chat_id) in self.blocked:
+                return 403, {"ok": False, "error_code": 403, "description": "Forbidden: bot was blocked by the user"}
+            if self._throttled():
+                return 429, {"ok": False, "error_code": 429, "description": "Too Many Requests: retry after 1",
+                             "parameters": {"retry_after": 1}}
+        with self.lock:
+            self.calls[method] += 1
+            self._msg_id += 1
+            msg_id = self._msg_id
+            if method == "sendMessage":
+                self.sent.append((int(chat_id), params.get("text")))
+            elif method == "sendDocument":
+                self.documents.append((int(chat_id), *params.get("document", ("", b""))))
+        if method in ("sendMessage", "sendDocument", "editMessageText"):
+            chat = {"id": int(chat_id or 0), "type": "private"}
+            return 200, {"ok": True, "result": {"message_id": msg_id, "date": int(time.time()),
+                                                "chat": chat, "text": params.get("text")}}
+        if method == "getMe":
+            return 200, {"ok": True, "result": {"id": 1, "is_bot": True, "first_name": "Fake", "username": "fake_bot"}}
+        if method == "getUpdates":
+            return 200, {"ok": True, "result": self._get_updates(token, params)}
+        return 200, {"ok": True, "result": True}
+
+    def _handler(self):
+        api = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def _reply(self) -> None:
+                url = urlparse(self.path)
+                prefix, _, method = url.path.rpartition("/")
+                token = prefix.rpartition("/")[2][3:]  # /bot<token>/<method>
+                params = {k: v[0] for k, v in parse_qs(url.query).items()}
+                length = int(self.headers.get("Content-Length") or 0)
+                if length:
+                    body = self.rfile.read(length)
+                    ctype = self.headers.get("Content-Type") or ""
+                    if "json" in ctype:
+                        params.update(json.loads(body))
+                    elif ctype.startswith("multipart/"):
+                        params.update(_multipart(ctype, body))
+                    else:
+                        params.update({k: v[0] for k, v in parse_qs(body.decode("utf-8")).items()})
+                status, payload = api.handle(method, params, token)
+                data = json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                try:
+                    self.wfile.write(data)
+                except (BrokenPipeError, ConnectionResetError):
+                    pass  # клиент ушёл, не дождавшись long poll getUpdates
+
+            do_GET = _reply
+            do_POST = _reply
+
+            def log_message(self, *args) -> None:
+                pass
+
+        return Handler
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--rate", type=float, default=30)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    args = parser.parse_args()
+    api = FakeBotAPI(port=args.port, latency=args.latency, rate=args.rate, error_rate=args.error_rate).start()
+    print(f"Fake Bot API: {api.url}")
+    try:
+        while True:
+            time.sleep(5)
+            print(dict(api.calls))
+    except KeyboardInterrupt:
+        api.stop()
@@ -0,0 +1,259 @@
+"""
+fake_openrouter.py — локальный симулятор OpenRouter для нагрузочных проверок /ask.
+
+Реализует POST /api/v1/chat/completions (и GET /api/v1/models) в формате
+OpenRouter/OpenAI:
+  - ответ целиком или потоком ("stream": true — Server-Sent Events: чанки
+    choices[].delta, последний — с finish_reason и usage, затем data: [DONE];
+    в начале, как у OpenRouter, комментарий ": OPENROUTER PROCESSING");
+  - usage: prompt_tokens / completion_tokens / total_tokens (4 символа ≈ токен)
+    и cost — по цене price профиля, как при "usage": {"include": true};
+  - ошибки: 429 при превышении rpm модели и доля error_rate ответов 502/503 —
+    с заголовком Retry-After и телом {"error": {"code", "message"}}; 401 без ключа.
+
+Поведение задаётся по ключу модели (профиль "*" — для всех остальных):
+  latency      — секунд до первого токена (± jitter доля случайного разброса);
+  tps          — токенов ответа в секунду (0 — сразу весь ответ);
+  tokens       — длина ответа в токенах (не больше max_tokens запроса);
+  error_rate   — доля ответов 502/503;
+  rpm          — лимит запросов в минуту на модель (0 — без лимита);
+  retry_after  — Retry-After в секундах для 503;
+  price        — USD за миллион токенов (вход и выход), для usage.cost.
+
+Использование:
+  python benchmarks/fake_openrouter.py --port 8082 --model '*:latency=0.8,tps=40' \\
+      --model 'openai/gpt-4:latency=3,error_rate=0.1,rpm=20'
+  OPENROUTER_API_URL=http://127.0.0.1:8082/api/v1/chat/completions python main.py
+
+или из кода: llm = FakeOpenRouter({"*": {"latency": 0.2}}).start(); ...; llm.stop(); llm.calls
+Профили можно менять на ходу: llm.profiles["openai/gpt-4"] = {...}.
+"""
+
+from __future__ import annotations
+import json
+import time
+import random
+import argparse
+import threading
+from collections import Counter, defaultdict, deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_PROFILE = {"latency": 0.0, "jitter": 0.2, "tps": 0.0, "tokens": 60,
+                   "error_rate": 0.0, "rpm": 0, "retry_after": 1, "price": 0.0}
+WORDS = ("да", "конечно", "это", "зависит", "от", "контекста", "но", "в", "целом", "можно", "сказать",
+         "что", "ответ", "такой", "и", "ещё", "немного", "подробностей")
+
+
+def _tokens(text: str) -> int:
+    return max(1, len(text) // 4)
+
+
+def parse_profile(spec: str) -> tuple[str, dict]:
+    """'openai/gpt-4:latency=3,error_rate=0.1' -> ('openai/gpt-4', {...}). Ключ — до последнего ':'."""
+    model, _, params = spec.rpartition(":") if "=" in spec else (spec, "", "")
+    profile = {}
+    for item in filter(None, params.split(",")):
+        key, _, value = item.partition("=")
+        if key not in DEFAULT_PROFILE:
+            raise ValueError(f"неизвестный параметр профиля: {key}")
+        profile[key] = float(value)
+    return model or "*", profile
+
+
+class FakeOpenRouter:
+    def __init__(self, profiles: dict | None = None, host: str = "127.0.0.1", port: int = 0):
+        self.profiles = {"*": {}}
+        self.profiles.update(profiles or {})
+        self.calls = Counter()                  # (model, status) -> число ответов
+        self.usage = defaultdict(Counter)       # model -> prompt_tokens / completion_tokens
+        self.lock = threading.Lock()
+        self._window = defaultdict(deque)       # model -> времена принятых запросов за минуту
+        self._id = 0
+        self.server = ThreadingHTTPServer((host, port), self._handler())
+        self.server.daemon_threads = True
+
+    @property
+    def url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}/api/v1/chat/completions"
+
+    def start(self) -> "FakeOpenRouter":
+        threading.Thread(target=self.server.serve_forever, name="fake-openrouter", daemon=True).start()
+        return self
+
+    def stop(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+    def profile(self, model: str) -> dict:
+        return {**DEFAULT_PROFILE, **self.profiles.get("*", {}), **self.profiles.get(model, {})}
+
+    # ---------- логика ответов ----------
+    def _rate_limited(self, model: str, rpm: float) -> float:
+        """0 — запрос принят, иначе через сколько секунд освободится место в минутном окне."""
+        if not rpm:
+            return 0.0
+        now = time.monotonic()
+        with self.lock:
+            window = self._window[model]
+            while window and now - window[0] >= 60:
+                window.popleft()
+            if len(window) >= rpm:
+                return 60 - (now - window[0])
+            window.append(now)
+        return 0.0
+
+    def _count(self, model: str, status: int, usage: dict | None = None) -> None:
+        with self.lock:
+            self.calls[(model, status)] += 1
+            if usage:
+                self.usage[model].update({k: usage[k] for k in ("prompt_tokens", "completion_tokens")})
+
+    def check(self, payload: dict) -> tuple[int, dict, dict]:
+        """До генерации: (статус, тело ошибки, заголовки); статус 200 — можно отвечать."""
+        model = payload.get("model") or ""
+        if not model or not payload.get("messages"):
+            return 400, {"error": {"code": 400, "message": "model and messages are required"}}, {}
+        p = self.profile(model)
+        wait = self._rate_limited(model, p["rpm"])
+        if wait:
+            self._count(model, 429)
+            return 429, {"error": {"code": 429, "message": f"Rate limit exceeded: {model}"}}, \
+                {"Retry-After": str(max(1, round(wait)))}
+        if p["error_rate"] and random.random() < p["error_rate"]:
+            status = random.choice((502, 503))
+            self._count(model, status)
+            headers = {"Retry-After": str(int(p["retry_after"]))} if status == 503 else {}
+            return status, {"error": {"code": status, "message": "Provider returned error"}}, headers
+        return 200, {}, {}
+
+    def generate(self, payload: dict):
+        """Ответ по кусочкам: (id, модель, usage, итератор (текст, пауза перед ним))."""
+        model = payload["model"]
+        p = self.profile(model)
+        messages = payload.get("messages") or []
+        prompt = "".join(str(m.get("content") or "") for m in messages)
+        n = max(1, min(int(p["tokens"]), int(payload.get("max_tokens") or p["tokens"])))
+        with self.lock:
+            self._id += 1
+            gen_id = f"gen-{self._id}"
+        words = [random.choice(WORDS) for _ in range(n)]
+        total = _tokens(prompt) + n
+        usage = {"prompt_tokens": _tokens(prompt), "completion_tokens": n, "total_tokens": total,
+                 "cost": round(total * p["price"] / 1e6, 8)}
+        first = max(0.0, p["latency"] * (1 + random.uniform(-p["jitter"], p["jitter"])))
+        step = 1 / p["tps"] if p["tps"] else 0.0
+
+        def pieces():
+            for i, w in enumerate(words):
+                yield (w if i == 0 else " " + w), (first if i == 0 else step)
+        return gen_id, model, usage, pieces()
+
+    def _handler(self):
+        api = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"  # keep-alive, как у настоящего API
+
+            def _json(self, status: int, body: dict, headers: dict | None = None) -> None:
+                data = json.dumps(body, ensure_ascii=False).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                for k, v in (headers or {}).items():
+                    self.send_header(k, v)
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_GET(self) -> None:
+                if self.path.rstrip("/").endswith("/models"):
+                    models = [m for m in api.profiles if m != "*"]
+                    self._json(200, {"data": [{"id": m, "name": m} for m in models]})
+                else:
+                    self._json(404, {"error": {"code": 404, "message": "Not Found"}})
+
+            def do_POST(self) -> None:
+                body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+                if not self.path.rstrip("/").endswith("/chat/completions"):
+                    self._json(404, {"error": {"code": 404, "message": "Not Found"}})
+                    return
+                if not (self.headers.get("Authorization") or "").removeprefix("Bearer ").strip():
+                    self._json(401, {"error": {"code": 401, "message": "No auth credentials found"}})
+                    return
+                try:
+                    payload = json.loads(body or b"{}")
+                except ValueError:
+                    self._json(400, {"error": {"code": 400, "message": "invalid JSON"}})
+                    return
+                status, error, headers = api.check(payload)
+                if status != 200:
+                    self._json(status, error, headers)
+                    return
+                gen_id, model, usage, pieces = api.generate(payload)
+                try:
+                    if payload.get("stream"):
+                        self._stream(gen_id, model, usage, pieces)
+                    else:
+                        text = ""
+                        for piece, pause in pieces:
+                            time.sleep(pause)
+                            text += piece
+                        self._json(200, {"id": gen_id, "object": "chat.completion", "created": int(time.time()),
+                                         "model": model, "usage": usage,
+                                         "choices": [{"index": 0, "finish_reason": "stop",
+                                                      "message": {"role": "assistant", "content": text}}]})
+                except (BrokenPipeError, ConnectionResetError):
+                    return  # клиент не дождался (таймаут) — ответ в статистику не идёт
+                api._count(model, 200, usage)
+
+            def _stream(self, gen_id: str, model: str, usage: dict, pieces) -> None:
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Cache-Control", "no-cache")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+
+                def send(line: str) -> None:
+                    data = line.encode("utf-8")
+                    self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+                    self.wfile.flush()
+
+                def chunk(delta: dict, finish: str | None = None, **extra) -> str:
+                    body = {"id": gen_id, "object": "chat.completion.chunk", "created": int(time.time()),
+                            "model": model, "choices": [{"index": 0, "delta": delta, "finish_reason": finish}]}
+                    return "data: " + json.dumps({**body, **extra}, ensure_ascii=False) + "\n\n"
+
+                send(": OPENROUTER PROCESSING\n\n")
+                for i, (piece, pause) in enumerate(pieces):
+                    time.sleep(pause)
+                    send(chunk({"role": "assistant", "content": piece} if i == 0 else {"content": piece}))
+                send(chunk({}, "stop", usage=usage))
+                send("data: [DONE]\n\n")
+                self.wfile.write(b"0\r\n\r\n")
+
+            def log_message(self, *args) -> None:
+                pass
+
+        return Handler
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, default=8082)
+    parser.add_argument("--model", action="append", default=[], metavar="KEY:param=v,...",
+                        help="профиль модели, можно несколько ('*' — по умолчанию)")
+    parser.add_argument("--config", help="JSON {ключ модели: {параметр: значение}}")
+    args = parser.parse_args()
+    profiles = {"*": {"latency": 0.5, "tps": 50}}
+    if args.config:
+        with open(args.config, encoding="utf-8") as f:
+            profiles.update(json.load(f))
+    profiles.update(parse_profile(spec) for spec in args.model)
+    llm = FakeOpenRouter(profiles, port=args.port).start()
+    print(f"Fake OpenRouter: {llm.url}")
+    try:
+        while True:
+            time.sleep(5)
+            print({f"{m} {s}": n for (m, s), n in sorted(llm.calls.items())})
+    except KeyboardInterrupt:
+        llm.stop()
@@ -0,0 +1,186 @@
+"""
+load_llm.py — нагрузка на /ask, /ask_model и /ask_random main.py через симулятор OpenRouter.
+
+Настоящие обработчики main.py в том же процессе, как в продакшене: обновления
+раскладываются по полосам (lanes.py, BOT_LANES потоков), клиент OpenRouter
+ходит по HTTP в benchmarks/fake_openrouter.py (OPENROUTER_API_URL), Bot API —
+FakeBotAPI без сети (как в replay_bots.py). Запросы приходят с постоянной
+частотой --rate (открытая нагрузка: не ждут ответов на предыдущие), каждый
+из своего чата; время запроса — от подачи обновления до ответа бота в чат.
+
+Печатает достигнутую пропускную способность, p50/p95/p99 по командам,
+ответы с ошибкой (429, 5xx, таймауты), ответы симулятора по моделям и
+статусам и максимальное ожидание в очереди полосы — при нехватке полос
+именно оно растёт первым.
+
+Пример: 20 запросов/с минуту, модель по умолчанию отвечает ~1.5 с,
+gpt-4 медленнее и с лимитом 30 запросов в минуту:
+  python benchmarks/load_llm.py --rate 20 --duration 60 --model '*:latency=0.5,tps=60' \\
+      --model 'openai/gpt-4:latency=2,rpm=30,error_rate=0.05'
+
+--url — внешний симулятор (или другой совместимый сервер) вместо встроенного.
+"""
+
+from __future__ import annotations
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import threading
+from collections import Counter, defaultdict
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from replay_bots import CWD, Replay, _message, _pct  # готовит окружение: временный каталог, токены, фейки
+from fake_openrouter import FakeOpenRouter, parse_profile
+
+from telebot import apihelper, types
+
+QUESTIONS = ["что такое SQLite?", "как работает WAL?", "посоветуй книгу", "объясни рекурсию",
+             "чем поток отличается от процесса?", "напиши хайку про осень"]
+
+
+def parse_mix(spec: str) -> dict:
+    mix = {}
+    for item in filter(None, spec.split(",")):
+        name, _, weight = item.partition("=")
+        mix[name.strip()] = float(weight or 1)
+    return mix
+
+
+class _External:
+    """Внешний сервер по --url: у Replay тот же интерфейс, что у FakeOpenRouter, статистики нет."""
+
+    def __init__(self, url: str):
+        self.url = url
+        self.calls = Counter()
+        self.usage = {}
+
+    def start(self) -> "_External":
+        return self
+
+    def stop(self) -> None:
+        pass
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--rate", type=float, default=10.0, help="запросов в секунду")
+    ap.add_argument("--duration", type=float, default=30.0, help="секунд подачи запросов")
+    ap.add_argument("--mix", default="ask=6,ask_model=2,ask_random=2", help="доли команд")
+    ap.add_argument("--model", action="append", default=[], metavar="KEY:param=v,...",
+                    help="профиль модели симулятора (см. fake_openrouter.py), можно несколько")
+    ap.add_argument("--config", help="JSON с профилями моделей")
+    ap.add_argument("--url", help="внешний симулятор вместо встроенного")
+    ap.add_argument("--lanes", type=int, default=int(os.getenv("BOT_LANES", "8")))
+    ap.add_argument("--timeout", type=float, default=60.0, help="сколько ждать ответов после подачи, с")
+    ap.add_argument("--json", help="сохранить результат в файл")
+    args = ap.parse_args()
+    if args.json:
+        args.json = os.path.join(CWD, args.json)
+
+    if args.url:
+        llm = _External(args.url)
+    else:
+        profiles = {"*": {"latency": 0.5, "tps": 60}}
+        if args.config:
+            with open(os.path.join(CWD, args.config), encoding="utf-8") as f:
+                profiles.update(json.load(f))
+        profiles.update(parse_profile(spec) for spec in args.model)
+        llm = FakeOpenRouter(profiles)
+    mix = parse_mix(args.mix)
+
+    replay = Replay(["main"], llm)
+    from lanes import LanePool, attach
+    bot = replay.modules["main"].bot
+    pool = LanePool(args.lanes, name="load-lane")
+    attach(bot, pool)
+
+    pending: dict[int, tuple[float, str]] = {}  # chat_id -> (время подачи, команда)
+    done: list[tuple[str, float, str | None]] = []  # (команда, секунды, текст ошибки или None)
+    lock = threading.Lock()
+    all_done = threading.Event()
+    submitting_over = threading.Event()
+    sender = apihelper.CUSTOM_REQUEST_SENDER
+
+    def watch(method, url, params=None, files=None, **kwargs):
+        result = sender(method, url, params=params, files=files, **kwargs)
+        if url.endswith("/sendMessage") and params:
+            with lock:
+                sent = pending.pop(int(params.get("chat_id") or 0), None)
+                if sent is not None:
+                    text = str(params.get("text") or "")
+                    done.append((sent[1], time.perf_counter() - sent[0], text[:60] if text.startswith("❌") else None))
+                    if not pending and submitting_over.is_set():
+                        all_done.set()
+        return result
+
+    apihelper.CUSTOM_REQUEST_SENDER = watch
+
+    rng = random.Random(1)
+    names, weights = list(mix), list(mix.values())
+    total = int(args.rate * args.duration)
+    print(f"{total} запросов, {args.rate:g}/с, полос {args.lanes}, OpenRouter: {llm.url}")
+    t0 = time.perf_counter()
+    for i in range(total):
+        delay = t0 + i / args.rate - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        chat = 200_000 + i
+        cmd = rng.choices(names, weights)[0]
+        question = rng.choice(QUESTIONS)
+        text = f"/{cmd} {rng.randint(1, 10)} {question}" if cmd == "ask_model" else f"/{cmd} {question}"
+        update = types.Update.de_json({"update_id": i + 1, "message": _message(chat, i + 1, text)})
+        with lock:
+            pending[chat] = (time.perf_counter(), f"/{cmd}")
+        bot.process_new_updates([update])  # полоса чата; при полной очереди ждёт, как polling
+    submit_wall = time.perf_counter() - t0
+    submitting_over.set()
+    with lock:
+        if not pending:
+            all_done.set()
+    all_done.wait(args.timeout)
+    wall = time.perf_counter() - t0
+    lane_wait = max(s["wait_max"] for s in pool.stats())
+    with lock:
+        unfinished = len(pending)
+        rows = list(done)
+    replay.stop()
+
+    per_cmd = defaultdict(list)
+    errors = Counter()
+    for cmd, dt, err in rows:
+        per_cmd[cmd].append((dt, err))
+        if err:
+            errors[err] += 1
+    result = {"rate": args.rate, "duration": args.duration, "lanes": args.lanes, "submitted": total,
+              "submit_seconds": submit_wall, "completed": len(rows), "unfinished": unfinished,
+              "throughput": len(rows) / wall if wall else 0.0, "lane_wait_max_s": lane_wait, "commands": {}}
+    print(f"\nподано за {submit_wall:.1f} с, ответов {len(rows)} за {wall:.1f} с "
+          f"({result['throughput']:.1f}/с), без ответа {unfinished}, макс. ожидание в полосе {lane_wait:.2f} с")
+    print(f"{'команда':12} {'n':>6} {'ошибок':>6} {'p50':>7} {'p95':>7} {'p99':>7} {'max':>7} с")
+    for cmd, items in sorted(per_cmd.items()):
+        times = sorted(dt for dt, _ in items)
+        c = {"count": len(items), "errors": sum(1 for _, e in items if e),
+             "p50_s": _pct(times, .5), "p95_s": _pct(times, .95), "p99_s": _pct(times, .99), "max_s": times[-1]}
+        result["commands"][cmd] = c
+        print(f"{cmd:12} {c['count']:6} {c['errors']:6} {c['p50_s']:7.2f} {c['p95_s']:7.2f} "
+              f"{c['p99_s']:7.2f} {c['max_s']:7.2f}")
+    if errors:
+        print("\nответы с ошибкой:")
+        for text, n in errors.most_common(10):
+            print(f"  {n:6}  {text}")
+    if llm.calls:
+        print("\nсимулятор (модель, статус): " + ", ".join(f"{m} {s}: {n}" for (m, s), n in sorted(llm.calls.items())))
+        result["simulator"] = {f"{m} {s}": n for (m, s), n in llm.calls.items()}
+        result["usage"] = {m: dict(u) for m, u in llm.usage.items()}
+    result["errors"] = dict(errors)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=1)
+        print(f"\nрезультат: {args.json}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""
+post_updates.py — нагрузочная проверка webhook: POST обновлений Telegram.
+
+Обновления берутся из файла JSONL (по одному Update на строку — записанные
+или подготовленные вручную) либо генерируются: сообщение --text от --chats
+разных пользователей. update_id проставляется заново, чтобы не было дублей.
+
+Печатает пропускную способность, p50/p99 времени ответа и коды ответов
+(503 — очередь сервера полна, сработал backpressure).
+
+Пример (бот в режиме webhook, Bot API — benchmarks/fake_bot_api.py):
+  BOT_MODE=webhook WEBHOOK_SECRET=s TELEGRAM_API_URL=http://127.0.0.1:8081/bot{0}/{1} python main3.py
+  python benchmarks/post_updates.py --url http://127.0.0.1:8080/telegram --secret s -n 5000 --text /today
+"""
+
+from __future__ import annotations
+import json
+import time
+import argparse
+import itertools
+import threading
+import http.client
+from collections import Counter
+from urllib.parse import urlsplit
+
+
+def synthetic(n: int, text: str, chats: int):
+    for i in range(n):
+        uid = 1000 + i % chats
+        entities = [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}] if text.startswith("/") else []
+        yield {
+            "message": {
+                "message_id": i + 1, "date": int(time.time()), "text": text, "entities": entities,
+                "chat": {"id": uid, "type": "private"},
+                "from": {"id": uid, "is_bot": False, "first_name": f"user{uid}"},
+            }
+        }
+
+
+def from_file(path: str, n: int | None):
+    with open(path, encoding="utf-8") as f:
+        updates = [json.loads(line) for line in f if line.strip()]
+    return updates if n is None else list(itertools.islice(itertools.cycle(updates), n))
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--url", default="http://127.0.0.1:8080/telegram")
+    ap.add_argument("--secret", default="")
+    ap.add_argument("--file", help="JSONL с обновлениями")
+    ap.add_argument("-n", type=int, default=None, help="сколько обновлений отправить")
+    ap.add_argument("--text", default="/today")
+    ap.add_argument("--chats", type=int, default=100)
+    ap.add_argument("-c", "--concurrency", type=int, default=16)
+    args = ap.parse_args()
+
+    updates = from_file(args.file, args.n) if args.file else list(synthetic(args.n or 1000, args.text, args.chats))
+    bodies = [json.dumps(dict(u, update_id=i + 1)).encode() for i, u in enumerate(updates)]
+    url = urlsplit(args.url)
+    headers = {"Content-Type": "application/json"}
+    if args.secret:
+        headers["X-Telegram-Bot-Api-Secret-Token"] = args.secret
+
+    it = iter(bodies)
+    lock = threading.Lock()
+    codes: Counter = Counter()
+    latencies: list[float] = []
+
+    def client() -> None:
+        conn = http.client.HTTPConnection(url.hostname, url.port or 80, timeout=30)
+        while True:
+            with lock:
+                body = next(it, None)
+            if body is None:
+                break
+            t0 = time.perf_counter()
+            conn.request("POST", url.path or "/", body=body, headers=headers)
+            resp = conn.getresponse()
+            resp.read()
+            dt = time.perf_counter() - t0
+            with lock:
+                codes[resp.status] += 1
+                latencies.append(dt)
+        conn.close()
+
+    t0 = time.perf_counter()
+    threads = [threading.Thread(target=client) for _ in range(args.concurrency)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - t0
+
+    latencies.sort()
+    pct = lambda q: latencies[min(len(latencies) - 1, int(q * len(latencies)))] * 1000
+    print(f"sent {len(bodies)} in {elapsed:.2f} s: {len(bodies) / elapsed:.0f} req/s")
+    print(f"latency p50 {pct(0.5):.2f} ms, p99 {pct(0.99):.2f} ms, max {latencies[-1] * 1000:.2f} ms")
+    print("codes:", dict(sorted(codes.items())))
+
+
+if __name__ == "__main__":
+    main()
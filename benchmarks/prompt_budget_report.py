@@ -0,0 +1,174 @@
+"""
+prompt_budget_report.py — токены и время запросов к модели до и после prompt_budget.py.
+
+Один и тот же набор вопросов (встроенный или --file, по вопросу на строку)
+задаётся модели двумя способами, через настоящий OpenRouterClient:
+  - «до»    — как было: полный system prompt с правилами 1–5, вопрос q[:600],
+              max_tokens=400;
+  - «после» — prompt_budget.plan(): компактный промпт персонажа, вопрос,
+              обрезанный по токенам, max_tokens по типу вопроса.
+Персонажи — из таблицы characters по кругу (база во временном каталоге).
+
+Печатает по типам вопросов и в сумме: оценку токенов промпта (estimate_tokens),
+prompt/completion токены из usage ответа, max_tokens и p50/p95 времени ответа,
+и изменение «после» относительно «до» в процентах.
+
+По умолчанию ответы даёт benchmarks/fake_openrouter.py с «многословной» моделью
+(пишет, пока не упрётся в max_tokens, --tps токенов в секунду) — время там
+почти целиком определяется max_tokens. Честные цифры — по настоящему API:
+  OPENROUTER_API_KEY=... python benchmarks/prompt_budget_report.py \\
+      --url https://openrouter.ai/api/v1/chat/completions --model deepseek/deepseek-chat-v3.1:free
+(на настоящем API заодно видно, насколько estimate_tokens расходится с токенизатором модели).
+"""
+
+from __future__ import annotations
+import os
+import sys
+import json
+import tempfile
+import argparse
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+CWD = os.getcwd()
+WORKDIR = tempfile.mkdtemp(prefix="prompt-budget-")
+os.environ["NOTES_DB_PATH"] = os.path.join(WORKDIR, "notes.db")
+
+QUESTIONS = [
+    "что такое SQLite?", "кто такой Алан Тьюринг?", "сколько байт в килобайте?", "когда появился Python?",
+    "как работает WAL в SQLite?", "объясни рекурсию на простом примере", "чем поток отличается от процесса?",
+    "почему небо голубое?", "сравни TCP и UDP",
+    "напиши функцию на python, которая переворачивает строку", "как написать SQL-запрос с GROUP BY?",
+    "напиши хайку про осень", "расскажи короткую сказку про кота", "придумай шутку про программистов",
+    "посоветуй книгу", "что посмотреть вечером?", "как дела?",
+    "у меня есть длинная история про то, как я пытался настроить сервер: " + "сначала одно, потом другое, " * 40
+    + "что мне делать?",
+]
+
+LEGACY = "до"
+BUDGET = "после"
+
+
+def _pct(values: list, q: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+def build(mode: str, question: str, character: dict) -> tuple[str, list, int]:
+    """(тип вопроса, messages, max_tokens) для режима."""
+    import prompt_budget
+    if mode == LEGACY:
+        text, max_tokens, kind = question[:prompt_budget.LEGACY_INPUT_CHARS], prompt_budget.LEGACY_MAX_TOKENS, None
+        system = prompt_budget.system_prompt(character, style="full")
+    else:
+        b = prompt_budget.plan(question)
+        text, max_tokens, kind = b.text, b.max_tokens, b.kind
+        system = prompt_budget.system_prompt(character, max_tokens, style="compact")
+    return kind or prompt_budget.classify(question), \
+        [{"role": "system", "content": system}, {"role": "user", "content": text}], max_tokens
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--file", help="вопросы, по одному на строку")
+    ap.add_argument("--url", help="OpenRouter-совместимый API вместо симулятора (нужен OPENROUTER_API_KEY)")
+    ap.add_argument("--model", default="openai/gpt-3.5-turbo")
+    ap.add_argument("--tps", type=float, default=200.0, help="токенов в секунду у симулятора")
+    ap.add_argument("--latency", type=float, default=0.2, help="секунд до первого токена у симулятора")
+    ap.add_argument("--repeat", type=int, default=1, help="сколько раз задать каждый вопрос")
+    ap.add_argument("--concurrency", type=int, default=8)
+    ap.add_argument("--json", help="сохранить результат в файл")
+    args = ap.parse_args()
+
+    questions = QUESTIONS
+    if args.file:
+        with open(os.path.join(CWD, args.file), encoding="utf-8") as f:
+            questions = [line.strip() for line in f if line.strip()]
+    llm = None
+    if args.url:
+        os.environ["OPENROUTER_API_URL"] = args.url
+    else:
+        from fake_openrouter import FakeOpenRouter
+        # «многословная» модель: отвечает, пока не кончится max_tokens
+        llm = FakeOpenRouter({"*": {"latency": args.latency, "tps": args.tps, "tokens": 4000}}).start()
+        os.environ["OPENROUTER_API_URL"] = llm.url
+        os.environ.setdefault("OPENROUTER_API_KEY", "report")
+
+    import db
+    import prompt_budget
+    from openrouter_client import OpenRouterClient, OpenRouterError
+    prompt_budget.LLM_BUDGET = True  # «после» считается с подбором, даже если он выключен в .env
+    db.init_db()
+    characters = [db.get_character_by_id(c["id"]) for c in db.list_characters()]
+    client = OpenRouterClient()
+
+    jobs = [(mode, q, characters[i % len(characters)])
+            for _ in range(args.repeat) for i, q in enumerate(questions) for mode in (LEGACY, BUDGET)]
+
+    def ask(job):
+        mode, question, character = job
+        kind, messages, max_tokens = build(mode, question, character)
+        row = {"mode": mode, "kind": kind, "max_tokens": max_tokens,
+               "estimate": prompt_budget.estimate_messages(messages)}
+        try:
+            _, ms, usage = client.chat_once(messages, model=args.model, temperature=0.2, max_tokens=max_tokens)
+            row.update(ms=ms, prompt=usage.get("prompt_tokens") or 0, completion=usage.get("completion_tokens") or 0)
+        except OpenRouterError as e:
+            row["error"] = str(e)
+        return row
+
+    print(f"{len(questions)} вопросов × {args.repeat}, модель {args.model}, API: {os.environ['OPENROUTER_API_URL']}")
+    with ThreadPoolExecutor(args.concurrency) as pool:
+        rows = list(pool.map(ask, jobs))
+    if llm:
+        llm.stop()
+
+    groups = defaultdict(lambda: defaultdict(list))  # тип -> режим -> строки
+    for r in rows:
+        if "error" not in r:
+            groups[r["kind"]][r["mode"]].append(r)
+            groups["всего"][r["mode"]].append(r)
+    errors = [r["error"] for r in rows if "error" in r]
+
+    def summary(items: list) -> dict:
+        n = max(len(items), 1)
+        return {"n": len(items), "estimate": sum(r["estimate"] for r in items) / n,
+                "prompt": sum(r["prompt"] for r in items) / n, "completion": sum(r["completion"] for r in items) / n,
+                "max_tokens": sum(r["max_tokens"] for r in items) / n,
+                "p50_ms": _pct([r["ms"] for r in items], .5), "p95_ms": _pct([r["ms"] for r in items], .95)}
+
+    def change(before: float, after: float) -> str:
+        return f"{(after - before) / before * 100:+.0f}%" if before else "—"
+
+    result = {}
+    print(f"\n{'тип':9} {'режим':6} {'n':>4} {'оценка':>7} {'prompt':>7} {'compl.':>7} {'max_t':>6} "
+          f"{'p50 мс':>7} {'p95 мс':>7}")
+    for kind in sorted(groups, key=lambda k: (k == "всего", k)):
+        s = {mode: summary(groups[kind][mode]) for mode in (LEGACY, BUDGET)}
+        result[kind] = s
+        for mode in (LEGACY, BUDGET):
+            x = s[mode]
+            print(f"{kind:9} {mode:6} {x['n']:4} {x['estimate']:7.0f} {x['prompt']:7.0f} {x['completion']:7.0f} "
+                  f"{x['max_tokens']:6.0f} {x['p50_ms']:7} {x['p95_ms']:7}")
+        b, a = s[LEGACY], s[BUDGET]
+        print(f"{'':9} {'Δ':6} {'':4} {change(b['estimate'], a['estimate']):>7} {change(b['prompt'], a['prompt']):>7} "
+              f"{change(b['completion'], a['completion']):>7} {change(b['max_tokens'], a['max_tokens']):>6} "
+              f"{change(b['p50_ms'], a['p50_ms']):>7} {change(b['p95_ms'], a['p95_ms']):>7}")
+    if errors:
+        print(f"\nошибок: {len(errors)}, например: {errors[0]}")
+    if args.json:
+        path = os.path.join(CWD, args.json)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"model": args.model, "url": os.environ["OPENROUTER_API_URL"], "groups": result,
+                       "errors": len(errors)}, f, ensure_ascii=False, indent=1)
+        print(f"\nрезультат: {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,320 @@
+"""
+replay_bots.py — пропускная способность ботов на повторе обновлений, без сети.
+
+Обновления (синтетический сценарий на бота или записанные, JSONL) подаются
+прямо в process_new_updates ботов main.py, main3.py и crud.py — по одному,
+в одном потоке, так что время обновления — это время его обработчиков:
+  - Bot API — FakeBotAPI в том же процессе (apihelper.CUSTOM_REQUEST_SENDER),
+    исходящие вызовы считаются по методам;
+  - OpenRouter — benchmarks/fake_openrouter.py (OPENROUTER_API_URL) с задержкой --llm-latency;
+  - погода (open-meteo) — заглушка с задержкой --weather-latency;
+  - базы — во временном каталоге, обёртки metrics/perf включены, как в run_bots.
+
+Печатает обновлений/с и p50/p95/p99 по командам; с --alloc — второй проход
+под tracemalloc: пик выделенной памяти на обновление (медиана по команде).
+--json сохраняет результат (с коммитом git), --compare сравнивает с прошлым:
+
+  python benchmarks/replay_bots.py -n 3000 --json before.json
+  git checkout ... && python benchmarks/replay_bots.py -n 3000 --compare before.json
+
+Файл --file: по одному обновлению на строку — Update целиком (пойдёт всем
+ботам из --bots) или {"bot": "main3", "update": {...}}; update_id
+проставляется заново, -n повторяет файл по кругу.
+"""
+
+from __future__ import annotations
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import tempfile
+import itertools
+import subprocess
+import tracemalloc
+from collections import defaultdict
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+CWD = os.getcwd()  # пути из аргументов — относительно него
+WORKDIR = tempfile.mkdtemp(prefix="replay-")
+os.chdir(WORKDIR)  # main.py пишет notes.db/characters.db в текущий каталог
+os.environ.update({
+    "NOTES_DB_PATH": os.path.join(WORKDIR, "notes.db"),
+    "DB_PATH": os.path.join(WORKDIR, "bot.db"),
+    "LOG_DIR": os.path.join(WORKDIR, "logs"),
+    "TOKEN_MAIN": "1001:replay-main", "TOKEN_MAIN3": "1002:replay-main3", "TOKEN_CRUD": "1003:replay-crud",
+})
+os.environ.setdefault("LOG_LEVEL", "WARNING")  # строки «handled» на каждое обновление: LOG_LEVEL=INFO
+os.environ.setdefault("OPENROUTER_API_KEY", "replay")
+os.environ.pop("TELEGRAM_API_URL", None)
+
+from telebot import apihelper, types
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from fake_bot_api import FakeBotAPI
+from fake_openrouter import FakeOpenRouter
+
+# Сценарии: шаги одного пользователя по кругу. (метка, текст) или (метка, None, callback_data).
+# Ответ на register_next_step_handler идёт сразу за своей командой — обработка в одном потоке.
+SCENARIOS = {
+    "main": [
+        ("/start", "/start"), ("/ping", "/ping"), ("/sum", "/sum 2, 3 -5 10"),
+        ("/max", "/max"), ("/max:шаг", "3 9 4"), ("/models", "/models"), ("/whoami", "/whoami"),
+        ("/note_add", "/note_add"), ("/note_add:шаг", "купить молоко и хлеб"), ("/note_list", "/note_list"),
+        ("/characters", "/characters"), ("/ask", "/ask что такое SQLite?"), ("Сумма", "Сумма"),
+        ("Сумма:шаг", "5 6 7"), ("/confirm", "/confirm"), ("confirm:yes", None, "confirm:yes"),
+        ("/weather", "/weather"), ("текст", "просто текст"),
+    ],
+    "main3": [
+        ("/start", "/start"), ("/set_sign", "/set_sign лев"), ("/set_time", "/set_time 7:30"),
+        ("/set_tz", "/set_tz Asia/Omsk"), ("/me", "/me"), ("/today", "/today"), ("/week", "/week"),
+        ("/month", "/month"), ("знак", "Рыбы"), ("/subscribe", "/subscribe"), ("/signs", "/signs"),
+        ("/unsubscribe", "/unsubscribe"),
+    ],
+    "crud": [
+        ("/start", "/start"), ("/help", "/help"), ("/note_add", "/note_add позвонить маме в субботу"),
+        ("/note_list", "/note_list"), ("/note_find", "/note_find маме"), ("/note_count", "/note_count"),
+        ("/note_edit", "/note_edit 1 новый текст"), ("/note_export", "/note_export"),
+        ("/note_del", "/note_del 999999"),
+    ],
+}
+
+
+def _message(uid: int, msg_id: int, text: str) -> dict:
+    entities = [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}] if text.startswith("/") else []
+    return {"message_id": msg_id, "date": int(time.time()), "text": text, "entities": entities,
+            "chat": {"id": uid, "type": "private"},
+            "from": {"id": uid, "is_bot": False, "first_name": f"user{uid}", "language_code": "ru"}}
+
+
+def synthetic(bot_name: str, n: int, users: int) -> list[tuple[str, dict]]:
+    """n обновлений: пользователи по очереди, у каждого — следующий шаг сценария."""
+    steps = SCENARIOS[bot_name]
+    out = []
+    for i in range(n):
+        uid, step = 10_000 + i % users, steps[(i // users) % len(steps)]
+        if step[1] is None:
+            update = {"callback_query": {"id": str(i), "data": step[2], "chat_instance": "1",
+                                         "from": _message(uid, i, "")["from"],
+                                         "message": _message(uid, i, "Подтвердить действие?")}}
+        else:
+            update = {"message": _message(uid, i + 1, step[1])}
+        out.append((step[0], update))
+    return out
+
+
+def label(update: dict) -> str:
+    """Метка для записанных обновлений: команда, callback или «текст»."""
+    if "callback_query" in update:
+        return "callback:" + str(update["callback_query"].get("data") or "").split(":", 1)[0]
+    text = (update.get("message") or {}).get("text") or ""
+    return text.split()[0].split("@")[0] if text.startswith("/") else "текст"
+
+
+def from_file(path: str, bots: list[str], n: int | None) -> dict[str, list[tuple[str, dict]]]:
+    per_bot = defaultdict(list)
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            row = json.loads(line)
+            targets = [row["bot"]] if "update" in row else bots
+            update = row.get("update", row)
+            for name in targets:
+                if name in bots:
+                    per_bot[name].append((label(update), update))
+    if n is not None:
+        per_bot = {name: list(itertools.islice(itertools.cycle(items), n)) for name, items in per_bot.items() if items}
+    return dict(per_bot)
+
+
+def _pct(sorted_values: list, q: float) -> float:
+    return sorted_values[min(len(sorted_values) - 1, int(q * len(sorted_values)))]
+
+
+def _parse(items: list[tuple[str, dict]], start_id: int) -> list[tuple[str, types.Update]]:
+    return [(name, types.Update.de_json(dict(u, update_id=start_id + i))) for i, (name, u) in enumerate(items)]
+
+
+class Replay:
+    def __init__(self, bots: list[str], llm: FakeOpenRouter, weather_latency: float = 0.0):
+        import host
+        import metrics
+
+        self.api = FakeBotAPI()
+        apihelper.CUSTOM_REQUEST_SENDER = self.api.request_sender()
+        self.llm = llm.start()
+        os.environ["OPENROUTER_API_URL"] = self.llm.url  # openrouter_client читает при импорте
+        self.modules = host.load_bots(bots)
+        metrics.instrument_telegram()
+        for name, mod in self.modules.items():
+            mod.bot.threaded = False  # обработчик — в этом же потоке, время обновления = время обработки
+            metrics.instrument_bot(mod.bot, name)
+        main = self.modules.get("main")
+        if main is not None:
+            def weather() -> str:
+                time.sleep(weather_latency)
+                return "Москва: сейчас 12°C"
+            main.fetch_weather_moscow_open_meteo = weather
+        self._next_id = 1
+
+    def run(self, bot_name: str, items: list[tuple[str, dict]], alloc: bool = False) -> dict:
+        """Обрабатывает обновления по одному; метка -> список (секунды, ошибка, байты)."""
+        bot = self.modules[bot_name].bot
+        parsed = _parse(items, self._next_id)
+        self._next_id += len(parsed)
+        process = type(bot).process_new_updates
+        samples = defaultdict(list)
+        for name, update in parsed:
+            if alloc:
+                tracemalloc.reset_peak()
+                base = tracemalloc.get_traced_memory()[0]
+            error = False
+            t0 = time.perf_counter()
+            try:
+                process(bot, [update])
+            except Exception:
+                error = True
+            dt = time.perf_counter() - t0
+            peak = tracemalloc.get_traced_memory()[1] - base if alloc else 0
+            samples[name].append((dt, error, peak))
+        return samples
+
+    def llm_calls(self) -> dict:
+        """Запросы к фейковому OpenRouter по моделям (все статусы)."""
+        out = defaultdict(int)
+        for (model, _), n in list(self.llm.calls.items()):
+            out[model] += n
+        return dict(out)
+
+    def stop(self) -> None:
+        self.llm.stop()
+        apihelper.CUSTOM_REQUEST_SENDER = None
+
+
+def summarize(samples: dict, wall: float, alloc_samples: dict | None) -> dict:
+    total = sum(len(v) for v in samples.values())
+    commands = {}
+    for name, rows in sorted(samples.items()):
+        times = sorted(dt for dt, _, _ in rows)
+        commands[name] = {
+            "count": len(rows), "errors": sum(err for _, err, _ in rows),
+            "mean_ms": sum(times) / len(times) * 1000,
+            "p50_ms": _pct(times, .5) * 1000, "p95_ms": _pct(times, .95) * 1000,
+            "p99_ms": _pct(times, .99) * 1000, "max_ms": times[-1] * 1000,
+        }
+        if alloc_samples and alloc_samples.get(name):
+            peaks = sorted(p for _, _, p in alloc_samples[name])
+            commands[name]["alloc_kib"] = _pct(peaks, .5) / 1024
+    return {"updates": total, "seconds": wall, "updates_per_sec": total / wall if wall else 0.0, "commands": commands}
+
+
+def _git_commit() -> str | None:
+    try:
+        out = subprocess.run(["git", "-C", ROOT, "describe", "--always", "--dirty"], capture_output=True, text=True, timeout=10)
+        return out.stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def print_report(name: str, res: dict) -> None:
+    print(f"\n== {name}: {res['updates']} обновлений за {res['seconds']:.2f} с — {res['updates_per_sec']:.0f} обн/с")
+    has_alloc = any("alloc_kib" in c for c in res["commands"].values())
+    print(f"{'команда':16} {'n':>6} {'ош':>4} {'p50':>7} {'p95':>7} {'p99':>7} {'max':>7} мс"
+          + (f" {'KiB':>7}" if has_alloc else ""))
+    for cmd, c in sorted(res["commands"].items(), key=lambda kv: -kv[1]["mean_ms"] * kv[1]["count"]):
+        line = (f"{cmd[:16]:16} {c['count']:6} {c['errors']:4} {c['p50_ms']:7.2f} {c['p95_ms']:7.2f} "
+                f"{c['p99_ms']:7.2f} {c['max_ms']:7.1f}")
+        if has_alloc:
+            line += f"    {c['alloc_kib']:7.1f}" if "alloc_kib" in c else ""
+        print(line)
+    calls = ", ".join(f"{m} {k}" for m, k in sorted(res.get("api_calls", {}).items()))
+    print(f"Bot API: {calls or '—'}; OpenRouter: {sum(res.get('llm_calls', {}).values())}")
+
+
+def _delta(new: float, old: float) -> str:
+    return f"{(new - old) / old * 100:+.0f}%" if old else "   —"
+
+
+def print_compare(results: dict, base: dict) -> None:
+    print(f"\nсравнение с {base['meta'].get('commit') or '?'} ({base['meta'].get('time', '')}):")
+    for name, res in results.items():
+        old = base["bots"].get(name)
+        if not old:
+            continue
+        print(f"{name}: {old['updates_per_sec']:.0f} -> {res['updates_per_sec']:.0f} обн/с "
+              f"({_delta(res['updates_per_sec'], old['updates_per_sec'])})")
+        for cmd, c in sorted(res["commands"].items()):
+            o = old["commands"].get(cmd)
+            if o:
+                line = (f"  {cmd[:16]:16} p50 {o['p50_ms']:7.2f} -> {c['p50_ms']:7.2f} ({_delta(c['p50_ms'], o['p50_ms']):>5})"
+                        f"  p95 {o['p95_ms']:7.2f} -> {c['p95_ms']:7.2f} ({_delta(c['p95_ms'], o['p95_ms']):>5})")
+                if "alloc_kib" in c and "alloc_kib" in o:
+                    line += f"  KiB {o['alloc_kib']:.1f} -> {c['alloc_kib']:.1f}"
+                print(line)
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--bots", default="main,main3,crud")
+    ap.add_argument("-n", type=int, default=None, help="обновлений на бота (по умолчанию 2000 или весь файл)")
+    ap.add_argument("--file", help="JSONL с записанными обновлениями")
+    ap.add_argument("--users", type=int, default=50, help="сколько разных пользователей в синтетике")
+    ap.add_argument("--warmup", type=int, default=200, help="обновлений на бота до замера (не считаются)")
+    ap.add_argument("--llm-latency", type=float, default=0.0, help="задержка ответа фейкового OpenRouter, с")
+    ap.add_argument("--weather-latency", type=float, default=0.0, help="задержка заглушки погоды, с")
+    ap.add_argument("--alloc", action="store_true", help="второй проход под tracemalloc: память на обновление")
+    ap.add_argument("--json", help="сохранить результат в файл")
+    ap.add_argument("--compare", help="сравнить с результатом из файла --json")
+    args = ap.parse_args()
+    for attr in ("file", "json", "compare"):
+        if getattr(args, attr):
+            setattr(args, attr, os.path.join(CWD, getattr(args, attr)))
+
+    bots = [b.strip() for b in args.bots.split(",") if b.strip()]
+    if args.file:
+        workload = from_file(args.file, bots, args.n)
+    else:
+        workload = {name: synthetic(name, args.n or 2000, args.users) for name in bots if name in SCENARIOS}
+
+    replay = Replay(bots, FakeOpenRouter({"*": {"latency": args.llm_latency, "jitter": 0}}), args.weather_latency)
+    results = {}
+    try:
+        for name, items in workload.items():
+            if name not in replay.modules or not items:
+                continue
+            if args.warmup:
+                replay.run(name, list(itertools.islice(itertools.cycle(items), args.warmup)))
+            api_before, llm_before = dict(replay.api.calls), replay.llm_calls()
+            t0 = time.perf_counter()
+            samples = replay.run(name, items)
+            wall = time.perf_counter() - t0
+            api_calls = {m: k - api_before.get(m, 0) for m, k in replay.api.calls.items() if k - api_before.get(m, 0)}
+            llm_calls = {m: k - llm_before.get(m, 0) for m, k in replay.llm_calls().items() if k - llm_before.get(m, 0)}
+            alloc_samples = None
+            if args.alloc:
+                tracemalloc.start()
+                alloc_samples = replay.run(name, items, alloc=True)
+                tracemalloc.stop()
+            results[name] = dict(summarize(samples, wall, alloc_samples), api_calls=api_calls, llm_calls=llm_calls)
+            print_report(name, results[name])
+    finally:
+        replay.stop()
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            print_compare(results, json.load(f))
+    if args.json:
+        meta = {"commit": _git_commit(), "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                "python": platform.python_version(), "machine": platform.machine(),
+                "args": {k: v for k, v in vars(args).items() if k not in ("json", "compare")}}
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"meta": meta, "bots": results}, f, ensure_ascii=False, indent=1)
+        print(f"\nрезультат: {args.json}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+"""
+schedule_index.py — индекс подписчиков DailyZodiakBot в памяти по часу рассылки.
+
+Зачем: набор «кому слать» меняется только на границе часа и когда
+пользователь меняет настройки. Вместо опроса базы раз в минуту планировщик
+спит до следующей границы, а кого будить — знает из индекса.
+
+Устройство (компактно, без объекта на пользователя):
+  - 24 корзины, по одной на notify_hour;
+  - в корзине три параллельных массива array: user_id (отсортированы, 'q'),
+    номер знака ('b') и день последней отправки (date.toordinal(), 'i');
+  - поиск/вставка/удаление — bisect по user_id, ~13 байт на подписчика.
+
+Индекс держит только тех, кому вообще можно слать: subscribed=1 и знак задан.
+
+Прежний планировщик main3.py; сейчас рассылка идёт по next_send_at в базе
+(db3.iter_due): индекс знает только час по времени сервера, а слоты — по минутам
+и по часовому поясу пользователя. В боте не используется — лежит рядом с
+bench_schedule_index.py как точка сравнения с диапазонным проходом по next_send_at.
+"""
+
+from __future__ import annotations
+import threading
+from array import array
+from bisect import bisect_left
+from datetime import date
+from typing import Iterable, List, Sequence
+
+
+class _Bucket:
+    __slots__ = ("ids", "signs", "sent")
+
+    def __init__(self):
+        self.ids = array("q")
+        self.signs = array("b")
+        self.sent = array("i")
+
+    def find(self, user_id: int) -> int:
+        i = bisect_left(self.ids, user_id)
+        return i if i < len(self.ids) and self.ids[i] == user_id else -1
+
+    def insert(self, user_id: int, sign: int, sent: int) -> None:
+        i = bisect_left(self.ids, user_id)
+        self.ids.insert(i, user_id)
+        self.signs.insert(i, sign)
+        self.sent.insert(i, sent)
+
+    def remove_at(self, i: int) -> None:
+        del self.ids[i]
+        del self.signs[i]
+        del self.sent[i]
+
+    def nbytes(self) -> int:
+        return sum(a.buffer_info()[1] * a.itemsize for a in (self.ids, self.signs, self.sent))
+
+
+def _ordinal(day: str | None) -> int:
+    return date.fromisoformat(day).toordinal() if day else 0
+
+
+class HourIndex:
+    def __init__(self, signs: Sequence[str]):
+        self.signs = list(signs)
+        self._sign_no = {s: i for i, s in enumerate(self.signs)}
+        self._buckets = [_Bucket() for _ in range(24)]
+        self._lock = threading.Lock()
+        # взводится, когда изменение касается часа, который сейчас рассылается
+        self.changed = threading.Event()
+        self.current_hour: int | None = None
+
+    # ---------- наполнение ----------
+    def load(self, rows: Iterable) -> int:
+        """
+        Строит индекс из строк (user_id, sign, notify_hour, last_sent_date),
+        отсортированных по user_id — тогда вставка в корзину это append.
+        """
+        n = 0
+        with self._lock:
+            for b in self._buckets:
+                b.__init__()
+            for user_id, sign, hour, last_sent in rows:
+                no = self._sign_no.get(sign)
+                if no is None or not 0 <= hour <= 23:
+                    continue
+                b = self._buckets[hour]
+                if b.ids and b.ids[-1] >= user_id:
+                    b.insert(user_id, no, _ordinal(last_sent))
+                else:
+                    b.ids.append(user_id)
+                    b.signs.append(no)
+                    b.sent.append(_ordinal(last_sent))
+                n += 1
+        return n
+
+    def update(self, user_id: int, sign: str | None, hour: int, subscribed: bool,
+               last_sent: str | None = None) -> None:
+        """Применяет новые настройки пользователя (вызывается после записи в БД)."""
+        with self._lock:
+            sent = 0
+            for b in self._buckets:  # 24 бинарных поиска — дешевле, чем словарь на миллион ключей
+                i = b.find(user_id)
+                if i >= 0:
+                    sent = b.sent[i]
+                    b.remove_at(i)
+                    break
+            no = self._sign_no.get(sign) if sign else None
+            if subscribed and no is not None and 0 <= hour <= 23:
+                self._buckets[hour].insert(user_id, no, max(sent, _ordinal(last_sent)))
+                if hour == self.current_hour:
+                    self.changed.set()
+
+    # ---------- рассылка ----------
+    def due(self, hour: int, today: date) -> List[tuple]:
+        """(user_id, sign) в корзине hour, кому сегодня ещё не отправляли."""
+        day = today.toordinal()
+        with self._lock:
+            b = self._buckets[hour]
+            return [(b.ids[i], self.signs[b.signs[i]]) for i in range(len(b.ids)) if b.sent[i] != day]
+
+    def mark_sent(self, user_ids: Iterable[int], hour: int, today: date) -> None:
+        day = today.toordinal()
+        with self._lock:
+            b = self._buckets[hour]
+            for uid in user_ids:
+                i = b.find(uid)
+                if i >= 0:
+                    b.sent[i] = day
+
+    # ---------- статистика ----------
+    def __len__(self) -> int:
+        return sum(len(b.ids) for b in self._buckets)
+
+    def memory_bytes(self) -> int:
+        """Память под данные корзин (без накладных расходов самих объектов)."""
+        return sum(b.nbytes() for b in self._buckets)
@@ -0,0 +1,184 @@
+"""
+broadcast.py — массовая рассылка с ограничением скорости под лимиты Telegram.
+
+Зачем:
+  - bot.send_message — сетевой вызов, по одному подряд рассылка идёт
+    со скоростью одного RTT; пул потоков отправляет параллельно;
+  - Telegram режет бота примерно на ~30 сообщений/с всего и ~1/с в один чат,
+    поэтому общий token bucket + интервал на чат;
+  - 429 Too Many Requests приходит с retry_after — на это время
+    притормаживаем весь пул, а сообщение отправляем повторно;
+  - прочие временные сбои (5xx, сеть) повторяем с ограниченным бюджетом,
+    постоянные (403 — бот заблокирован, 400) не повторяем;
+  - «доставлено» — только после успешного ответа API.
+
+Отправка передаётся функцией send(chat_id, text, **kwargs), поэтому движок
+не зависит от telebot и проверяется на локальном фейковом Bot API
+(benchmarks/fake_bot_api.py).
+"""
+
+from __future__ import annotations
+import os
+import time
+import random
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Callable, Iterable, List
+
+log = logging.getLogger(__name__)
+
+BROADCAST_WORKERS = int(os.getenv("BROADCAST_WORKERS", "8"))
+BROADCAST_RATE = float(os.getenv("BROADCAST_RATE", "28"))          # сообщений/с на бота (запас от ~30)
+BROADCAST_CHAT_INTERVAL = float(os.getenv("BROADCAST_CHAT_INTERVAL", "1.0"))  # сек между сообщениями в один чат
+BROADCAST_MAX_ATTEMPTS = int(os.getenv("BROADCAST_MAX_ATTEMPTS", "3"))  # попыток на сообщение, с первой; 429 и 5xx — поровну
+BROADCAST_RETRY_BUDGET = float(os.getenv("BROADCAST_RETRY_BUDGET", "0.2"))   # доля повторов от размера рассылки
+
+
+class TokenBucket:
+    """Классический token bucket: rate токенов/с, запас до capacity."""
+
+    def __init__(self, rate: float, capacity: float | None = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self._tokens = self.capacity
+        self._last = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def pause(self, seconds: float) -> None:
+        """Остановить выдачу токенов (ответ 429 с retry_after)."""
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+            self._tokens = 0.0
+
+    def acquire(self) -> None:
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                if now >= self._paused_until:
+                    self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.rate)
+                    self._last = now
+                    if self._tokens >= 1.0:
+                        self._tokens -= 1.0
+                        return
+                    wait = (1.0 - self._tokens) / self.rate
+                else:
+                    self._last = self._paused_until
+                    wait = self._paused_until - now
+            time.sleep(wait)
+
+
+class ChatLimiter:
+    """Не чаще одного сообщения в interval секунд на чат."""
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self._next: dict = {}
+        self._lock = threading.Lock()
+
+    def acquire(self, chat_id: int) -> None:
+        with self._lock:
+            now = time.monotonic()
+            at = max(now, self._next.get(chat_id, 0.0))
+            self._next[chat_id] = at + self.interval
+            if len(self._next) > 100_000:  # рассылка — по одному на чат, держим память ограниченной
+                self._next = {c: t for c, t in self._next.items() if t > now}
+        if at > now:
+            time.sleep(at - now)
+
+
+@dataclass
+class BroadcastResult:
+    # ключи заданий (chat_id, если ключ не задан)
+    delivered: List[int] = field(default_factory=list)
+    blocked: List[int] = field(default_factory=list)   # 403: пользователь заблокировал бота
+    rejected: List[int] = field(default_factory=list)  # прочие 4xx (400 chat not found, ...): повтор не поможет
+    failed: List[int] = field(default_factory=list)    # временный сбой, повторы исчерпаны
+    retries: int = 0
+
+
+def _error_code(e: Exception) -> int | None:
+    # telebot.apihelper.ApiTelegramException: error_code + result_json
+    return getattr(e, "error_code", None)
+
+
+def _retry_after(e: Exception) -> float | None:
+    params = (getattr(e, "result_json", None) or {}).get("parameters") or {}
+    value = params.get("retry_after")
+    return float(value) if value is not None else None
+
+
+class Broadcaster:
+    def __init__(self, send: Callable[..., object], workers: int = BROADCAST_WORKERS,
+                 rate: float = BROADCAST_RATE, chat_interval: float = BROADCAST_CHAT_INTERVAL,
+                 max_attempts: int = BROADCAST_MAX_ATTEMPTS, retry_budget: float = BROADCAST_RETRY_BUDGET):
+        self.send = send
+        self.workers = workers
+        self.bucket = TokenBucket(rate)
+        self.chats = ChatLimiter(chat_interval)
+        self.max_attempts = max_attempts
+        self.retry_budget = retry_budget
+
+    def run(self, jobs: Iterable[tuple], **send_kwargs) -> BroadcastResult:
+        """
+        jobs — пары (chat_id, text) или тройки (chat_id, text, key). Возвращает,
+        кому доставлено, кто заблокировал бота, кому Telegram отказал насовсем
+        (4xx) и кому доставить не удалось — списками key (по умолчанию chat_id). key нужен, когда в одной рассылке
+        несколько сообщений в один чат и их надо различать (строки outbox).
+        """
+        jobs = list(jobs)
+        result = BroadcastResult()
+        lock = threading.Lock()
+        budget = [max(1, int(len(jobs) * self.retry_budget))]
+
+        def take_retry() -> bool:
+            with lock:
+                if budget[0] <= 0:
+                    return False
+                budget[0] -= 1
+                result.retries += 1
+                return True
+
+        def one(job: tuple) -> None:
+            chat_id, text = job[:2]
+            key = job[2] if len(job) > 2 else chat_id
+            attempt = 0
+            while True:
+                attempt += 1
+                self.bucket.acquire()
+                self.chats.acquire(chat_id)
+                try:
+                    self.send(chat_id, text, **send_kwargs)
+                except Exception as e:
+                    code = _error_code(e)
+                    if code == 429:
+                        wait = _retry_after(e) or 1.0
+                        log.warning("Broadcast: 429 for %s, pausing %.1f s", chat_id, wait)
+                        self.bucket.pause(wait)
+                        if attempt < self.max_attempts and take_retry():
+                            continue
+                    elif code == 403:
+                        with lock:
+                            result.blocked.append(key)
+                        return
+                    elif code is not None and 400 <= code < 500:
+                        log.warning("Send rejected for %s: %r", chat_id, e)
+                        with lock:
+                            result.rejected.append(key)
+                        return
+                    elif (code is None or code >= 500) and attempt < self.max_attempts and take_retry():
+                        time.sleep(min(2.0 ** attempt, 10.0) * (0.5 + random.random() / 2))
+                        continue
+                    log.warning("Send failed to %s: %r", chat_id, e)
+                    with lock:
+                        result.failed.append(key)
+                    return
+                with lock:
+                    result.delivered.append(key)
+                return
+
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="broadcast") as pool:
+            list(pool.map(one, jobs))
+        return result
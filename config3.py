@@ -1,5 +1,5 @@
 """
-config.py — конфигурация проекта: переменные окружения и базовое логирование.
+config.py — конфигурация проекта: переменные окружения (логирование настраивает logsetup.py в main3.py).
 Курс: TeleBot (pyTelegramBotAPI) + sqlite3 + python-dotenv, запуск long polling.
 """
 
@@ -17,13 +17,28 @@ LOG_LEVEL_NAME = (os.getenv("LOG_LEVEL") or "INFO").upper()
 LOG_LEVEL = getattr(logging, LOG_LEVEL_NAME, logging.INFO)
 
 DEFAULT_NOTIFY_HOUR = int(os.getenv("DEFAULT_NOTIFY_HOUR", "9"))
+DEFAULT_TZ: str = os.getenv("DEFAULT_TZ", "Europe/Moscow")  # пояс IANA для новых пользователей
 
-logging.basicConfig(
-    level=LOG_LEVEL,
-    format="%(asctime)s [%(levelname)s] %(name)s: %(message)s"
-)
+# Воркеры, разбирающие outbox рассылки (можно больше — общий лимит скорости один)
+OUTBOX_WORKERS = int(os.getenv("OUTBOX_WORKERS", "2"))
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "5"))
+OUTBOX_RETENTION_DAYS = int(os.getenv("OUTBOX_RETENTION_DAYS", "14"))
+
+# Аренда лидера планировщика: при нескольких репликах main3.py резерв
+# перехватывает планирование не позже чем через столько секунд после падения лидера
+LEADER_LEASE_SEC = float(os.getenv("LEADER_LEASE_SEC", "15"))
+
+# Сколько секунд профиль пользователя живёт в кэше процесса (db3.py). Настройки,
+# изменённые через другую реплику, видны здесь не позже чем через столько секунд;
+# 0 — без кэша (каждое чтение профиля идёт в базу)
+PROFILE_CACHE_TTL = float(os.getenv("PROFILE_CACHE_TTL", "5"))
+
+# Адрес Bot API в формате telebot (apihelper.API_URL); пусто — api.telegram.org.
+# Для нагрузочных проверок: http://127.0.0.1:8081/bot{0}/{1} (benchmarks/fake_bot_api.py)
+TELEGRAM_API_URL: str | None = os.getenv("TELEGRAM_API_URL") or None
 
 if not TOKEN:
     raise RuntimeError("Нет TOKEN в .env — получите токен у @BotFather и положите его в .env")
 
-__all__ = ["TOKEN", "DB_PATH", "DEFAULT_NOTIFY_HOUR", "LOG_LEVEL"]
+__all__ = ["TOKEN", "DB_PATH", "DEFAULT_NOTIFY_HOUR", "DEFAULT_TZ", "LOG_LEVEL", "TELEGRAM_API_URL",
+           "OUTBOX_WORKERS", "OUTBOX_MAX_ATTEMPTS", "OUTBOX_RETENTION_DAYS", "LEADER_LEASE_SEC"]
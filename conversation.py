@@ -0,0 +1,250 @@
+"""
+conversation.py — короткая память диалога для /ask (main.py).
+
+У каждого пользователя — кольцевой буфер последних реплик (вопрос/ответ) с
+бюджетом CONV_HISTORY_TOKENS токенов (оценка prompt_budget.estimate_tokens).
+Когда буфер не влезает в бюджет, самые старые реплики сворачиваются в сводку:
+от каждой остаётся первая фраза, а сводка держится в CONV_SUMMARY_TOKENS
+(старые строки уходят первыми). Поэтому история в запросе к модели не больше
+CONV_SUMMARY_TOKENS + CONV_HISTORY_TOKENS, сколько бы ни длился разговор.
+Сводка считается локально, без лишнего запроса к модели, и пересчитывается
+только при сворачивании — между ними лежит готовой.
+
+Хранение:
+  - conversation_turns и conversation_summary в notes.db — история переживает
+    перезапуск; свёрнутые реплики из conversation_turns удаляются;
+  - в памяти — не больше CONV_CACHE_USERS разговоров (LRU), остальные
+    поднимаются из базы при следующем /ask.
+
+Разговор, молчавший дольше CONV_TTL_SEC, начинается заново; /reset — сразу.
+Брошенные в базе строки чистит retention.py (CONV_RETENTION_DAYS).
+"""
+
+from __future__ import annotations
+import os
+import re
+import time
+import sqlite3
+import logging
+import threading
+from collections import OrderedDict, deque
+from dataclasses import dataclass, field
+
+from dotenv import load_dotenv
+
+from db import DB_PATH
+from prompt_budget import estimate_tokens, trim_to_tokens
+from retention import register_policy
+from profiling import register_gauge
+
+load_dotenv()
+
+log = logging.getLogger(__name__)
+
+CONV_HISTORY_TOKENS = int(os.getenv("CONV_HISTORY_TOKENS", "600"))
+CONV_SUMMARY_TOKENS = int(os.getenv("CONV_SUMMARY_TOKENS", "150"))
+CONV_TURN_TOKENS = int(os.getenv("CONV_TURN_TOKENS", "300"))  # ответ модели в истории — не длиннее
+CONV_TTL_SEC = int(os.getenv("CONV_TTL_SEC", "1800"))
+CONV_CACHE_USERS = int(os.getenv("CONV_CACHE_USERS", "1000"))
+CONV_RETENTION_DAYS = int(os.getenv("CONV_RETENTION_DAYS", "7"))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS conversation_turns (
+    id         INTEGER PRIMARY KEY,
+    user_id    INTEGER NOT NULL,
+    role       TEXT NOT NULL,
+    content    TEXT NOT NULL,
+    tokens     INTEGER NOT NULL,
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+CREATE INDEX IF NOT EXISTS ix_conversation_turns_user ON conversation_turns(user_id, id);
+
+CREATE TABLE IF NOT EXISTS conversation_summary (
+    user_id    INTEGER PRIMARY KEY,
+    summary    TEXT NOT NULL,
+    updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+"""
+
+SUMMARY_INTRO = "Кратко, о чём говорили раньше:\n"
+_SENTENCE_END_RE = re.compile(r"(?<=[.!?…])\s")
+
+
+@dataclass
+class _Turn:
+    id: int
+    role: str       # user | assistant
+    content: str
+    tokens: int
+
+
+@dataclass
+class _Conversation:
+    turns: deque = field(default_factory=deque)
+    tokens: int = 0
+    summary: str = ""        # строки «Пользователь: …» / «Ты: …», старые сверху
+    last_active: float = 0.0
+    lock: threading.Lock = field(default_factory=threading.Lock)
+
+
+_cache: "OrderedDict[int, _Conversation]" = OrderedDict()
+_cache_lock = threading.Lock()
+_schema_ready = False
+
+
+def _connect() -> sqlite3.Connection:
+    conn = sqlite3.connect(DB_PATH, timeout=5.0)
+    conn.row_factory = sqlite3.Row
+    return conn
+
+
+def init_db() -> None:
+    global _schema_ready
+    conn = _connect()
+    try:
+        conn.executescript(SCHEMA)
+    finally:
+        conn.close()
+    _schema_ready = True
+
+
+def _expired(conv: _Conversation) -> bool:
+    return bool(CONV_TTL_SEC and conv.last_active) and time.time() - conv.last_active > CONV_TTL_SEC
+
+
+def _delete(conn: sqlite3.Connection, user_id: int) -> None:
+    with conn:
+        conn.execute("DELETE FROM conversation_turns WHERE user_id = ?", (user_id,))
+        conn.execute("DELETE FROM conversation_summary WHERE user_id = ?", (user_id,))
+
+
+def _load(conn: sqlite3.Connection, user_id: int) -> _Conversation:
+    conv = _Conversation()
+    rows = conn.execute(
+        "SELECT id, role, content, tokens, strftime('%s', created_at) AS ts "
+        "FROM conversation_turns WHERE user_id = ? ORDER BY id", (user_id,)).fetchall()
+    row = conn.execute("SELECT summary, strftime('%s', updated_at) AS ts FROM conversation_summary "
+                       "WHERE user_id = ?", (user_id,)).fetchone()
+    stamps = [int(r["ts"]) for r in rows] + ([int(row["ts"])] if row else [])
+    conv.last_active = max(stamps, default=0)
+    if _expired(conv):
+        _delete(conn, user_id)
+        return _Conversation()
+    conv.summary = row["summary"] if row else ""
+    for r in rows:
+        conv.turns.append(_Turn(r["id"], r["role"], r["content"], r["tokens"]))
+        conv.tokens += r["tokens"]
+    return conv
+
+
+def _get(user_id: int) -> _Conversation:
+    """Разговор из кэша или базы; просроченный (CONV_TTL_SEC) — пустой."""
+    if not _schema_ready:
+        init_db()
+    with _cache_lock:
+        conv = _cache.get(user_id)
+        if conv is not None:
+            _cache.move_to_end(user_id)
+    if conv is not None and not _expired(conv):
+        return conv
+    stale = conv is not None
+    conn = _connect()
+    try:
+        if stale:  # протух в памяти — и в базе тоже
+            _delete(conn, user_id)
+            conv = _Conversation()
+        else:
+            conv = _load(conn, user_id)
+    finally:
+        conn.close()
+    with _cache_lock:
+        if stale:
+            _cache[user_id] = conv
+        else:  # пока читали базу, разговор мог загрузить соседний поток
+            conv = _cache.setdefault(user_id, conv)
+        _cache.move_to_end(user_id)
+        while len(_cache) > CONV_CACHE_USERS:
+            _cache.popitem(last=False)
+    return conv
+
+
+# ---------- сводка ----------
+def _gist(turn: _Turn) -> str:
+    first = _SENTENCE_END_RE.split(turn.content.strip(), 1)[0].replace("\n", " ")
+    return f"{'Пользователь' if turn.role == 'user' else 'Ты'}: {trim_to_tokens(first, 40)}"
+
+
+def _fold(conv: _Conversation) -> list[_Turn]:
+    """Сворачивает старые реплики сверх бюджета в сводку; последняя пара остаётся всегда."""
+    folded = []
+    while conv.tokens > CONV_HISTORY_TOKENS and len(conv.turns) > 2:
+        turn = conv.turns.popleft()
+        conv.tokens -= turn.tokens
+        folded.append(turn)
+    if folded:
+        lines = conv.summary.splitlines() + [_gist(t) for t in folded]
+        while len(lines) > 1 and estimate_tokens("\n".join(lines)) > CONV_SUMMARY_TOKENS:
+            lines.pop(0)
+        conv.summary = trim_to_tokens("\n".join(lines), CONV_SUMMARY_TOKENS)
+    return folded
+
+
+# ---------- API для main.py ----------
+def history(user_id: int) -> list[dict]:
+    """Сообщения для запроса к модели между system prompt и новым вопросом."""
+    conv = _get(user_id)
+    with conv.lock:
+        messages = [{"role": "system", "content": SUMMARY_INTRO + conv.summary}] if conv.summary else []
+        messages.extend({"role": t.role, "content": t.content} for t in conv.turns)
+    return messages
+
+
+def add_exchange(user_id: int, question: str, answer: str) -> None:
+    """Запоминает вопрос и ответ; при переполнении бюджета сворачивает старое."""
+    conv = _get(user_id)
+    answer = trim_to_tokens(answer.strip(), CONV_TURN_TOKENS)
+    conn = _connect()
+    try:
+        with conv.lock, conn:
+            for role, content in (("user", question), ("assistant", answer)):
+                tokens = estimate_tokens(content)
+                cur = conn.execute(
+                    "INSERT INTO conversation_turns(user_id, role, content, tokens) VALUES (?, ?, ?, ?)",
+                    (user_id, role, content, tokens))
+                conv.turns.append(_Turn(cur.lastrowid, role, content, tokens))
+                conv.tokens += tokens
+            folded = _fold(conv)
+            if folded:
+                conn.execute("DELETE FROM conversation_turns WHERE user_id = ? AND id <= ?",
+                             (user_id, folded[-1].id))
+                conn.execute(
+                    "INSERT INTO conversation_summary(user_id, summary) VALUES (?, ?) "
+                    "ON CONFLICT(user_id) DO UPDATE SET summary = excluded.summary, updated_at = CURRENT_TIMESTAMP",
+                    (user_id, conv.summary))
+            conv.last_active = time.time()
+    except sqlite3.Error as e:
+        # ответ пользователь уже получил; память в кэше могла разойтись с базой — перечитаем
+        log.error("Не удалось сохранить реплики user_id=%s: %r", user_id, e)
+        with _cache_lock:
+            _cache.pop(user_id, None)
+    finally:
+        conn.close()
+
+
+def reset(user_id: int) -> bool:
+    """Забывает разговор; True — было что забывать."""
+    conv = _get(user_id)
+    had = bool(conv.turns or conv.summary)
+    with _cache_lock:
+        _cache.pop(user_id, None)
+    conn = _connect()
+    try:
+        _delete(conn, user_id)
+    finally:
+        conn.close()
+    return had
+
+
+register_policy(DB_PATH, "conversation_turns", "created_at", CONV_RETENTION_DAYS)
+register_policy(DB_PATH, "conversation_summary", "updated_at", CONV_RETENTION_DAYS)
+register_gauge("conversation: разговоров в памяти", lambda: len(_cache))
@@ -1,9 +1,16 @@
 import os
 from dotenv import load_dotenv
 import telebot
+from telebot import apihelper
 import time
+import sqlite3
 from datetime import datetime, timedelta
-from db import init_db, add_note, list_notes, update_note, delete_note, find_notes, count_notes
+from db import DB_PATH, init_db, add_note, list_notes, update_note, delete_note, find_notes, count_notes
+from webhook import run_bot
+from logsetup import setup_logging
+import perf
+import metrics
+import profiling
 
 # Загрузка переменных окружения
 load_dotenv()
@@ -11,6 +18,11 @@ TOKEN = os.getenv("TOKEN")
 if not TOKEN:
     raise RuntimeError("В .env файле нет TOKEN")
 
+# Настройка логирования: очередь + поток записи, JSON в logs/crud.log (см. logsetup.py)
+setup_logging("crud")
+
+if os.getenv("TELEGRAM_API_URL"):
+    apihelper.API_URL = os.getenv("TELEGRAM_API_URL")  # локальный/фейковый Bot API
 bot = telebot.TeleBot(TOKEN)
 
 # Инициализация базы данных при запуске
@@ -63,7 +75,7 @@ def note_add(message):
 @bot.message_handler(commands=['note_list'])
 def note_list(message):
     user_id = message.from_user.id
-    user_notes = list_notes(user_id)
+    user_notes = list_notes(user_id, preview=True)  # длинные заметки — превью, без распаковки
 
     if not user_notes:
         bot.reply_to(message, "Заметок пока нет.")
@@ -197,9 +209,23 @@ def note_stats(message):
     bot.reply_to(message, response)
 
 
+@bot.message_handler(commands=['perf'])
+def perf_cmd(message):
+    perf.send_report(bot, message)
+
+
+@bot.message_handler(commands=['profile'])
+def profile_cmd(message):
+    profiling.handle_command(bot, message, message.text.partition(' ')[2])
+
+
+# Время каждого обработчика — и при запуске python crud.py, и из host.py
+metrics.instrument_bot(bot, "crud")
+
+
 def get_weekly_stats(user_id):
     """Получает статистику заметок за последние 7 дней"""
-    conn = sqlite3.connect('notes.db')
+    conn = sqlite3.connect(DB_PATH)
     cursor = conn.cursor()
 
     # Получаем дату 7 дней назад
@@ -250,4 +276,4 @@ def create_ascii_chart(stats):
 
 if __name__ == "__main__":
     print("Бот запускается...")
-    bot.infinity_polling()
\ No newline at end of file
+    run_bot(bot)  # long polling или webhook — по BOT_MODE
\ No newline at end of file
@@ -1,24 +1,129 @@
 # db.py
+import os
+import zlib
 import sqlite3
+import threading
 from datetime import datetime
 from contextlib import contextmanager
 from typing import List, Optional
 
+from metrics import instrument_module
+
+try:
+    import zstandard  # необязательная зависимость: без неё работает zlib
+except ImportError:
+    zstandard = None
+
+DB_PATH = os.getenv("NOTES_DB_PATH", "notes.db")
+
+# Сжатие больших заметок: тексты длиннее порога (в байтах UTF-8) хранятся
+# в notes.body сжатыми, а в notes.text остаётся короткое превью для списков.
+NOTE_COMPRESS_THRESHOLD = int(os.getenv("NOTE_COMPRESS_THRESHOLD", "1024"))
+NOTE_CODEC = os.getenv("NOTE_CODEC", "zlib")  # zlib | zstd
+NOTE_PREVIEW_CHARS = int(os.getenv("NOTE_PREVIEW_CHARS", "200"))
+
+CODEC_PLAIN = 0
+CODEC_ZLIB = 1
+CODEC_ZSTD = 2
+
 
 @contextmanager
 def _connect():
     """Контекстный менеджер для работы с базой данных"""
-    conn = sqlite3.connect('notes.db')
+    conn = sqlite3.connect(DB_PATH)
     conn.row_factory = sqlite3.Row  # Позволяет обращаться к колонкам по имени
+    # note_text(text, codec, dict_id, body) — полный текст заметки прямо в SQL (для поиска)
+    conn.create_function('note_text', 4, _decode_note, deterministic=True)
     try:
         yield conn
     finally:
         conn.close()
 
 
+# ---------- кодеки для тел заметок ----------
+_dicts: dict = {}  # dict_id -> (codec, bytes), словари неизменны — кэшируем навсегда
+_dicts_lock = threading.Lock()
+
+
+def _get_dict(dict_id: int) -> tuple:
+    d = _dicts.get(dict_id)
+    if d is None:
+        conn = sqlite3.connect(DB_PATH)
+        try:
+            row = conn.execute('SELECT codec, data FROM note_dicts WHERE id = ?', (dict_id,)).fetchone()
+        finally:
+            conn.close()
+        if not row:
+            raise RuntimeError(f"Словарь сжатия #{dict_id} не найден")
+        with _dicts_lock:
+            d = _dicts.setdefault(dict_id, (row[0], bytes(row[1])))
+    return d
+
+
+def _active_codec() -> int:
+    if NOTE_CODEC == 'zstd' and zstandard is not None:
+        return CODEC_ZSTD
+    return CODEC_ZLIB
+
+
+def _compress(data: bytes, codec: int, zdict: Optional[bytes]) -> bytes:
+    if codec == CODEC_ZSTD:
+        d = zstandard.ZstdCompressionDict(zdict) if zdict else None
+        return zstandard.ZstdCompressor(level=6, dict_data=d).compress(data)
+    c = zlib.compressobj(6, zdict=zdict) if zdict else zlib.compressobj(6)
+    return c.compress(data) + c.flush()
+
+
+def _decompress(data: bytes, codec: int, zdict: Optional[bytes]) -> bytes:
+    if codec == CODEC_ZSTD:
+        if zstandard is None:
+            raise RuntimeError("Заметка сжата zstd, а пакет zstandard не установлен")
+        d = zstandard.ZstdCompressionDict(zdict) if zdict else None
+        return zstandard.ZstdDecompressor(dict_data=d).decompress(data)
+    d = zlib.decompressobj(zdict=zdict) if zdict else zlib.decompressobj()
+    return d.decompress(data) + d.flush()
+
+
+def _decode_note(text, codec, dict_id, body):
+    """Полный текст заметки по колонкам строки notes."""
+    if not codec:
+        return text
+    zdict = _get_dict(dict_id)[1] if dict_id else None
+    return _decompress(bytes(body), codec, zdict).decode('utf-8')
+
+
+def _latest_dict_id(conn, codec: int) -> Optional[int]:
+    row = conn.execute('SELECT MAX(id) FROM note_dicts WHERE codec = ?', (codec,)).fetchone()
+    return row[0] if row else None
+
+
+def _encode_note(conn, text: str) -> tuple:
+    """
+    Возвращает значения колонок (text, codec, dict_id, body) для записи.
+    Короткие заметки хранятся как есть, длинные — сжатыми с превью.
+    """
+    raw = text.encode('utf-8')
+    if len(raw) <= NOTE_COMPRESS_THRESHOLD:
+        return text, CODEC_PLAIN, None, None
+    codec = _active_codec()
+    dict_id = _latest_dict_id(conn, codec)
+    zdict = _get_dict(dict_id)[1] if dict_id else None
+    body = _compress(raw, codec, zdict)
+    if len(body) >= len(raw):  # несжимаемое — нет смысла
+        return text, CODEC_PLAIN, None, None
+    return text[:NOTE_PREVIEW_CHARS], codec, dict_id, body
+
+
 def init_db():
     """Инициализация базы данных - создание таблицы, если она не существует"""
     with _connect() as conn:
+        # WAL: читатели (в т.ч. онлайн-бэкап, см. backup.py) не блокируют запись.
+        # Режим хранится в самом файле, поэтому достаточно выставить один раз.
+        # auto_vacuum до создания таблиц: новая база сразу умеет incremental_vacuum
+        # (существующую переводит retention.py).
+        conn.execute('PRAGMA auto_vacuum = INCREMENTAL')
+        conn.execute('PRAGMA journal_mode = WAL')
+
         cursor = conn.cursor()
 
         # Создаем таблицу с правильной структурой
@@ -47,6 +152,27 @@ def init_db():
             )
         ''')
 
+        # Колонки для сжатых заметок (миграция старых баз).
+        # body добавляется последней: SQLite не читает её страницы переполнения,
+        # если колонка не запрошена, поэтому списки по превью остаются дешёвыми.
+        columns = {r['name'] for r in cursor.execute('PRAGMA table_info(notes)')}
+        if 'codec' not in columns:
+            cursor.execute('ALTER TABLE notes ADD COLUMN codec INTEGER NOT NULL DEFAULT 0')
+        if 'dict_id' not in columns:
+            cursor.execute('ALTER TABLE notes ADD COLUMN dict_id INTEGER')
+        if 'body' not in columns:
+            cursor.execute('ALTER TABLE notes ADD COLUMN body BLOB')
+
+        # Общие словари сжатия, обученные на существующих заметках (см. train_note_dict)
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS note_dicts (
+                id INTEGER PRIMARY KEY,
+                codec INTEGER NOT NULL,
+                data BLOB NOT NULL,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+
         # СОЗДАНИЕ ТАБЛИЦЫ ДЛЯ ХРАНЕНИЯ ПЕРСОНАЖЕЙ
         cursor.execute('''
             CREATE TABLE IF NOT EXISTS characters (
@@ -56,6 +182,11 @@ def init_db():
             )
         ''')
 
+        # Короткий вариант промпта персонажа для компактного system prompt (prompt_budget.py)
+        columns = {r['name'] for r in cursor.execute('PRAGMA table_info(characters)')}
+        if 'prompt_short' not in columns:
+            cursor.execute('ALTER TABLE characters ADD COLUMN prompt_short TEXT')
+
         # СОЗДАНИЕ ТАБЛИЦЫ СВЯЗЕЙ ПОЛЬЗОВАТЕЛЕЙ И ПЕРСОНАЖЕЙ
         cursor.execute('''
             CREATE TABLE IF NOT EXISTS user_character (
@@ -90,6 +221,21 @@ def init_db():
             (11, 'Бендер', 'Ты отвечаешь строго в образе «Бендера» из «Футурамы». Стиль: дерзко, саркастично, с роботизированным цинизмом и жаждой наживы.')
         ''')
 
+        # Короткие промпты: только для тех, где их ещё нет (не затираем изменённые вручную)
+        cursor.executemany('UPDATE characters SET prompt_short = ? WHERE id = ? AND prompt_short IS NULL', [
+            ('Ты — Иода («Звёздные войны»): мудро, загадочно, коротко, с инверсией слов.', 1),
+            ('Ты — Дарт Вейдер («Звёздные войны»): властно, угрожающе, с имперским величием.', 2),
+            ('Ты — Спок («Звёздный путь»): логично, без эмоций, с вулканской мудростью.', 3),
+            ('Ты — Тони Старк (Marvel): саркастично, остроумно, с техническими метафорами.', 4),
+            ('Ты — Шерлок Холмс: дедукция шаг за шагом, аналитично, по-британски.', 5),
+            ('Ты — капитан Джек Воробей: иронично, эксцентрично, с пиратским юмором.', 6),
+            ('Ты — Гэндальф («Властелин колец»): мудро, наставительно, таинственно.', 7),
+            ('Ты — Винни-Пух: просто, добродушно, наивно, с мыслями о мёде.', 8),
+            ('Ты — Голум («Властелин колец»): шипяще, двусмысленно, споришь сам с собой.', 9),
+            ('Ты — Рик («Рик и Морти»): цинично, с научным сарказмом.', 10),
+            ('Ты — Бендер («Футурама»): дерзко, саркастично, с цинизмом робота.', 11),
+        ])
+
         conn.commit()
 
 
@@ -134,18 +280,27 @@ def add_note(user_id, text):
     """Добавление новой заметки"""
     with _connect() as conn:
         cursor = conn.cursor()
-        cursor.execute('INSERT INTO notes (user_id, text) VALUES (?, ?)', (user_id, text))
+        cursor.execute('INSERT INTO notes (user_id, text, codec, dict_id, body) VALUES (?, ?, ?, ?, ?)',
+                       (user_id, *_encode_note(conn, text)))
         note_id = cursor.lastrowid
         conn.commit()
         return note_id
 
 
-def list_notes(user_id):
-    """Получение всех заметок пользователя"""
+def list_notes(user_id, preview=False):
+    """
+    Получение всех заметок пользователя.
+    preview=True — для списков: длинные заметки отдаются превью без распаковки.
+    """
     with _connect() as conn:
         cursor = conn.cursor()
-        cursor.execute('SELECT id, text FROM notes WHERE user_id = ? ORDER BY id', (user_id,))
-        notes = [{'id': row[0], 'text': row[1]} for row in cursor.fetchall()]
+        if preview:
+            cursor.execute('SELECT id, created_at, text, codec FROM notes WHERE user_id = ? ORDER BY id', (user_id,))
+            return [{'id': row[0], 'created_at': row[1], 'text': row[2] + ('…' if row[3] else '')}
+                    for row in cursor.fetchall()]
+        cursor.execute('SELECT id, created_at, text, codec, dict_id, body FROM notes WHERE user_id = ? ORDER BY id',
+                       (user_id,))
+        notes = [{'id': row[0], 'created_at': row[1], 'text': _decode_note(*row[2:])} for row in cursor.fetchall()]
         return notes
 
 
@@ -153,7 +308,8 @@ def update_note(user_id, note_id, new_text):
     """Обновление заметки"""
     with _connect() as conn:
         cursor = conn.cursor()
-        cursor.execute('UPDATE notes SET text = ? WHERE id = ? AND user_id = ?', (new_text, note_id, user_id))
+        cursor.execute('UPDATE notes SET text = ?, codec = ?, dict_id = ?, body = ? WHERE id = ? AND user_id = ?',
+                       (*_encode_note(conn, new_text), note_id, user_id))
         rows_affected = cursor.rowcount
         conn.commit()
         return rows_affected > 0
@@ -173,8 +329,13 @@ def find_notes(user_id, query):
     """Поиск заметок по тексту"""
     with _connect() as conn:
         cursor = conn.cursor()
-        cursor.execute('SELECT id, text FROM notes WHERE user_id = ? AND text LIKE ? ORDER BY id',
-                       (user_id, f'%{query}%'))
+        # несжатые заметки проверяются по колонке text, сжатые — распаковкой в note_text()
+        cursor.execute('''
+            SELECT id, note_text(text, codec, dict_id, body) AS full_text FROM notes
+            WHERE user_id = ?
+              AND CASE WHEN codec = 0 THEN text ELSE note_text(text, codec, dict_id, body) END LIKE ?
+            ORDER BY id
+        ''', (user_id, f'%{query}%'))
         notes = [{'id': row[0], 'text': row[1]} for row in cursor.fetchall()]
         return notes
 
@@ -188,6 +349,41 @@ def count_notes(user_id):
         return count
 
 
+def train_note_dict(sample_limit=2000, dict_size=16 * 1024):
+    """
+    Обучает общий словарь сжатия на последних заметках и сохраняет его.
+    Новые длинные заметки сжимаются с ним; старые остаются со своим dict_id.
+    Возвращает id словаря или None, если обучать не на чем.
+    """
+    codec = _active_codec()
+    with _connect() as conn:
+        rows = conn.execute(
+            'SELECT text, codec, dict_id, body FROM notes ORDER BY id DESC LIMIT ?', (sample_limit,)
+        ).fetchall()
+        samples = [_decode_note(*r).encode('utf-8') for r in rows]
+        if not samples:
+            return None
+
+        if codec == CODEC_ZSTD:
+            data = zstandard.train_dictionary(dict_size, samples).as_bytes()
+        else:
+            # zlib не умеет обучать словарь: берём частые фрагменты из образцов,
+            # самые частые — в конец (zlib дешевле ссылается на близкие байты)
+            counts = {}
+            for sample in samples:
+                for i in range(0, len(sample), 64):
+                    chunk = sample[i:i + 64]
+                    counts[chunk] = counts.get(chunk, 0) + 1
+            best = sorted((c for c in counts.items() if c[1] > 1), key=lambda c: c[1])
+            data = b''.join(chunk for chunk, _ in best)[-min(dict_size, 32 * 1024):]
+            if not data:
+                return None
+
+        cur = conn.execute('INSERT INTO note_dicts (codec, data) VALUES (?, ?)', (codec, data))
+        conn.commit()
+        return cur.lastrowid
+
+
 def list_characters() -> List[dict]:
     """Получение списка персонажей"""
     with _connect() as conn:
@@ -195,14 +391,18 @@ def list_characters() -> List[dict]:
         return [{"id": r["id"], "name": r["name"]} for r in rows]
 
 
+def _character(row) -> dict:
+    return {'id': row['id'], 'name': row['name'], 'prompt': row['prompt'], 'prompt_short': row['prompt_short']}
+
+
 def get_character_by_id(character_id: int) -> Optional[dict]:
     """Получение персонажа по ID"""
     with _connect() as conn:
         row = conn.execute(
-            "SELECT id, name, prompt FROM characters WHERE id=?",
+            "SELECT id, name, prompt, prompt_short FROM characters WHERE id=?",
             (character_id,)
         ).fetchone()
-        return {'id': row["id"], 'name': row["name"], 'prompt': row["prompt"]} if row else None
+        return _character(row) if row else None
 
 
 def set_user_character(user_id: int, character_id: int) -> dict:
@@ -229,7 +429,7 @@ def get_user_character(user_id: int) -> dict:
     with _connect() as conn:
         row = conn.execute(
             """
-            SELECT p.id, p.name, p.prompt
+            SELECT p.id, p.name, p.prompt, p.prompt_short
             FROM user_character up
             JOIN characters p ON p.id = up.character_id
             WHERE up.telegram_user_id = ?
@@ -238,18 +438,18 @@ def get_user_character(user_id: int) -> dict:
         ).fetchone()
 
         if row:
-            return {'id': row['id'], 'name': row['name'], 'prompt': row['prompt']}
+            return _character(row)
 
         # Если у пользователя нет персонажа - берем Иоду (id=1), иначе первую запись
-        row = conn.execute('SELECT id, name, prompt FROM characters WHERE id=1').fetchone()
+        row = conn.execute('SELECT id, name, prompt, prompt_short FROM characters WHERE id=1').fetchone()
         if row:
-            return {'id': row['id'], 'name': row['name'], 'prompt': row['prompt']}
+            return _character(row)
 
-        row = conn.execute('SELECT id, name, prompt FROM characters ORDER BY id LIMIT 1').fetchone()
+        row = conn.execute('SELECT id, name, prompt, prompt_short FROM characters ORDER BY id LIMIT 1').fetchone()
         if not row:
             raise RuntimeError("Таблица characters пуста")
 
-        return {'id': row['id'], 'name': row['name'], 'prompt': row['prompt']}
+        return _character(row)
 
 
 def get_character_prompt_for_user(user_id: int) -> str:
@@ -277,4 +477,8 @@ def add_model(key, label, active=False):
         model_id = cursor.lastrowid
 
         conn.commit()
-        return model_id
\ No newline at end of file
+        return model_id
+
+
+# время и ошибки каждой публичной функции — db_call_seconds{module="db"} (metrics.py)
+instrument_module(globals(), "db")
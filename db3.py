@@ -4,22 +4,41 @@ db.py — слой данных для DailyZodiakBot.
 Таблица users:
   - user_id (PK)             — Telegram user id
   - sign                     — знак зодиака (строка из списка)
-  - notify_hour INTEGER      — час суток (0..23), когда слать сообщение
+  - notify_hour INTEGER      — час суток (0..23) по местному времени пользователя
+  - notify_minute INTEGER    — минута (0..59)
+  - tz TEXT                  — часовой пояс IANA ('Europe/Moscow')
   - subscribed INTEGER       — 1/0 — подписка включена/выключена
-  - last_sent_date TEXT      — 'YYYY-MM-DD', чтобы не слать повторно за день
+  - last_sent_date TEXT      — 'YYYY-MM-DD' (местная дата), чтобы не слать повторно за день
+  - next_send_at INTEGER     — момент следующей отправки, unix-время UTC;
+                               NULL — слать некому (нет знака или подписки)
 
 Приёмы:
-  - отдельное подключение под каждую операцию (with _connect());
+  - отдельное подключение под каждую операцию (with _connect()); команды
+    профиля — на подключении потока, одной инструкцией upsert и через кэш строк;
+  - next_send_at пересчитывается при каждой смене настроек и после отправки,
+    поэтому «кому пора» — диапазонный проход по индексу next_send_at <= now:
+    стоимость зависит от числа должников, а не от размера таблицы;
+  - рассылка читает должников страницами и сдвигает их пачкой (executemany);
+  - доставки идут через таблицу outbox (см. раздел outbox ниже);
+  - при нескольких репликах планирует только держатель аренды leases
+    (см. раздел «аренда лидера»);
   - PRAGMA: WAL + busy_timeout + row_factory=Row (см. Л3) [oai_citation:5‡L3.pdf](file-service://file-TzQZFVK22mksuAGPBby5ME);
   - все SQL — параметризованные через "?" (никаких f-строк).
 """
 
 from __future__ import annotations
+import time
 import sqlite3
 import logging
-from typing import Optional
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Iterable, Iterator, Optional
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
 
-from config3 import DB_PATH, DEFAULT_NOTIFY_HOUR
+from config3 import DB_PATH, DEFAULT_NOTIFY_HOUR, DEFAULT_TZ, PROFILE_CACHE_TTL
+from metrics import instrument_module
+from profiling import register_gauge
 
 log = logging.getLogger(__name__)
 
@@ -29,19 +48,54 @@ def _connect() -> sqlite3.Connection:
     conn = sqlite3.connect(DB_PATH, timeout=5.0)
     conn.row_factory = sqlite3.Row
     conn.execute("PRAGMA foreign_keys = ON")
-    conn.execute("PRAGMA journal_mode = WAL")
     conn.execute("PRAGMA busy_timeout = 5000")
     return conn
 # WAL + busy_timeout уменьшают «database is locked», row_factory даёт доступ к полям по имени [oai_citation:6‡L3.pdf](file-service://file-TzQZFVK22mksuAGPBby5ME)
+# journal_mode хранится в файле базы — включаем его один раз в init_db(), а не на каждое подключение.
+
+
+# ---------- время рассылки ----------
+def valid_tz(name: str) -> bool:
+    try:
+        ZoneInfo(name)
+        return True
+    except (ZoneInfoNotFoundError, ValueError):
+        return False
+
+
+def next_send_ts(tz: str, hour: int, minute: int, after_ts: float,
+                 last_sent_date: str | None = None) -> int:
+    """
+    Ближайший момент hour:minute по местному времени tz строго после after_ts
+    (unix UTC). День, за который уже отправляли (last_sent_date), пропускается.
+    """
+    zone = ZoneInfo(tz)
+    local = datetime.fromtimestamp(after_ts, zone)
+    slot = local.replace(hour=hour, minute=minute, second=0, microsecond=0)
+    while slot.timestamp() <= after_ts or slot.date().isoformat() == last_sent_date:
+        slot = (slot + timedelta(days=1)).replace(hour=hour, minute=minute)  # переход через DST
+    return int(slot.timestamp())
+
+
+def _next_for_row(row, after_ts: float) -> Optional[int]:
+    return _next_slot(row["subscribed"], row["sign"], row["tz"], row["notify_hour"],
+                      row["notify_minute"], row["last_sent_date"], after_ts)
+
+
+def _now_ts() -> float:
+    return datetime.now(timezone.utc).timestamp()
 
 
 # ---------- инициализация схемы ----------
 def init_db() -> None:
     """
-    Создаёт таблицу users, если её нет.
+    Создаёт таблицу users, если её нет, и докатывает колонки расписания
+    на старые базы (с расчётом next_send_at для уже подписанных).
     Простейшие разумные дефолты; CHECK-ограничения оставим на стороне логики.
     """
     schema = """
+    PRAGMA auto_vacuum = INCREMENTAL;
+
     CREATE TABLE IF NOT EXISTS users (
         user_id        INTEGER PRIMARY KEY,
         sign           TEXT,
@@ -55,59 +109,467 @@ def init_db() -> None:
     """
     with _connect() as conn:
         conn.executescript(schema)
+        conn.execute("PRAGMA journal_mode = WAL")
+        columns = {r["name"] for r in conn.execute("PRAGMA table_info(users)")}
+        if "tz" not in columns:
+            conn.execute("ALTER TABLE users ADD COLUMN tz TEXT NOT NULL DEFAULT ''")
+            conn.execute("UPDATE users SET tz = ?", (DEFAULT_TZ,))
+        if "notify_minute" not in columns:
+            conn.execute("ALTER TABLE users ADD COLUMN notify_minute INTEGER NOT NULL DEFAULT 0")
+        if "next_send_at" not in columns:
+            conn.execute("ALTER TABLE users ADD COLUMN next_send_at INTEGER")
+            now = _now_ts()
+            rows = conn.execute(
+                "SELECT * FROM users WHERE subscribed = 1 AND sign IS NOT NULL"
+            ).fetchall()
+            conn.executemany(
+                "UPDATE users SET next_send_at = ? WHERE user_id = ?",
+                ((_next_for_row(r, now), r["user_id"]) for r in rows)
+            )
+            log.info("DB migrated: next_send_at for %d users", len(rows))
+        conn.executescript(OUTBOX_SCHEMA)
+        conn.executescript(FORECASTS_SCHEMA)
+        conn.executescript(LEASES_SCHEMA)
+        # частичный покрывающий индекс: в нём только те, кому есть что слать, и все
+        # поля для отправки — выборка должников читает подряд идущие страницы индекса
+        conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_users_next "
+            "ON users(next_send_at, user_id, sign, tz, notify_hour, notify_minute) "
+            "WHERE next_send_at IS NOT NULL"
+        )
     log.info("DB initialized: %s", DB_PATH)
 
 
-# ---------- upsert/получение пользователя ----------
+# ---------- профиль: подключение потока, upsert и кэш ----------
+# Команды бота трогают только строку своего пользователя, поэтому:
+#  - подключение на поток (threading.local) — без connect + PRAGMA на каждый вызов;
+#  - каждая настройка — одна инструкция INSERT ... ON CONFLICT DO UPDATE ... RETURNING:
+#    заодно создаёт строку и пересчитывает next_send_at (SQL-функция next_slot);
+#  - строка из RETURNING кладётся в ограниченный LRU-кэш (write-through),
+#    чтение профиля при попадании в кэш в базу не ходит.
+# Кэш — на процесс, и другие реплики о нём не знают: /set_sign, /set_tz,
+# /unsubscribe через соседнюю реплику меняют строку только в базе. Поэтому запись
+# живёт в кэше не дольше PROFILE_CACHE_TTL секунд — столько здесь может быть
+# виден прежний знак, пояс или подписка (PROFILE_CACHE_TTL=0 выключает кэш).
+# Планирование и доставка кэш не читают: должники и строки outbox берутся
+# запросами к базе, а свой планировщик сбрасывает сдвинутые строки из кэша.
+PROFILE_CACHE_SIZE = 10000
+_local = threading.local()
+_profiles: "OrderedDict[int, tuple[sqlite3.Row, float]]" = OrderedDict()  # строка, срок годности
+_profiles_lock = threading.Lock()
+
+_UPSERT_PROFILE_SQL = """
+INSERT INTO users(user_id, sign, notify_hour, notify_minute, tz, subscribed, next_send_at)
+VALUES (?1, ?2, COALESCE(?3, ?7), COALESCE(?4, 0), COALESCE(?5, ?8), COALESCE(?6, 1),
+        next_slot(COALESCE(?6, 1), ?2, COALESCE(?5, ?8), COALESCE(?3, ?7), COALESCE(?4, 0), NULL, ?9))
+ON CONFLICT(user_id) DO UPDATE SET
+    sign          = COALESCE(?2, sign),
+    notify_hour   = COALESCE(?3, notify_hour),
+    notify_minute = COALESCE(?4, notify_minute),
+    tz            = COALESCE(?5, tz),
+    subscribed    = COALESCE(?6, subscribed),
+    -- уже наступивший, но ещё не отправленный слот не перескакиваем на завтра
+    next_send_at  = next_slot(COALESCE(?6, subscribed), COALESCE(?2, sign), COALESCE(?5, tz),
+                              COALESCE(?3, notify_hour), COALESCE(?4, notify_minute), last_sent_date,
+                              MIN(?9, COALESCE(next_send_at, ?9 + 1) - 1))
+RETURNING *
+"""
+
+
+def _next_slot(subscribed, sign, tz, hour, minute, last_sent_date, after_ts) -> Optional[int]:
+    if not subscribed or not sign:
+        return None
+    return next_send_ts(tz, hour, minute, after_ts, last_sent_date)
+
+
+def _db() -> sqlite3.Connection:
+    """Подключение текущего потока: открывается один раз и живёт вместе с потоком."""
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        conn = _connect()
+        conn.create_function("next_slot", 7, _next_slot)
+        _local.conn = conn
+    return conn
+
+
+def _cache_get(user_id: int) -> Optional[sqlite3.Row]:
+    with _profiles_lock:
+        entry = _profiles.get(user_id)
+        if entry is None:
+            return None
+        row, expires = entry
+        if time.monotonic() >= expires:  # могла поменяться через другую реплику — перечитаем
+            del _profiles[user_id]
+            return None
+        _profiles.move_to_end(user_id)
+        return row
+
+def _cache_put(row: sqlite3.Row) -> None:
+    if PROFILE_CACHE_TTL <= 0:
+        return
+    with _profiles_lock:
+        _profiles[row["user_id"]] = (row, time.monotonic() + PROFILE_CACHE_TTL)
+        _profiles.move_to_end(row["user_id"])
+        while len(_profiles) > PROFILE_CACHE_SIZE:
+            _profiles.popitem(last=False)
+
+def _cache_drop(user_ids: Iterable[int]) -> None:
+    with _profiles_lock:
+        for uid in user_ids:
+            _profiles.pop(uid, None)
+
+
+# Подписчики на изменения настроек (например, планировщик в main3.py).
+# Колбэк получает обновлённую строку пользователя (со свежим next_send_at).
+_listeners: list[Callable[[sqlite3.Row], None]] = []
+
+def add_user_listener(fn: Callable[[sqlite3.Row], None]) -> None:
+    _listeners.append(fn)
+
+def _upsert_profile(user_id: int, sign: str | None = None, hour: int | None = None,
+                    minute: int | None = None, tz: str | None = None,
+                    subscribed: int | None = None) -> sqlite3.Row:
+    """
+    Создать строку с дефолтами или поменять заданные (не None) поля —
+    одной инструкцией, вместе с пересчётом next_send_at. Возвращает новую строку.
+    """
+    conn = _db()
+    with conn:
+        row = conn.execute(
+            _UPSERT_PROFILE_SQL,
+            (user_id, sign, hour, minute, tz, subscribed, DEFAULT_NOTIFY_HOUR, DEFAULT_TZ, _now_ts())
+        ).fetchone()
+    _cache_put(row)
+    if (sign, hour, minute, tz, subscribed) != (None,) * 5:
+        for fn in _listeners:
+            fn(row)
+    return row
+
+
+# ---------- получение пользователя ----------
+def profile(user_id: int) -> sqlite3.Row:
+    """Строка пользователя из кэша; если её там нет — создаётся/читается одним upsert."""
+    return _cache_get(user_id) or _upsert_profile(user_id)
+
 def ensure_user(user_id: int) -> None:
     """Гарантируем наличие строки пользователя с дефолтами."""
+    profile(user_id)
+
+def get_user(user_id: int) -> Optional[sqlite3.Row]:
+    row = _cache_get(user_id)
+    if row is None:
+        row = _db().execute("SELECT * FROM users WHERE user_id = ?", (user_id,)).fetchone()
+        if row is not None:
+            _cache_put(row)
+    return row
+
+
+# ---------- настройки профиля ----------
+# Каждый сеттер заодно создаёт пользователя — отдельный ensure_user не нужен.
+def set_sign(user_id: int, sign: str) -> sqlite3.Row:
+    return _upsert_profile(user_id, sign=sign)
+
+def set_notify_hour(user_id: int, hour: int, minute: int = 0) -> sqlite3.Row:
+    hour = max(0, min(int(hour), 23))
+    minute = max(0, min(int(minute), 59))
+    return _upsert_profile(user_id, hour=hour, minute=minute)
+
+def set_tz(user_id: int, tz: str) -> sqlite3.Row:
+    if not valid_tz(tz):
+        raise ValueError(f"Неизвестный часовой пояс: {tz}")
+    return _upsert_profile(user_id, tz=tz)
+
+def set_subscribed(user_id: int, on: bool) -> sqlite3.Row:
+    return _upsert_profile(user_id, subscribed=1 if on else 0)
+
+
+# ---------- рассылка: выборка и отметка отправки ----------
+def iter_due(now_ts: float, page_size: int = 1000) -> Iterator[list[sqlite3.Row]]:
+    """
+    Должники рассылки (next_send_at <= now_ts) страницами по page_size.
+    Диапазонный проход по idx_users_next с курсором (next_send_at, user_id):
+    недоставленные остаются в диапазоне, но не читаются повторно за проход.
+    """
+    last = (-1, -1)
+    conn = _connect()
+    try:
+        while True:
+            rows = conn.execute(
+                """
+                SELECT user_id, sign, tz, notify_hour, notify_minute, next_send_at
+                FROM users
+                WHERE next_send_at <= ?
+                  AND (next_send_at, user_id) > (?, ?)
+                ORDER BY next_send_at, user_id
+                LIMIT ?
+                """,
+                (int(now_ts), last[0], last[1], page_size)
+            ).fetchall()
+            if not rows:
+                return
+            last = (rows[-1]["next_send_at"], rows[-1]["user_id"])
+            yield rows
+            if len(rows) < page_size:
+                return
+    finally:
+        conn.close()
+
+
+def next_due_ts() -> Optional[int]:
+    """Ближайший next_send_at среди всех — одно чтение края индекса."""
     with _connect() as conn:
-        conn.execute(
-            "INSERT OR IGNORE INTO users(user_id, notify_hour, subscribed) VALUES (?, ?, 1)",
-            (user_id, DEFAULT_NOTIFY_HOUR)
+        return conn.execute("SELECT MIN(next_send_at) FROM users WHERE next_send_at IS NOT NULL").fetchone()[0]
+
+
+def _advance(conn: sqlite3.Connection, rows: Iterable[sqlite3.Row], now_ts: float) -> list[tuple]:
+    """
+    Сдвигает next_send_at пачки на следующий слот; local-дата отправленного
+    слота идёт в last_sent_date. Возвращает [(user_id, sign, send_date)].
+    """
+    updates, sent = [], []
+    for r in rows:
+        zone = ZoneInfo(r["tz"])
+        sent_date = datetime.fromtimestamp(r["next_send_at"], zone).date().isoformat()
+        nxt = next_send_ts(r["tz"], r["notify_hour"], r["notify_minute"],
+                           max(now_ts, r["next_send_at"]), sent_date)
+        updates.append((sent_date, nxt, r["user_id"]))
+        sent.append((r["user_id"], r["sign"], sent_date))
+    conn.executemany("UPDATE users SET last_sent_date = ?, next_send_at = ? WHERE user_id = ?", updates)
+    _cache_drop(u[2] for u in updates)
+    return sent
+
+
+def advance_many(rows: Iterable[sqlite3.Row], now_ts: float) -> None:
+    """Отмечает отправку пачке пользователей (строки из iter_due) одним executemany."""
+    conn = _connect()
+    try:
+        with conn:
+            _advance(conn, rows, now_ts)
+    finally:
+        conn.close()
+
+
+# ---------- outbox: надёжная очередь доставок ----------
+# Планировщик кладёт в outbox «кому и за какую дату» и в той же транзакции
+# сдвигает next_send_at — после падения ничего не теряется и не ставится дважды
+# (ключ идемпотентности UNIQUE(user_id, send_date)). Отправители берут строки
+# в аренду (lease) до lease_until; не подтверждённые (ack) к этому моменту
+# снова становятся доступны. Неудачи повторяются с экспоненциальной паузой,
+# после OUTBOX_MAX_ATTEMPTS строка уходит в dead (dead letter).
+#
+# Статусы: pending -> leased -> sent | pending (повтор) | dead.
+# available_at — когда строку можно взять: для pending — время (повтора),
+# для leased — конец аренды. Так «готовые» и «брошенные» выбираются одним
+# диапазоном по частичному индексу.
+OUTBOX_SCHEMA = """
+CREATE TABLE IF NOT EXISTS outbox (
+    id           INTEGER PRIMARY KEY,
+    user_id      INTEGER NOT NULL,
+    send_date    TEXT NOT NULL,
+    sign         TEXT NOT NULL,
+    status       TEXT NOT NULL DEFAULT 'pending',
+    attempts     INTEGER NOT NULL DEFAULT 0,
+    available_at INTEGER NOT NULL,
+    lease_owner  TEXT,
+    last_error   TEXT,
+    created_at   TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    UNIQUE(user_id, send_date)
+);
+
+CREATE INDEX IF NOT EXISTS idx_outbox_ready ON outbox(available_at)
+    WHERE status IN ('pending', 'leased');
+"""
+
+
+def enqueue_due(rows: list[sqlite3.Row], now_ts: float, fence: tuple | None = None) -> int:
+    """
+    Ставит пачку должников (строки iter_due) в outbox и сдвигает им
+    next_send_at — атомарно. Возвращает число новых строк в очереди.
+    fence — (name, holder, token) аренды лидера: транзакция проходит,
+    только если аренда всё ещё наша (иначе LeaseLost и откат).
+    """
+    conn = _connect()
+    try:
+        with conn:
+            if fence is not None:
+                _check_fence(conn, fence, now_ts)
+            sent = _advance(conn, rows, now_ts)
+            before = conn.total_changes
+            conn.executemany(
+                "INSERT OR IGNORE INTO outbox(user_id, sign, send_date, available_at) VALUES (?, ?, ?, ?)",
+                ((uid, sign, day, int(now_ts)) for uid, sign, day in sent)
+            )
+            return conn.total_changes - before
+    finally:
+        conn.close()
+
+
+def lease_outbox(owner: str, limit: int, lease_sec: int, now_ts: float) -> list[sqlite3.Row]:
+    """Берёт в аренду до limit готовых строк (в т.ч. с истёкшей чужой арендой)."""
+    now = int(now_ts)
+    with _connect() as conn:
+        return conn.execute(
+            """
+            UPDATE outbox
+            SET status = 'leased', lease_owner = ?, available_at = ?, attempts = attempts + 1
+            WHERE id IN (
+                SELECT id FROM outbox
+                WHERE status IN ('pending', 'leased') AND available_at <= ?
+                ORDER BY available_at
+                LIMIT ?
+            )
+            RETURNING id, user_id, sign, send_date, attempts
+            """,
+            (owner, now + lease_sec, now, limit)
+        ).fetchall()
+
+
+def ack_outbox(ids: Iterable[int], owner: str) -> None:
+    """Доставлено. Подтверждает только своя аренда — чужой (перехваченной) ack не засчитывается."""
+    with _connect() as conn:
+        conn.executemany(
+            "UPDATE outbox SET status = 'sent', lease_owner = NULL "
+            "WHERE id = ? AND status = 'leased' AND lease_owner = ?",
+            ((i, owner) for i in ids)
         )
 
-def get_user(user_id: int) -> Optional[sqlite3.Row]:
+
+def retry_outbox(ids: Iterable[int], owner: str, now_ts: float, error: str,
+                 max_attempts: int, base_delay: int) -> None:
+    """Неудача: повтор через base_delay * 2^(attempts-1) или dead после max_attempts."""
     with _connect() as conn:
-        cur = conn.execute("SELECT * FROM users WHERE user_id = ?", (user_id,))
-        return cur.fetchone()
+        conn.executemany(
+            """
+            UPDATE outbox
+            SET status = CASE WHEN attempts >= ? THEN 'dead' ELSE 'pending' END,
+                available_at = ? + (? << (attempts - 1)),
+                lease_owner = NULL, last_error = ?
+            WHERE id = ? AND status = 'leased' AND lease_owner = ?
+            """,
+            ((max_attempts, int(now_ts), base_delay, error, i, owner) for i in ids)
+        )
 
 
-# ---------- настройки профиля ----------
-def set_sign(user_id: int, sign: str) -> None:
+def dead_outbox(ids: Iterable[int], owner: str, error: str) -> None:
+    """Сразу в dead letter — повторять бессмысленно (например, бот заблокирован)."""
     with _connect() as conn:
-        conn.execute("UPDATE users SET sign = ? WHERE user_id = ?", (sign, user_id))
+        conn.executemany(
+            "UPDATE outbox SET status = 'dead', lease_owner = NULL, last_error = ? "
+            "WHERE id = ? AND status = 'leased' AND lease_owner = ?",
+            ((error, i, owner) for i in ids)
+        )
 
-def set_notify_hour(user_id: int, hour: int) -> None:
-    hour = max(0, min(int(hour), 23))
+
+def outbox_next_ready_ts() -> Optional[int]:
     with _connect() as conn:
-        conn.execute("UPDATE users SET notify_hour = ? WHERE user_id = ?", (hour, user_id))
+        return conn.execute(
+            "SELECT MIN(available_at) FROM outbox WHERE status IN ('pending', 'leased')"
+        ).fetchone()[0]
 
-def set_subscribed(user_id: int, on: bool) -> None:
-    val = 1 if on else 0
+
+def outbox_stats() -> dict:
     with _connect() as conn:
-        conn.execute("UPDATE users SET subscribed = ? WHERE user_id = ?", (val, user_id))
+        return {r["status"]: r["n"] for r in
+                conn.execute("SELECT status, COUNT(*) AS n FROM outbox GROUP BY status")}
 
 
-# ---------- рассылка: выборка и отметка отправки ----------
-def list_due_users(today_str: str, hour: int) -> list[sqlite3.Row]:
+# ---------- аренда лидера (несколько реплик main3.py) ----------
+# Строка leases на каждое имя: кто держит (holder), до какого момента
+# (expires_at, unix UTC) и fencing token. Token растёт при каждой смене
+# владельца: запись с устаревшим token'ом (бывший лидер «проснулся» после
+# паузы) отвергается внутри той же транзакции, что и сама запись.
+LEASES_SCHEMA = """
+CREATE TABLE IF NOT EXISTS leases (
+    name       TEXT PRIMARY KEY,
+    holder     TEXT NOT NULL,
+    expires_at REAL NOT NULL,
+    token      INTEGER NOT NULL
+) WITHOUT ROWID;
+"""
+
+
+class LeaseLost(RuntimeError):
+    """Аренда перешла к другому владельцу (или истекла) — писать от имени лидера нельзя."""
+
+
+def acquire_lease(name: str, holder: str, ttl: float, now_ts: float) -> Optional[int]:
     """
-    Вернёт пользователей, кому надо отправить: подписан, час совпал, ещё не отправляли сегодня, знак задан.
+    Взять или продлить аренду name на ttl секунд. Удаётся, если аренды нет,
+    она наша или истекла. Возвращает fencing token либо None (лидер — другой).
+    Одна инструкция UPSERT — проверка и захват атомарны.
     """
     with _connect() as conn:
-        cur = conn.execute(
+        row = conn.execute(
             """
-            SELECT user_id, sign
-            FROM users
-            WHERE subscribed = 1
-              AND sign IS NOT NULL
-              AND notify_hour = ?
-              AND (last_sent_date IS NULL OR last_sent_date <> ?)
+            INSERT INTO leases(name, holder, expires_at, token) VALUES (?, ?, ?, 1)
+            ON CONFLICT(name) DO UPDATE
+            SET token = token + (holder <> excluded.holder),
+                holder = excluded.holder,
+                expires_at = excluded.expires_at
+            WHERE leases.holder = excluded.holder OR leases.expires_at <= ?
+            RETURNING token
             """,
-            (hour, today_str)
-        )
-        return cur.fetchall()
+            (name, holder, now_ts + ttl, now_ts)
+        ).fetchone()
+        return row["token"] if row else None
+
+
+def release_lease(name: str, holder: str) -> None:
+    """Отдать аренду досрочно (при остановке) — резерв подхватит без ожидания ttl."""
+    with _connect() as conn:
+        conn.execute("UPDATE leases SET expires_at = 0 WHERE name = ? AND holder = ?", (name, holder))
 
-def mark_sent_today(user_id: int, today_str: str) -> None:
+
+def _check_fence(conn: sqlite3.Connection, fence: tuple, now_ts: float) -> None:
+    # UPDATE-пустышка, а не SELECT: берёт блокировку записи первой инструкцией
+    # транзакции, так что между проверкой и записью аренду никто не перехватит
+    name, holder, token = fence
+    cur = conn.execute(
+        "UPDATE leases SET token = token WHERE name = ? AND holder = ? AND token = ? AND expires_at > ?",
+        (name, holder, token, now_ts)
+    )
+    if cur.rowcount != 1:
+        raise LeaseLost(f"lease {name!r} is no longer held by {holder} (token {token})")
+
+
+# ---------- календарь прогнозов для /week и /month ----------
+# Строки считаются заранее (main3.ensure_forecasts) на месяц вперёд: 12 знаков x 31 день.
+FORECASTS_SCHEMA = """
+CREATE TABLE IF NOT EXISTS forecasts (
+    sign     TEXT NOT NULL,
+    for_date TEXT NOT NULL,
+    text     TEXT NOT NULL,
+    PRIMARY KEY (sign, for_date)
+) WITHOUT ROWID;
+"""
+
+
+def forecasts_until() -> Optional[str]:
+    """Последняя дата, до которой календарь посчитан ('YYYY-MM-DD')."""
     with _connect() as conn:
-        conn.execute("UPDATE users SET last_sent_date = ? WHERE user_id = ?", (today_str, user_id))
\ No newline at end of file
+        return conn.execute("SELECT MAX(for_date) FROM forecasts").fetchone()[0]
+
+
+def save_forecasts(rows: Iterable[tuple], purge_before: str) -> None:
+    """rows — (sign, for_date, text); заодно удаляет даты раньше purge_before."""
+    conn = _connect()
+    try:
+        with conn:
+            conn.executemany("INSERT OR REPLACE INTO forecasts(sign, for_date, text) VALUES (?, ?, ?)", rows)
+            conn.execute("DELETE FROM forecasts WHERE for_date < ?", (purge_before,))
+    finally:
+        conn.close()
+
+
+def get_forecasts(sign: str, from_date: str, days: int) -> list[str]:
+    with _connect() as conn:
+        rows = conn.execute(
+            "SELECT text FROM forecasts WHERE sign = ? AND for_date >= ? ORDER BY for_date LIMIT ?",
+            (sign, from_date, days)
+        ).fetchall()
+        return [r["text"] for r in rows]
+
+
+# время и ошибки каждой публичной функции — db_call_seconds{module="db3"} (metrics.py)
+instrument_module(globals(), "db3")
+register_gauge("db3: профилей в кэше", lambda: len(_profiles))
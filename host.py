@@ -0,0 +1,100 @@
+"""
+host.py — несколько ботов (main.py, main3.py, crud.py) в одном процессе.
+
+Зачем: три отдельных процесса — трижды интерпретатор, telebot и его
+зависимости, три набора потоков и пулов соединений. Здесь боты импортируются
+как модули одного процесса и запускаются через webhook.run_bots:
+  - общие полосы обработки обновлений (lanes.py) вместо пула на бота;
+  - один пул HTTP-соединений к Bot API (share_http_session);
+  - один HTTP-сервер webhook (путь на бота) или поток getUpdates на бота;
+  - модули баз (db.py / db3.py) и их подключения/кэши — одни на процесс,
+    фоновые бэкап и чистка запускаются один раз для баз всех ботов.
+
+Изоляция: бот, который не импортировался или не стартовал, пропускается
+с ошибкой в логе; исключения обработчиков остаются внутри полосы; упавший
+цикл polling перезапускается.
+
+Запуск:
+  python host.py main main3 crud       (или HOST_BOTS=main,main3,crud в .env)
+
+У каждого бота свой токен: TOKEN_MAIN, TOKEN_MAIN3, TOKEN_CRUD
+(если не задан — общий TOKEN; два бота с одним токеном не запускаются).
+"""
+
+from __future__ import annotations
+import os
+import sys
+import logging
+import importlib
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from backup import start_backup_scheduler
+from retention import start_retention_scheduler
+from webhook import run_bots
+from logsetup import setup_logging
+
+log = logging.getLogger("host")
+
+BOTS = ("main", "main3", "crud")
+
+
+def load_bots(names: list[str]) -> dict:
+    """Импортирует модули ботов; имя -> модуль (с атрибутом bot)."""
+    loaded, tokens = {}, {}
+    default_token = os.getenv("TOKEN")
+    for name in names:
+        if name not in BOTS:
+            log.error("Unknown bot %r (known: %s)", name, ", ".join(BOTS))
+            continue
+        token = os.getenv(f"TOKEN_{name.upper()}") or default_token
+        if not token:
+            log.error("%s: no TOKEN_%s / TOKEN, skipped", name, name.upper())
+            continue
+        if token in tokens.values():
+            log.error("%s: same token as %s — one getUpdates/webhook per token, skipped",
+                      name, next(n for n, t in tokens.items() if t == token))
+            continue
+        os.environ["TOKEN"] = token  # модули ботов читают TOKEN при импорте
+        try:
+            loaded[name] = importlib.import_module(name)
+            tokens[name] = token
+        except Exception as e:
+            log.exception("%s: import failed: %r", name, e)
+    if default_token is not None:
+        os.environ["TOKEN"] = default_token
+    return loaded
+
+
+def main(argv: list[str]) -> None:
+    names = argv or [n.strip() for n in os.getenv("HOST_BOTS", ",".join(BOTS)).split(",") if n.strip()]
+    setup_logging()  # до импорта ботов: basicConfig в их модулях станет no-op
+    modules = load_bots(names)
+    if not modules:
+        raise SystemExit("Нет ни одного бота для запуска")
+
+    for name, mod in modules.items():
+        startup = getattr(mod, "startup", None)
+        if startup:
+            try:
+                startup()
+            except Exception as e:  # меню команд и т.п. — бот всё равно может работать
+                log.exception("%s: startup failed: %r", name, e)
+
+    start_backup_scheduler(sorted({p for mod in modules.values() for p in getattr(mod, "BACKUP_DBS", ())}))
+    start_retention_scheduler()
+    log.info("Hosting bots: %s", ", ".join(modules))
+    try:
+        run_bots({name: mod.bot for name, mod in modules.items()},
+                 {name: getattr(mod, "POLLING", {}) for name, mod in modules.items()})
+    finally:
+        for mod in modules.values():
+            shutdown = getattr(mod, "shutdown", None)
+            if shutdown:
+                shutdown()
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
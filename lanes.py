@@ -0,0 +1,148 @@
+"""
+lanes.py — пул обработчиков с порядком внутри чата.
+
+Зачем:
+  - пул telebot (threaded=True) берёт обновления в любом порядке: два
+    сообщения одного пользователя могут обработаться наоборот — опасно
+    для цепочек register_next_step_handler (/max, /note_add);
+  - строго последовательная обработка безопасна, но один долгий /ask
+    (запрос к модели) задерживает всех остальных.
+
+Решение — N «полос» (lanes): у каждой своя очередь и свой поток,
+chat_id хешируется на полосу. Обновления одного чата идут строго по
+порядку, разные чаты — параллельно. Очереди ограничены: переполнение —
+сигнал перегрузки (webhook ответит 503, polling подождёт).
+
+Наружу — stats(): глубина очереди, число обработанных и время ожидания
+в очереди по каждой полосе.
+
+Настройки: BOT_LANES (число полос, по умолчанию 8), BOT_LANE_DEPTH (ёмкость очереди полосы).
+"""
+
+from __future__ import annotations
+import os
+import time
+import queue
+import logging
+import threading
+from typing import Callable
+
+log = logging.getLogger(__name__)
+
+BOT_LANES = int(os.getenv("BOT_LANES", "8"))
+BOT_LANE_DEPTH = int(os.getenv("BOT_LANE_DEPTH", "256"))
+
+
+def update_chat_key(update) -> int:
+    """Ключ упорядочивания для telebot.types.Update: чат, иначе пользователь, иначе update_id."""
+    for name in ("message", "edited_message", "channel_post", "edited_channel_post"):
+        msg = getattr(update, name, None)
+        if msg is not None:
+            return msg.chat.id
+    for name in ("callback_query", "inline_query", "chosen_inline_result", "shipping_query",
+                 "pre_checkout_query", "my_chat_member", "chat_member", "chat_join_request"):
+        obj = getattr(update, name, None)
+        if obj is not None:
+            msg = getattr(obj, "message", None)
+            if msg is not None and getattr(msg, "chat", None) is not None:
+                return msg.chat.id
+            chat = getattr(obj, "chat", None)
+            if chat is not None:
+                return chat.id
+            return obj.from_user.id
+    return update.update_id
+
+
+def raw_chat_key(data: dict) -> int:
+    """То же для сырого JSON обновления (webhook) — без разбора в объекты telebot."""
+    for name, body in data.items():
+        if not isinstance(body, dict):
+            continue
+        chat = body.get("chat") or (body.get("message") or {}).get("chat")
+        if chat:
+            return chat["id"]
+        user = body.get("from")
+        if user:
+            return user["id"]
+    return data.get("update_id", 0)
+
+
+class _Lane:
+    __slots__ = ("queue", "processed", "errors", "wait_total", "wait_max", "busy_since")
+
+    def __init__(self, depth: int):
+        self.queue: queue.Queue = queue.Queue(maxsize=depth)
+        self.processed = 0
+        self.errors = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.busy_since = 0.0  # когда началась текущая задача (0 — полоса свободна)
+
+
+class LanePool:
+    def __init__(self, lanes: int = BOT_LANES, depth: int = BOT_LANE_DEPTH, name: str = "lane"):
+        self.lanes = [_Lane(depth) for _ in range(max(1, lanes))]
+        for i, lane in enumerate(self.lanes):
+            threading.Thread(target=self._run, args=(lane,), name=f"{name}-{i}", daemon=True).start()
+
+    def submit(self, key: int, fn: Callable[[], object], block: bool = True) -> bool:
+        """
+        Ставит fn в полосу по key. block=False — не ждать места:
+        False, если очередь полосы полна.
+        """
+        lane = self.lanes[hash(key) % len(self.lanes)]
+        try:
+            lane.queue.put((time.monotonic(), fn), block=block)
+        except queue.Full:
+            return False
+        return True
+
+    def _run(self, lane: _Lane) -> None:
+        while True:
+            enqueued, fn = lane.queue.get()
+            start = time.monotonic()
+            wait = start - enqueued
+            lane.wait_total += wait
+            lane.wait_max = max(lane.wait_max, wait)
+            lane.busy_since = start
+            try:
+                fn()
+            except Exception as e:
+                lane.errors += 1
+                log.exception("Lane task failed: %r", e)
+            finally:
+                lane.processed += 1
+                lane.busy_since = 0.0
+
+    def stats(self) -> list[dict]:
+        """Снимок по полосам: depth — ждут в очереди, wait_* — секунды ожидания, busy — сколько идёт текущая задача."""
+        now = time.monotonic()
+        return [
+            {
+                "lane": i,
+                "depth": lane.queue.qsize(),
+                "processed": lane.processed,
+                "errors": lane.errors,
+                "wait_avg": lane.wait_total / lane.processed if lane.processed else 0.0,
+                "wait_max": lane.wait_max,
+                "busy": now - lane.busy_since if lane.busy_since else 0.0,
+            }
+            for i, lane in enumerate(self.lanes)
+        ]
+
+
+def attach(bot, pool: LanePool) -> None:
+    """
+    Переводит бота на полосы: обновления, полученные polling'ом, раскладываются
+    по чатам; обработчики выполняются в потоке полосы (threaded=False).
+    """
+    process = type(bot).process_new_updates  # исходный метод класса
+    bot.threaded = False
+
+    def dispatch(updates) -> None:
+        for u in updates:
+            # смещение getUpdates двигает process_new_updates — сами, раз обработка позже
+            bot.last_update_id = max(bot.last_update_id, u.update_id)
+            pool.submit(update_chat_key(u), lambda u=u: process(bot, [u]))
+
+    bot.process_new_updates = dispatch  # polling зовёт self.process_new_updates
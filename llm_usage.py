@@ -0,0 +1,387 @@
+"""
+llm_usage.py — учёт токенов и стоимости запросов к моделям (main.py).
+
+Каждый ответ OpenRouter (и каждая ошибка) записывается сюда через record():
+  - запись не ждёт диска: строка кладётся в ограниченную очередь, отдельный
+    поток раз в LLM_USAGE_FLUSH_SEC или по LLM_USAGE_BATCH строк пишет пачку
+    одной транзакцией — сырые строки в llm_usage и сразу же суточные сводки
+    по пользователю (llm_usage_user_daily) и по модели (llm_usage_model_daily),
+    upsert'ом с прибавлением (сводка — одна строка на день и пользователя/модель);
+  - отчёты (/whoami, админский /usage) читают только сводки и добавляют к ним
+    ещё не записанное из очереди — без ожидания записи;
+  - дневные лимиты токенов: LLM_DAILY_TOKENS_USER (на пользователя) и
+    LLM_DAILY_TOKENS_TOTAL (на бота); 0 — без лимита. Проверка — тоже сводка
+    плюс очередь, поэтому лимит держится и между пачками. Сутки — по UTC.
+
+Сырые строки хранятся LLM_USAGE_RETENTION_DAYS дней (retention.py), сводки — всегда.
+При переполнении очереди (LLM_USAGE_QUEUE) строки отбрасываются с предупреждением в логе.
+"""
+
+from __future__ import annotations
+import os
+import html
+import time
+import queue
+import atexit
+import sqlite3
+import logging
+import threading
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+
+from dotenv import load_dotenv
+
+from db import DB_PATH
+from retention import register_policy
+from profiling import register_gauge
+import perf
+
+load_dotenv()
+
+LLM_USAGE_BATCH = int(os.getenv("LLM_USAGE_BATCH", "200"))
+LLM_USAGE_FLUSH_SEC = float(os.getenv("LLM_USAGE_FLUSH_SEC", "1.0"))
+LLM_USAGE_QUEUE = int(os.getenv("LLM_USAGE_QUEUE", "10000"))
+LLM_USAGE_RETENTION_DAYS = int(os.getenv("LLM_USAGE_RETENTION_DAYS", "90"))
+LLM_DAILY_TOKENS_USER = int(os.getenv("LLM_DAILY_TOKENS_USER", "0"))
+LLM_DAILY_TOKENS_TOTAL = int(os.getenv("LLM_DAILY_TOKENS_TOTAL", "0"))
+
+log = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS llm_usage (
+    id                INTEGER PRIMARY KEY,
+    created_at        TIMESTAMP NOT NULL,
+    user_id           INTEGER,
+    model             TEXT NOT NULL,
+    status            TEXT NOT NULL,
+    prompt_tokens     INTEGER NOT NULL DEFAULT 0,
+    completion_tokens INTEGER NOT NULL DEFAULT 0,
+    cost              REAL NOT NULL DEFAULT 0,
+    latency_ms        INTEGER NOT NULL DEFAULT 0
+);
+
+CREATE TABLE IF NOT EXISTS llm_usage_user_daily (
+    day               TEXT NOT NULL,
+    user_id           INTEGER NOT NULL,
+    requests          INTEGER NOT NULL DEFAULT 0,
+    errors            INTEGER NOT NULL DEFAULT 0,
+    prompt_tokens     INTEGER NOT NULL DEFAULT 0,
+    completion_tokens INTEGER NOT NULL DEFAULT 0,
+    cost              REAL NOT NULL DEFAULT 0,
+    latency_ms        INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (day, user_id)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS llm_usage_model_daily (
+    day               TEXT NOT NULL,
+    model             TEXT NOT NULL,
+    requests          INTEGER NOT NULL DEFAULT 0,
+    errors            INTEGER NOT NULL DEFAULT 0,
+    prompt_tokens     INTEGER NOT NULL DEFAULT 0,
+    completion_tokens INTEGER NOT NULL DEFAULT 0,
+    cost              REAL NOT NULL DEFAULT 0,
+    latency_ms        INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (day, model)
+) WITHOUT ROWID;
+"""
+
+# upsert сводки: счётчики пачки прибавляются к уже накопленным за день
+_ROLLUP_SQL = """
+INSERT INTO {table}(day, {key}, requests, errors, prompt_tokens, completion_tokens, cost, latency_ms)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT(day, {key}) DO UPDATE SET
+    requests = requests + excluded.requests,
+    errors = errors + excluded.errors,
+    prompt_tokens = prompt_tokens + excluded.prompt_tokens,
+    completion_tokens = completion_tokens + excluded.completion_tokens,
+    cost = cost + excluded.cost,
+    latency_ms = latency_ms + excluded.latency_ms
+"""
+_USER_ROLLUP_SQL = _ROLLUP_SQL.format(table="llm_usage_user_daily", key="user_id")
+_MODEL_ROLLUP_SQL = _ROLLUP_SQL.format(table="llm_usage_model_daily", key="model")
+
+_queue: queue.Queue = queue.Queue(maxsize=LLM_USAGE_QUEUE)
+_lock = threading.Lock()
+_writer: threading.Thread | None = None
+_dropped = 0
+# строки в очереди, ещё не попавшие в сводки, — те же счётчики, что в llm_usage_*_daily:
+# (день, user_id) / (день, model) -> [requests, errors, prompt, completion, cost, latency_ms]
+_pending_users: dict = {}
+_pending_models: dict = {}
+
+
+def _connect() -> sqlite3.Connection:
+    conn = sqlite3.connect(DB_PATH, timeout=5.0)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA busy_timeout = 5000")
+    return conn
+
+
+def init_db() -> None:
+    conn = _connect()
+    try:
+        conn.executescript(SCHEMA)
+    finally:
+        conn.close()
+
+
+def _today() -> str:
+    return datetime.now(timezone.utc).date().isoformat()
+
+
+# ---------- запись ----------
+def record(user_id, model: str, usage: dict | None, latency_ms: int, status: str = "ok") -> None:
+    """Один запрос к модели; usage — блок usage ответа OpenRouter (None при ошибке)."""
+    global _dropped
+    usage = usage or {}
+    now = datetime.now(timezone.utc)
+    row = (now.strftime("%Y-%m-%d %H:%M:%S"), now.date().isoformat(), user_id, model, status,
+           int(usage.get("prompt_tokens") or 0), int(usage.get("completion_tokens") or 0),
+           float(usage.get("cost") or 0.0), int(latency_ms))
+    users, models = _rollup([row])
+    _ensure_writer()
+    with _lock:
+        try:
+            _queue.put_nowait(row)
+        except queue.Full:
+            _dropped += 1
+            return
+        _apply(_pending_users, users, 1)
+        _apply(_pending_models, models, 1)
+
+
+def _ensure_writer() -> None:
+    global _writer
+    if _writer is not None:
+        return
+    with _lock:
+        if _writer is None:
+            init_db()
+            _writer = threading.Thread(target=_run_writer, name="llm-usage", daemon=True)
+            _writer.start()
+
+
+def _run_writer() -> None:
+    while True:
+        batch = [_queue.get()]
+        deadline = time.monotonic() + LLM_USAGE_FLUSH_SEC
+        while len(batch) < LLM_USAGE_BATCH:
+            left = deadline - time.monotonic()
+            try:
+                batch.append(_queue.get(timeout=max(left, 0)) if left > 0 else _queue.get_nowait())
+            except queue.Empty:
+                break
+        try:
+            _write(batch)
+        except Exception as e:  # база занята/сломана — строки потеряны, бот работает дальше
+            log.exception("LLM usage batch of %d rows lost: %r", len(batch), e)
+        finally:
+            _settle(batch)
+            for _ in batch:
+                _queue.task_done()
+
+
+def _rollup(rows: list[tuple]) -> tuple[dict, dict]:
+    """Счётчики сводок по строкам: (день, user_id) и (день, model) -> [req, err, pt, ct, cost, lat]."""
+    users, models = defaultdict(lambda: [0] * 6), defaultdict(lambda: [0] * 6)
+    for created, day, user_id, model, status, prompt, completion, cost, latency in rows:
+        for acc in (users[(day, user_id)], models[(day, model)]):
+            acc[0] += 1
+            acc[1] += status != "ok"
+            acc[2] += prompt
+            acc[3] += completion
+            acc[4] += cost
+            acc[5] += latency
+    return users, models
+
+
+def _apply(pending: dict, rollup: dict, sign: int) -> None:
+    for key, acc in rollup.items():
+        cur = pending.setdefault(key, [0] * 6)
+        for i, v in enumerate(acc):
+            cur[i] += sign * v
+        if cur[0] <= 0:  # строк этого ключа в очереди не осталось
+            del pending[key]
+
+
+def _write(batch: list[tuple]) -> None:
+    users, models = _rollup(batch)
+    conn = _connect()
+    try:
+        with conn:
+            conn.executemany(
+                "INSERT INTO llm_usage(created_at, user_id, model, status, prompt_tokens, completion_tokens, "
+                "cost, latency_ms) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                ((r[0], r[2], r[3], r[4], r[5], r[6], r[7], r[8]) for r in batch))
+            conn.executemany(_USER_ROLLUP_SQL, ((day, uid, *acc) for (day, uid), acc in users.items()
+                                                if uid is not None))
+            conn.executemany(_MODEL_ROLLUP_SQL, ((day, model, *acc) for (day, model), acc in models.items()))
+    finally:
+        conn.close()
+    global _dropped
+    if _dropped:
+        with _lock:
+            dropped, _dropped = _dropped, 0
+        log.warning("LLM usage queue full, dropped %d records", dropped)
+
+
+def _settle(batch: list[tuple]) -> None:
+    """Пачка в сводках (или потеряна) — её строки больше не «в очереди»."""
+    users, models = _rollup(batch)
+    with _lock:
+        _apply(_pending_users, users, -1)
+        _apply(_pending_models, models, -1)
+
+
+def flush(timeout: float = 5.0) -> None:
+    """Дождаться записи всего, что уже в очереди (остановка процесса, проверки)."""
+    if _writer is None:
+        return
+    deadline = time.monotonic() + timeout
+    while _queue.unfinished_tasks and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+
+atexit.register(flush)
+
+
+# ---------- лимиты ----------
+def tokens_today(user_id=None) -> int:
+    """Токены за сегодня: пользователя или (user_id=None) всего бота — сводка плюс очередь."""
+    day = _today()
+    conn = _connect()
+    try:
+        if user_id is None:
+            row = conn.execute("SELECT SUM(prompt_tokens + completion_tokens) FROM llm_usage_model_daily "
+                               "WHERE day = ?", (day,)).fetchone()
+        else:
+            row = conn.execute("SELECT prompt_tokens + completion_tokens FROM llm_usage_user_daily "
+                               "WHERE day = ? AND user_id = ?", (day, user_id)).fetchone()
+    except sqlite3.OperationalError:  # таблиц ещё нет — ничего не потрачено
+        row = None
+    finally:
+        conn.close()
+    with _lock:
+        if user_id is None:
+            pending = sum(acc[2] + acc[3] for (d, _), acc in _pending_models.items() if d == day)
+        else:
+            acc = _pending_users.get((day, user_id))
+            pending = acc[2] + acc[3] if acc else 0
+    return ((row[0] or 0) if row else 0) + pending
+
+
+def check_budget(user_id) -> str | None:
+    """None — можно спрашивать модель; иначе текст, почему нельзя."""
+    if LLM_DAILY_TOKENS_USER and tokens_today(user_id) >= LLM_DAILY_TOKENS_USER:
+        return f"Дневной лимит {LLM_DAILY_TOKENS_USER} токенов исчерпан. Приходите завтра (сутки по UTC)."
+    if LLM_DAILY_TOKENS_TOTAL and tokens_today() >= LLM_DAILY_TOKENS_TOTAL:
+        return "Общий дневной лимит токенов бота исчерпан. Попробуйте завтра."
+    return None
+
+
+# ---------- отчёты ----------
+# Сводки из базы плюс очередь (_pending_*): отчёт сразу после record() уже видит
+# запрос и не ждёт, пока писатель закроет пачку (до LLM_USAGE_FLUSH_SEC).
+REPORT_MAX_DAYS = 366
+_SUMS = ("SUM(requests), SUM(errors), SUM(prompt_tokens), SUM(completion_tokens), "
+         "SUM(cost), SUM(latency_ms)")
+
+
+def _pending_since(pending: dict, since: str) -> dict:
+    """Очередь с дня since: ключ сводки (user_id / model) -> [req, err, pt, ct, cost, lat]."""
+    out = defaultdict(lambda: [0] * 6)
+    with _lock:
+        for (day, key), acc in pending.items():
+            if day >= since:
+                out[key] = [a + b for a, b in zip(out[key], acc)]
+    return out
+
+
+def _merge(rows, pending: dict) -> dict:
+    totals = {r[0]: [v or 0 for v in r[1:]] for r in rows}
+    for key, acc in pending.items():
+        totals[key] = [a + b for a, b in zip(totals.get(key, [0] * 6), acc)]
+    return totals
+
+
+def user_summary(user_id) -> str:
+    """Строки для /whoami: сегодня и за 7 дней."""
+    today = _today()
+    since = (datetime.now(timezone.utc).date() - timedelta(days=6)).isoformat()
+    conn = _connect()
+    try:
+        rows = conn.execute(
+            f"SELECT day, {_SUMS} FROM llm_usage_user_daily WHERE user_id = ? AND day >= ? GROUP BY day",
+            (user_id, since)).fetchall()
+    except sqlite3.OperationalError:
+        rows = []
+    finally:
+        conn.close()
+    with _lock:
+        pending = {day: list(acc) for (day, uid), acc in _pending_users.items() if uid == user_id and day >= since}
+    days = _merge(rows, pending)
+    req, _, pt, ct, _, _ = days.get(today, [0] * 6)
+    used = pt + ct
+    line = f"Сегодня: запросов {req}, токенов {used}"
+    if LLM_DAILY_TOKENS_USER:
+        line += f" (осталось {max(0, LLM_DAILY_TOKENS_USER - used)} из {LLM_DAILY_TOKENS_USER})"
+    week = (f"За 7 дней: запросов {sum(d[0] for d in days.values())}, "
+            f"токенов {sum(d[2] + d[3] for d in days.values())}")
+    return f"{line}\n{week}"
+
+
+def report(days: int = 1, top: int = 10) -> str:
+    """Текст для /usage: по моделям и самые «дорогие» пользователи за days дней (до REPORT_MAX_DAYS)."""
+    days = min(max(1, days), REPORT_MAX_DAYS)
+    since = (datetime.now(timezone.utc).date() - timedelta(days=days - 1)).isoformat()
+    pending_models = _pending_since(_pending_models, since)
+    pending_users = _pending_since(_pending_users, since)
+    pending_users.pop(None, None)
+    conn = _connect()
+    try:
+        model_rows = conn.execute(
+            f"SELECT model, {_SUMS} FROM llm_usage_model_daily WHERE day >= ? GROUP BY model", (since,)).fetchall()
+        # топ из базы плюс точные суммы тех, у кого есть строки в очереди: вместе с очередью
+        # они могут обогнать топ базы, остальные — нет
+        user_rows = conn.execute(
+            f"SELECT user_id, {_SUMS} FROM llm_usage_user_daily WHERE day >= ? "
+            "GROUP BY user_id ORDER BY SUM(prompt_tokens + completion_tokens) DESC LIMIT ?", (since, top)).fetchall()
+        ids = list(pending_users)
+        if ids:
+            user_rows += conn.execute(
+                f"SELECT user_id, {_SUMS} FROM llm_usage_user_daily WHERE day >= ? "
+                f"AND user_id IN ({','.join('?' * len(ids))}) GROUP BY user_id", (since, *ids)).fetchall()
+    except sqlite3.OperationalError:
+        model_rows, user_rows = [], []
+    finally:
+        conn.close()
+    models = sorted(_merge(model_rows, pending_models).items(), key=lambda kv: -(kv[1][2] + kv[1][3]))
+    users = sorted(_merge(user_rows, pending_users).items(), key=lambda kv: -(kv[1][2] + kv[1][3]))[:top]
+    if not models:
+        return "Запросов к моделям пока не было."
+
+    lines = [f"с {since} (UTC)", "модель                     запр ош  вход/выход ток.  $        ср. мс"]
+    for model, (req, err, pt, ct, cost, lat) in models:
+        lines.append(f"{model[-26:]:26} {req:5} {err:2} {pt:7}/{ct:<7} "
+                     f"{cost:8.4f} {lat // max(req, 1):6}")
+    total = sum(m[2] + m[3] for _, m in models)
+    lines.append(f"всего токенов: {total}" + (f" (лимит в день {LLM_DAILY_TOKENS_TOTAL})" if LLM_DAILY_TOKENS_TOTAL else ""))
+    lines.append("")
+    lines.append("пользователи по токенам:")
+    for user_id, (req, _, pt, ct, cost, _) in users:
+        lines.append(f"{user_id:>12} {req:5} запр {pt + ct:8} ток. {cost:8.4f} $")
+    return "\n".join(lines)
+
+
+def send_report(bot, message, args: str = "") -> None:
+    """Обработчик /usage [дней] (только ADMIN_IDS)."""
+    if not perf.is_admin(message.from_user.id):
+        bot.reply_to(message, "Команда только для администраторов.")
+        return
+    days = min(int(args), REPORT_MAX_DAYS) if args.strip().isdigit() else 1
+    text = report(days)[:3500]
+    bot.send_message(message.chat.id, f"<pre>{html.escape(text, quote=False)}</pre>", parse_mode="HTML")
+
+
+register_policy(DB_PATH, "llm_usage", "created_at", LLM_USAGE_RETENTION_DAYS)
+register_gauge("llm_usage: очередь записи", lambda: _queue.qsize())
@@ -0,0 +1,202 @@
+"""
+logsetup.py — неблокирующее логирование: очередь + отдельный поток записи.
+
+Зачем:
+  - FileHandler/StreamHandler пишут на диск прямо в потоке обработчика
+    обновлений: медленный диск или большой лог задерживают ответы бота;
+  - имя файла logs/bot_<дата>.log фиксировалось при запуске — процесс,
+    работающий неделю, писал всё в один файл.
+
+Как устроено:
+  - корневой логгер получает только QueueHandler: запись кладётся в
+    ограниченную очередь (put_nowait) и поток-обработчик идёт дальше;
+    при переполнении запись отбрасывается и считается, о потерях
+    сообщается предупреждением в лог;
+  - форматирование (подстановка %-аргументов, JSON, traceback) и запись
+    на диск делает QueueListener в своём потоке;
+  - файл — JSON Lines (logs/<name>.log: bot, у отдельно запущенных main3.py
+    и crud.py — свои, чтобы процессы не ротировали один файл): ts, level,
+    logger, msg и поля из extra= (user_id, command, latency_ms, size, ...);
+  - ротация по времени (в полночь) и по размеру (LOG_MAX_BYTES):
+    закрытый файл переименовывается в logs/<имя>_<дата_время>.log —
+    дальше его сжимает и удаляет retention.py;
+  - DEBUG-записи сэмплируются: из каждых LOG_DEBUG_SAMPLE записей одного
+    шаблона сообщения проходит одна (поле sampled в JSON).
+
+Пишите логи лениво: log.info("... %s", value, extra={...}) — строка
+собирается только если запись дойдёт до файла.
+
+Настройки: LOG_LEVEL, LOG_DIR, LOG_MAX_BYTES, LOG_DEBUG_SAMPLE, LOG_QUEUE_SIZE.
+"""
+
+from __future__ import annotations
+import os
+import json
+import time
+import queue
+import atexit
+import logging
+import logging.handlers
+from datetime import datetime, timedelta
+
+from dotenv import load_dotenv
+
+load_dotenv()  # модуль импортируется раньше, чем боты читают .env
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_DIR = os.getenv("LOG_DIR", "logs")
+LOG_MAX_BYTES = int(os.getenv("LOG_MAX_BYTES", str(50 * 1024 * 1024)))
+LOG_DEBUG_SAMPLE = int(os.getenv("LOG_DEBUG_SAMPLE", "100"))
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+
+# атрибуты любой LogRecord; всё остальное в record.__dict__ пришло через extra=
+_RECORD_FIELDS = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime"}
+
+_listener: _QueueListener | None = None
+
+
+class JsonFormatter(logging.Formatter):
+    """Одна запись — одна строка JSON."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        doc = {
+            "ts": datetime.fromtimestamp(record.created).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "thread": record.threadName,
+            "msg": record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_FIELDS:
+                doc[key] = value
+        if record.exc_info:
+            doc["exc"] = self.formatException(record.exc_info)
+        return json.dumps(doc, ensure_ascii=False, default=str)
+
+
+class SampleFilter(logging.Filter):
+    """DEBUG: пропускает одну из every записей каждого шаблона (logger, msg)."""
+
+    MAX_KEYS = 10_000
+
+    def __init__(self, every: int):
+        super().__init__()
+        self.every = max(1, every)
+        self._seen: dict[tuple, int] = {}
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno > logging.DEBUG or self.every == 1:
+            return True
+        if len(self._seen) > self.MAX_KEYS:  # шаблоны из f-строк не должны раздувать словарь
+            self._seen.clear()
+        key = (record.name, record.msg)
+        n = self._seen.get(key, 0)
+        self._seen[key] = n + 1
+        if n % self.every:
+            return False
+        record.sampled = self.every
+        return True
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler, который никогда не ждёт: полная очередь — запись отброшена."""
+
+    def __init__(self, q: queue.Queue):
+        super().__init__(q)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # очередь внутри процесса: форматирование откладываем до потока записи
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            if self.dropped:
+                dropped, self.dropped = self.dropped, 0
+                self.queue.put_nowait(logging.makeLogRecord({
+                    "name": __name__, "levelno": logging.WARNING, "levelname": "WARNING",
+                    "msg": "Log queue full, dropped %d records", "args": (dropped,)}))
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class _QueueListener(logging.handlers.QueueListener):
+    def enqueue_sentinel(self) -> None:
+        # stop() при полной очереди: ждём, пока поток записи её разберёт
+        self.queue.put(self._sentinel)
+
+
+class TimedSizeRotatingHandler(logging.handlers.RotatingFileHandler):
+    """
+    Файл path пишется до полуночи или до max_bytes, затем переименовывается
+    в <имя>_<время открытия>.log и открывается заново.
+    """
+
+    def __init__(self, path: str, max_bytes: int = LOG_MAX_BYTES):
+        super().__init__(path, maxBytes=max_bytes, encoding="utf-8", delay=True)
+        # файл от прошлого запуска считаем открытым тогда, когда в него последний раз писали
+        self._opened = os.path.getmtime(path) if os.path.exists(path) else time.time()
+        self._rollover_at = _next_midnight(self._opened)
+
+    def shouldRollover(self, record: logging.LogRecord) -> bool:
+        if time.time() >= self._rollover_at:
+            return True
+        return bool(super().shouldRollover(record))
+
+    def doRollover(self) -> None:
+        if self.stream:
+            self.stream.close()
+            self.stream = None
+        if os.path.exists(self.baseFilename):
+            root, ext = os.path.splitext(self.baseFilename)
+            stamp = datetime.fromtimestamp(self._opened).strftime("%Y-%m-%d_%H%M%S")
+            dest, n = f"{root}_{stamp}{ext}", 0
+            while os.path.exists(dest):
+                n += 1
+                dest = f"{root}_{stamp}-{n}{ext}"
+            os.rename(self.baseFilename, dest)
+        self._opened = time.time()
+        self._rollover_at = _next_midnight(self._opened)
+
+
+def _next_midnight(ts: float) -> float:
+    day = datetime.fromtimestamp(ts).date() + timedelta(days=1)
+    return datetime.combine(day, datetime.min.time()).timestamp()
+
+
+def setup_logging(name: str = "bot", level: str = LOG_LEVEL, console: bool = True) -> None:
+    """
+    Переключает корневой логгер на очередь; файл LOG_DIR/<name>.log.
+    Повторный вызов ничего не делает. Поток записи дописывает очередь при выходе.
+    """
+    global _listener
+    if _listener is not None:
+        return
+    os.makedirs(LOG_DIR, exist_ok=True)
+    file_handler = TimedSizeRotatingHandler(os.path.join(LOG_DIR, f"{name}.log"))
+    file_handler.setFormatter(JsonFormatter())
+    handlers: list[logging.Handler] = [file_handler]
+    if console:
+        stream = logging.StreamHandler()
+        stream.setFormatter(logging.Formatter("%(asctime)s - %(levelname)s - %(message)s"))
+        handlers.append(stream)
+
+    q: queue.Queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+    qh = _QueueHandler(q)
+    qh.addFilter(SampleFilter(LOG_DEBUG_SAMPLE))
+    root = logging.getLogger()
+    for h in root.handlers[:]:
+        root.removeHandler(h)
+    root.addHandler(qh)
+    root.setLevel(level)
+
+    _listener = _QueueListener(q, *handlers, respect_handler_level=True)
+    _listener.start()
+    atexit.register(shutdown_logging)
+
+
+def shutdown_logging() -> None:
+    """Дописывает очередь и останавливает поток записи (повторный вызов безопасен)."""
+    if _listener is not None and _listener._thread is not None:
+        _listener.stop()
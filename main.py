@@ -1,16 +1,27 @@
 import os
 import logging
 import random
-from datetime import datetime
 from dotenv import load_dotenv
 from typing import List
 import telebot
-from telebot import types
+from telebot import types, apihelper
 import time
 import requests
 import sqlite3
-from db import init_db, get_user_character, list_characters, set_user_character, get_character_by_id
+from db import (DB_PATH, init_db, get_user_character, list_characters, set_user_character, get_character_by_id,
+                add_note, list_notes, count_notes)
 from openrouter_client import OpenRouterClient, OpenRouterError
+from backup import start_backup_scheduler
+from retention import start_retention_scheduler
+from webhook import run_bot
+from router import Router, regex_args
+from logsetup import setup_logging
+from metrics import timed, UPSTREAM_SECONDS
+import perf
+import profiling
+import llm_usage
+import prompt_budget
+import conversation
 
 load_dotenv()
 TOKEN = os.getenv("TOKEN")
@@ -20,19 +31,16 @@ if not TOKEN:
 # Инициализация базы данных при запуске
 init_db()
 
-# Настройка логирования
-os.makedirs("logs", exist_ok=True)
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler(f"logs/bot_{datetime.now().strftime('%Y-%m-%d')}.log", encoding='utf-8'),
-        logging.StreamHandler()
-    ]
-)
+# Настройка логирования: очередь + поток записи, JSON в logs/bot.log (см. logsetup.py)
+setup_logging()
 
+if os.getenv("TELEGRAM_API_URL"):
+    apihelper.API_URL = os.getenv("TELEGRAM_API_URL")  # локальный/фейковый Bot API
 bot = telebot.TeleBot(TOKEN)
+router = Router()  # команды и кнопки: один обработчик и поиск в словаре (router.py)
+router.install(bot)
 BOT_INFO = {"version": "1", "author": "Базлов Владимир Андреевич", "purpose": "Обучение"}
+TELEGRAM_TEXT_LIMIT = 4096  # символов в одном сообщении Bot API
 
 # Глобальная переменная для хранения активной модели
 ACTIVE_MODEL = None
@@ -54,7 +62,7 @@ try:
     openrouter_client = OpenRouterClient()
     logging.info("OpenRouter клиент успешно инициализирован")
 except RuntimeError as e:
-    logging.error(f"Ошибка инициализации OpenRouter клиента: {e}")
+    logging.error("Ошибка инициализации OpenRouter клиента: %s", e)
     openrouter_client = None
 
 
@@ -73,6 +81,7 @@ def _setup_bot_commands() -> None:
         types.BotCommand(command="model", description="Установить активную модель"),
         types.BotCommand(command="models", description="Получить список моделей"),
         types.BotCommand(command="ask", description="Задать вопрос модели"),
+        types.BotCommand(command="reset", description="Начать разговор с моделью заново"),
         types.BotCommand(command="ask_random", description="Задать вопрос случайной модели"),
         types.BotCommand(command="character", description="Установить активного персонажа"),
         types.BotCommand(command="characters", description="Получить список персонажей"),
@@ -91,46 +100,59 @@ def update_character_name(character_id: int, new_name: str) -> bool:
         conn.close()
         return True
     except Exception as e:
-        logging.error(f"Ошибка при обновлении имени персонажа: {e}")
+        logging.error("Ошибка при обновлении имени персонажа: %s", e)
         return False
 
 
-def _build_messages_for_character(character: dict, user_text: str) -> List[dict]:
+def _build_messages_for_character(character: dict, user_text: str, max_tokens: int | None = None,
+                                  history: List[dict] = ()) -> List[dict]:
     """Строит список сообщений для запроса к модели для конкретного персонажа"""
-    system = (
-        f"Ты отвечаешь строго в образе персонажа: {character['name']}.\n"
-        f"{character['prompt']}\n"
-        "Правила:\n"
-        "1) Всегда держи стиль и манеру речи выбранного персонажа. При необходимости – переформулируй.\n"
-        "2) Технические ответы давай корректно и по пунктам, но в характерной манере.\n"
-        "3) Не раскрывай, что ты 'играешь роль'.\n"
-        "4) Не используй длинные дословные цитаты из фильмов/книг (>10 слов).\n"
-        "5) Если стиль персонажа выражен слабо – переформулируй ответ и усили характер персонажа, сохраняя фактическую точность.\n"
-    )
+    # компактный или полный system prompt — см. prompt_budget.py (PROMPT_STYLE)
+    system = prompt_budget.system_prompt(character, max_tokens)
 
     return [
         {"role": "system", "content": system},
+        *history,  # предыдущие реплики разговора (conversation.py), только у /ask
         {"role": "user", "content": user_text},
     ]
 
 
-def _build_messages(user_id: int, user_text: str) -> List[dict]:
+def _build_messages(user_id: int, user_text: str, max_tokens: int | None = None,
+                    history: List[dict] = ()) -> List[dict]:
     """Строит список сообщений для запроса к модели"""
     p = get_user_character(user_id)
-    return _build_messages_for_character(p, user_text)
+    return _build_messages_for_character(p, user_text, max_tokens, history)
 
 
-def chat_once(messages: List[dict], model: str, temperature: float = 0.2, max_tokens: int = 400) -> tuple:
-    """Отправляет запрос к модели и возвращает ответ"""
+def chat_once(messages: List[dict], model: str, temperature: float = 0.2, max_tokens: int = 400,
+              user_id: int | None = None) -> tuple:
+    """Отправляет запрос к модели и возвращает (ответ, мс, usage); расход пишется в llm_usage"""
     if openrouter_client is None:
         raise OpenRouterError(500, "OpenRouter клиент не инициализирован. Проверьте OPENROUTER_API_KEY.")
 
-    return openrouter_client.chat_once(
-        messages=messages,
-        model=model,
-        temperature=temperature,
-        max_tokens=max_tokens
-    )
+    reason = llm_usage.check_budget(user_id)
+    if reason:
+        raise OpenRouterError(429, reason)
+
+    start = time.time()
+    try:
+        text, ms, usage = openrouter_client.chat_once(
+            messages=messages,
+            model=model,
+            temperature=temperature,
+            max_tokens=max_tokens
+        )
+    except OpenRouterError as e:
+        llm_usage.record(user_id, model, None, int((time.time() - start) * 1000), str(e.status))
+        raise
+    llm_usage.record(user_id, model, usage, ms)
+    return text, ms, usage
+
+
+def _usage_note(usage: dict) -> str:
+    """Хвост ответа: сколько токенов ушло на запрос"""
+    total = usage.get("total_tokens") or (usage.get("prompt_tokens") or 0) + (usage.get("completion_tokens") or 0)
+    return f"; токенов: {total}" if total else ""
 
 
 def list_models():
@@ -176,6 +198,7 @@ def get_model_by_id(model_id: int):
     return None
 
 
+@timed(UPSTREAM_SECONDS, None, "open-meteo", kind="upstream")
 def fetch_weather_moscow_open_meteo() -> str:
     url = "https://api.open-meteo.com/v1/forecast"
     params = {
@@ -211,29 +234,22 @@ def is_int_token(t: str) -> bool:
 
 
 def log_message(message, command=None):
+    # строка обработки (user_id, команда, время) пишется роутером на INFO;
+    # текст сообщения — DEBUG, сэмплируется (LOG_DEBUG_SAMPLE)
     user = message.from_user
-    user_info = f"ID: {user.id}, Имя: {user.first_name or ''} {user.last_name or ''}"
-    if user.username: user_info += f" (@{user.username})"
-    logging.info(f"Пользователь: {user_info}, Команда: {command or 'текст'}, Текст: '{message.text}'")
+    logging.debug("Сообщение: %r", message.text, extra={
+        "user_id": user.id, "username": user.username, "command": command or "текст",
+        "size": len(message.text or "")})
 
 
 def save_note(user_id: int, text: str):
-    """Сохраняет заметку в базу данных"""
-    conn = sqlite3.connect('notes.db')
-    cursor = conn.cursor()
-    cursor.execute('INSERT INTO notes (user_id, text) VALUES (?, ?)', (user_id, text))
-    conn.commit()
-    conn.close()
+    """Сохраняет заметку в базу данных (длинные — сжатыми, см. db.add_note)"""
+    add_note(user_id, text)
 
 
 def get_user_notes(user_id: int) -> List[tuple]:
-    """Получает все заметки пользователя"""
-    conn = sqlite3.connect('notes.db')
-    cursor = conn.cursor()
-    cursor.execute('SELECT text, created_at FROM notes WHERE user_id = ? ORDER BY created_at DESC', (user_id,))
-    notes = cursor.fetchall()
-    conn.close()
-    return notes
+    """Заметки пользователя для списка: (превью, дата), новые первыми; длинные не распаковываются"""
+    return [(n['text'], n['created_at']) for n in reversed(list_notes(user_id, preview=True))]
 
 
 def make_main_kb():
@@ -246,8 +262,8 @@ def make_main_kb():
     return kb
 
 
-@bot.message_handler(commands=['start', 'help'])
-def cmd_start(message: types.Message) -> None:
+@router.command("start", "help")
+def cmd_start(message: types.Message, args: str = "") -> None:
     """Приветствует пользователя и кратко описать команды."""
     log_message(message, "/start" if message.text.startswith("/start") else "/help")
 
@@ -265,7 +281,8 @@ def cmd_start(message: types.Message) -> None:
         " /note_stats - Статистика по датам\n"
         " /model - Установить активную модель\n"
         " /models - Получить список моделей\n"
-        " /ask - Задать вопрос модели\n"
+        " /ask - Задать вопрос модели (помнит предыдущие вопросы)\n"
+        " /reset - Начать разговор с моделью заново\n"
         " /ask_random - Задать вопрос случайной модели\n"
         " /character - Установить активного персонажа\n"
         " /characters - Получить список персонажей\n"
@@ -276,14 +293,11 @@ def cmd_start(message: types.Message) -> None:
     bot.reply_to(message, text)
 
 
-@bot.message_handler(commands=["character_name"])
-def cmd_character_name(message: types.Message) -> None:
+@router.command("character_name")
+def cmd_character_name(message: types.Message, args: str = "") -> None:
     """Изменить имя персонажа по ID"""
     log_message(message, "/character_name")
 
-    # Извлекаем аргументы команды
-    args = message.text.replace('/character_name', '', 1).strip()
-
     if not args:
         bot.reply_to(message, "Использование: /character_name <ID> >новое_имя>\n\nПример: /character_name 1 >Новое имя")
         return
@@ -321,18 +335,18 @@ def cmd_character_name(message: types.Message) -> None:
         success = update_character_name(character_id, new_name)
         if success:
             bot.reply_to(message, f"Имя персонажа изменено:\nID: {character_id}\nБыло: {old_name}\nСтало: {new_name}")
-            logging.info(
-                f"Пользователь {message.from_user.id} изменил имя персонажа {character_id} с '{old_name}' на '{new_name}'")
+            logging.info("Пользователь %s изменил имя персонажа %s с %r на %r",
+                         message.from_user.id, character_id, old_name, new_name)
         else:
             bot.reply_to(message, "Ошибка при изменении имени персонажа в базе данных.")
 
     except Exception as e:
-        logging.error(f"Ошибка в команде /character_name: {e}")
+        logging.error("Ошибка в команде /character_name: %s", e)
         bot.reply_to(message, "Произошла ошибка при изменении имени персонажа.")
 
 
-@bot.message_handler(commands=["ask"])
-def cmd_ask(message: types.Message) -> None:
+@router.command("ask")
+def cmd_ask(message: types.Message, args: str = "") -> None:
     """Команда для опроса модели"""
     log_message(message, "/ask")
 
@@ -340,12 +354,14 @@ def cmd_ask(message: types.Message) -> None:
         bot.reply_to(message, "❌ OpenRouter недоступен. Проверьте настройки API ключа.")
         return
 
-    q = message.text.replace('/ask', '', 1).strip()
+    q = args
     if not q:
         bot.reply_to(message, "Использование: /ask <вопрос>")
         return
 
-    msg = _build_messages(message.from_user.id, q[:600])
+    budget = prompt_budget.plan(q)
+    msg = _build_messages(message.from_user.id, budget.text, budget.max_tokens,
+                          history=conversation.history(message.from_user.id))
     active_model = get_active_model()
     if not active_model:
         bot.reply_to(message, "❌ Нет активной модели. Сначала выберите модель через /models")
@@ -354,18 +370,31 @@ def cmd_ask(message: types.Message) -> None:
     model_key = active_model['key']
 
     try:
-        text, ms = chat_once(msg, model=model_key, temperature=0.2, max_tokens=400)
+        text, ms, usage = chat_once(msg, model=model_key, temperature=0.2, max_tokens=budget.max_tokens,
+                                    user_id=message.from_user.id)
         out = (text or '').strip()[:4000]  # не переполняем сообщение Telegram
-        bot.reply_to(message, f"{out}\n\n({ms} мс; модель: {model_key})")
+        bot.reply_to(message, f"{out}\n\n({ms} мс; модель: {model_key}{_usage_note(usage)})")
+        if out:
+            conversation.add_exchange(message.from_user.id, budget.text, out)
     except OpenRouterError as e:
         bot.reply_to(message, f"❌ Ошибка: {e}")
     except Exception as e:
-        logging.error(f"Непредвиденная ошибка в /ask: {e}")
+        logging.error("Непредвиденная ошибка в /ask: %s", e)
         bot.reply_to(message, "❌ Непредвиденная ошибка.")
 
 
-@bot.message_handler(commands=["ask_model"])
-def cmd_ask_model(message: types.Message) -> None:
+@router.command("reset")
+def cmd_reset(message: types.Message, args: str = "") -> None:
+    """Забыть разговор с моделью (/ask)"""
+    log_message(message, "/reset")
+    if conversation.reset(message.from_user.id):
+        bot.reply_to(message, "Разговор начат заново: предыдущие вопросы забыты.")
+    else:
+        bot.reply_to(message, "Помнить пока нечего — задайте вопрос через /ask.")
+
+
+@router.command("ask_model", parse=regex_args(r"(\d+)\s+(.*)"))
+def cmd_ask_model(message: types.Message, args: tuple | None = None) -> None:
     """Задать вопрос конкретной модели по ID без смены активной модели"""
     log_message(message, "/ask_model")
 
@@ -373,10 +402,7 @@ def cmd_ask_model(message: types.Message) -> None:
         bot.reply_to(message, "❌ OpenRouter недоступен. Проверьте настройки API ключа.")
         return
 
-    # Извлекаем аргументы команды
-    args = message.text.replace('/ask_model', '', 1).strip().split(' ', 1)
-
-    if len(args) < 2 or not args[0].isdigit():
+    if not args:  # парсер вернул None: нет ID или вопроса
         bot.reply_to(message, "Использование: /ask_model <ID> <вопрос>\n\nПример: /ask_model 7 Погода в Москве")
         return
 
@@ -394,27 +420,29 @@ def cmd_ask_model(message: types.Message) -> None:
         return
 
     # Строим сообщение с текущим персонажем пользователя
-    msg = _build_messages(message.from_user.id, q[:600])
+    budget = prompt_budget.plan(q)
+    msg = _build_messages(message.from_user.id, budget.text, budget.max_tokens)
     model_key = target_model['key']
 
     try:
-        text, ms = chat_once(msg, model=model_key, temperature=0.2, max_tokens=400)
+        text, ms, usage = chat_once(msg, model=model_key, temperature=0.2, max_tokens=budget.max_tokens,
+                                    user_id=message.from_user.id)
         out = (text or '').strip()[:4000]
 
         # Получаем текущую активную модель для информации
         active_model = get_active_model()
         active_info = f" (активная: {active_model['label']})" if active_model else ""
 
-        bot.reply_to(message, f"{out}\n\n({ms} мс; модель: {target_model['label']}{active_info})")
+        bot.reply_to(message, f"{out}\n\n({ms} мс; модель: {target_model['label']}{active_info}{_usage_note(usage)})")
     except OpenRouterError as e:
         bot.reply_to(message, f"❌ Ошибка: {e}")
     except Exception as e:
-        logging.error(f"Непредвиденная ошибка в /ask_model: {e}")
+        logging.error("Непредвиденная ошибка в /ask_model: %s", e)
         bot.reply_to(message, "❌ Непредвиденная ошибка.")
 
 
-@bot.message_handler(commands=["ask_random"])
-def cmd_ask_random(message: types.Message) -> None:
+@router.command("ask_random")
+def cmd_ask_random(message: types.Message, args: str = "") -> None:
     """Задать вопрос случайной LLP модели"""
     log_message(message, "/ask_random")
 
@@ -422,11 +450,11 @@ def cmd_ask_random(message: types.Message) -> None:
         bot.reply_to(message, "❌ OpenRouter недоступен. Проверьте настройки API ключа.")
         return
 
-    q = message.text.replace('/ask_random', '', 1).strip()
+    q = args
     if not q:
         bot.reply_to(message, "Использование: /ask_random <вопрос>")
         return
-    q = q[:600]
+    budget = prompt_budget.plan(q)
 
     # Если случайный персонаж из таблицы (не сохраняем в user_character)
     items = list_characters()
@@ -436,22 +464,24 @@ def cmd_ask_random(message: types.Message) -> None:
     chosen = random.choice(items)
     character = get_character_by_id(chosen['id'])  # получаем prompt
 
-    msgs = _build_messages_for_character(character, q)
+    msgs = _build_messages_for_character(character, budget.text, budget.max_tokens)
     model_key = get_active_model()['key']
 
     try:
-        text, ns = chat_once(msgs, model=model_key, temperature=0.2, max_tokens=400)
+        text, ns, usage = chat_once(msgs, model=model_key, temperature=0.2, max_tokens=budget.max_tokens,
+                                    user_id=message.from_user.id)
         out = (text or '').strip()[:4000]
-        bot.reply_to(message, f"{out}\n\n({ns} мс; модель: {model_key}; персонаж: {character['name']})")
+        bot.reply_to(message, f"{out}\n\n({ns} мс; модель: {model_key}; персонаж: {character['name']}"
+                              f"{_usage_note(usage)})")
     except OpenRouterError as e:
         bot.reply_to(message, f"❌ Ошибка: {e}")
     except Exception as e:
-        logging.error(f"Непредвиденная ошибка в /ask_random: {e}")
+        logging.error("Непредвиденная ошибка в /ask_random: %s", e)
         bot.reply_to(message, "❌ Непредвиденная ошибка.")
 
 
-@bot.message_handler(commands=["models"])
-def cmd_models(message: types.Message) -> None:
+@router.command("models")
+def cmd_models(message: types.Message, args: str = "") -> None:
     """Команда для получения списка моделей"""
     log_message(message, "/models")
     items = list_models()
@@ -467,11 +497,11 @@ def cmd_models(message: types.Message) -> None:
     bot.reply_to(message, "\n".join(lines))
 
 
-@bot.message_handler(commands=["model"])
-def cmd_model(message: types.Message) -> None:
+@router.command("model")
+def cmd_model(message: types.Message, args: str = "") -> None:
     """Команда для выбора активной модели"""
     log_message(message, "/model")
-    arg = message.text.replace('/model', '', 1).strip()
+    arg = args
 
     if not arg:
         # Если аргументов нет - показываем текущую активную модель
@@ -491,13 +521,13 @@ def cmd_model(message: types.Message) -> None:
         model_id = int(arg)
         active = set_active_model(model_id)
         bot.reply_to(message, f"✅ Активная модель переключена: {active['label']} ({active['key']})")
-        logging.info(f"Пользователь {message.from_user.id} установил активную модель: {active['label']}")
+        logging.info("Пользователь %s установил активную модель: %s", message.from_user.id, active['label'])
     except ValueError:
         bot.reply_to(message, "❌ Неизвестный ID модели. Сначала /models.")
 
 
-@bot.message_handler(commands=["characters"])
-def cmd_characters(message: types.Message) -> None:
+@router.command("characters")
+def cmd_characters(message: types.Message, args: str = "") -> None:
     """
     Показать список персонажей
     """
@@ -523,14 +553,14 @@ def cmd_characters(message: types.Message) -> None:
     bot.reply_to(message, "\n".join(lines))
 
 
-@bot.message_handler(commands=["character"])
-def cmd_character(message: types.Message) -> None:
+@router.command("character")
+def cmd_character(message: types.Message, args: str = "") -> None:
     """
     Установить активным персонаж
     """
     log_message(message, "/character")
     user_id = message.from_user.id
-    arg = message.text.replace("/character", "", 1).strip()
+    arg = args
 
     if not arg:
         p = get_user_character(user_id)
@@ -548,20 +578,21 @@ def cmd_character(message: types.Message) -> None:
         bot.reply_to(message, "Неизвестный ID персонажа. Сначала /characters.")
 
 
-@bot.message_handler(commands=["whoami"])
-def cmd_whoami(message: types.Message) -> None:
+@router.command("whoami")
+def cmd_whoami(message: types.Message, args: str = "") -> None:
     """
     Показать активную модель и активного персонажа
     """
     log_message(message, "/whoami")
     character = get_user_character(message.from_user.id)
     model = get_active_model()
-    bot.reply_to(message, f"Модель: {model['label']} [{model['key']}]\nПерсонаж: {character['name']}")
+    bot.reply_to(message, f"Модель: {model['label']} [{model['key']}]\nПерсонаж: {character['name']}\n\n"
+                          f"{llm_usage.user_summary(message.from_user.id)}")
 
 
-@bot.message_handler(commands=["sum"])
-def cmd_sum(message):
-    nums = parse_ints_from_text(message.text)
+@router.command("sum", parse=parse_ints_from_text)
+def cmd_sum(message, args: List[int] = ()):
+    nums = args
     logging.info("Sum cmd from id=%s text=%r -> %r", message.from_user.id if message.from_user else "?", message.text,
                  nums)
     if not nums:
@@ -570,8 +601,8 @@ def cmd_sum(message):
     bot.reply_to(message, f"Сумма: {sum(nums)}")
 
 
-@bot.message_handler(commands=["max"])
-def cmd_max(message):
+@router.command("max")
+def cmd_max(message, args: str = ""):
     log_message(message, "/max")
     bot.send_message(message.chat.id, "Введите числа через пробел или запятую для поиска максимума:")
     bot.register_next_step_handler(message, on_max_numbers)
@@ -587,30 +618,45 @@ def on_max_numbers(message):
         bot.reply_to(message, f"Максимум: {max(nums)}")
 
 
-@bot.message_handler(commands=["about"])
-def about(message):
+@router.command("about")
+def about(message, args: str = ""):
     log_message(message, "/about")
     bot.reply_to(message,
                  f"Версия: {BOT_INFO['version']}\nАвтор: {BOT_INFO['author']}\nНазначение: {BOT_INFO['purpose']}")
 
 
-@bot.message_handler(commands=["ping"])
-def ping(message):
+@router.command("perf")
+def perf_cmd(message, args: str = ""):
+    perf.send_report(bot, message)
+
+
+@router.command("usage")
+def usage_cmd(message, args: str = ""):
+    llm_usage.send_report(bot, message, args)
+
+
+@router.command("profile")
+def profile_cmd(message, args: str = ""):
+    profiling.handle_command(bot, message, args)
+
+
+@router.command("ping")
+def ping(message, args: str = ""):
     log_message(message, "/ping")
     start = time.time()
     msg = bot.reply_to(message, "Время ответа")
     bot.edit_message_text(f"Время ответа: {round((time.time() - start) * 1000, 2)} мс", msg.chat.id, msg.message_id)
 
 
-@bot.message_handler(commands=['hide'])
-def hide_kb(message):
+@router.command("hide")
+def hide_kb(message, args: str = ""):
     log_message(message, "/hide")
     rm = types.ReplyKeyboardRemove()
     bot.send_message(message.chat.id, "Спрятал клавиатуру.", reply_markup=rm)
 
 
-@bot.message_handler(commands=['confirm'])
-def confirm_cmd(message):
+@router.command("confirm")
+def confirm_cmd(message, args: str = ""):
     log_message(message, "/confirm")
     kb = types.InlineKeyboardMarkup()
     kb.add(
@@ -620,16 +666,16 @@ def confirm_cmd(message):
     bot.send_message(message.chat.id, "Подтвердить действие?", reply_markup=kb)
 
 
-@bot.message_handler(commands=['weather'])
-def weather_cmd(message):
+@router.command("weather")
+def weather_cmd(message, args: str = ""):
     log_message(message, "/weather")
     weather_info = fetch_weather_moscow_open_meteo()
     bot.reply_to(message, weather_info)
 
 
 # Команды для работы с заметками
-@bot.message_handler(commands=['note_add'])
-def note_add_cmd(message):
+@router.command("note_add")
+def note_add_cmd(message, args: str = ""):
     log_message(message, "/note_add")
     bot.send_message(message.chat.id, "Введите текст заметки:")
     bot.register_next_step_handler(message, save_note_handler)
@@ -640,11 +686,11 @@ def save_note_handler(message):
     text = message.text
     save_note(user_id, text)
     bot.reply_to(message, "Заметка сохранена!")
-    logging.info(f"Пользователь {user_id} добавил заметку: {text}")
+    logging.info("Пользователь %s добавил заметку: %s", user_id, text)
 
 
-@bot.message_handler(commands=['note_list'])
-def note_list_cmd(message):
+@router.command("note_list")
+def note_list_cmd(message, args: str = ""):
     log_message(message, "/note_list")
     user_id = message.from_user.id
     notes = get_user_notes(user_id)
@@ -655,46 +701,49 @@ def note_list_cmd(message):
 
     response = "Ваши заметки:\n\n"
     for i, (text, created_at) in enumerate(notes, 1):
-        response += f"{i}. {text}\n   📅 {created_at}\n\n"
+        item = f"{i}. {text}\n   📅 {created_at}\n\n"
+        if len(response) + len(item) > TELEGRAM_TEXT_LIMIT - 40:  # запас под строку «и ещё N»
+            response += f"… и ещё {len(notes) - i + 1}"
+            break
+        response += item
 
     bot.reply_to(message, response)
 
 
 # Заглушки для остальных команд заметок
-@bot.message_handler(commands=['note_find'])
-def note_find_cmd(message):
+@router.command("note_find")
+def note_find_cmd(message, args: str = ""):
     log_message(message, "/note_find")
     bot.reply_to(message, "Функция поиска заметок будет реализована в будущем.")
 
 
-@bot.message_handler(commands=['note_edit'])
-def note_edit_cmd(message):
+@router.command("note_edit")
+def note_edit_cmd(message, args: str = ""):
     log_message(message, "/note_edit")
     bot.reply_to(message, "Функция редактирования заметок будет реализована в будущем.")
 
 
-@bot.message_handler(commands=['note_del'])
-def note_del_cmd(message):
+@router.command("note_del")
+def note_del_cmd(message, args: str = ""):
     log_message(message, "/note_del")
     bot.reply_to(message, "Функция удаления заметок будет реализована в будущем.")
 
 
-@bot.message_handler(commands=['note_count'])
-def note_count_cmd(message):
+@router.command("note_count")
+def note_count_cmd(message, args: str = ""):
     log_message(message, "/note_count")
     user_id = message.from_user.id
-    notes = get_user_notes(user_id)
-    bot.reply_to(message, f"У вас {len(notes)} заметок.")
+    bot.reply_to(message, f"У вас {count_notes(user_id)} заметок.")
 
 
-@bot.message_handler(commands=['note_export'])
-def note_export_cmd(message):
+@router.command("note_export")
+def note_export_cmd(message, args: str = ""):
     log_message(message, "/note_export")
     bot.reply_to(message, "Функция экспорта заметок будет реализована в будущем.")
 
 
-@bot.message_handler(commands=['note_stats'])
-def note_stats_cmd(message):
+@router.command("note_stats")
+def note_stats_cmd(message, args: str = ""):
     log_message(message, "/note_stats")
     bot.reply_to(message, "Функция статистики заметок будет реализована в будущем.")
 
@@ -714,32 +763,32 @@ def on_confirm(c):
     bot.send_message(c.message.chat.id, "Готово!" if choice == "yes" else "Отменено.")
 
     # Логируем действие
-    logging.info(f"Пользователь {c.from_user.id} выбрал: {choice}")
+    logging.info("Пользователь %s выбрал: %s", c.from_user.id, choice)
 
 
 # Обработчики кнопок
-@bot.message_handler(func=lambda m: m.text == "Сумма")
-def kb_sum(message):
+@router.text("Сумма")
+def kb_sum(message, args: str = ""):
     log_message(message, "Кнопка Сумма")
     bot.send_message(message.chat.id, "Введите числа через пробел или запятую:")
     bot.register_next_step_handler(message, on_sum_numbers)
 
 
-@bot.message_handler(func=lambda m: m.text == "Погода")
-def kb_weather(message):
+@router.text("Погода")
+def kb_weather(message, args: str = ""):
     log_message(message, "Кнопка Погода")
     weather_info = fetch_weather_moscow_open_meteo()
     bot.reply_to(message, weather_info)
 
 
-@bot.message_handler(func=lambda m: m.text == "Добавить заметку")
-def kb_add_note(message):
+@router.text("Добавить заметку")
+def kb_add_note(message, args: str = ""):
     log_message(message, "Кнопка Добавить заметку")
     note_add_cmd(message)
 
 
-@bot.message_handler(func=lambda m: m.text == "show")
-def show_button(message):
+@router.text("show")
+def show_button(message, args: str = ""):
     log_message(message, "Кнопка show")
     note_list_cmd(message)
 
@@ -754,44 +803,53 @@ def on_sum_numbers(message):
         bot.reply_to(message, f"Сумма: {sum(nums)}")
 
 
-@bot.message_handler(func=lambda m: m.text == "О боте")
-def about_button(message):
+@router.text("О боте")
+def about_button(message, args: str = ""):
     log_message(message, "Кнопка О боте")
     about(message)
 
 
-@bot.message_handler(func=lambda m: m.text == "about")
-def about_button_en(message):
+@router.text("about")
+def about_button_en(message, args: str = ""):
     log_message(message, "Кнопка about")
     about(message)
 
 
-@bot.message_handler(func=lambda m: m.text == "sum")
-def sum_button_en(message):
+@router.text("sum")
+def sum_button_en(message, args: str = ""):
     log_message(message, "Кнопка sum")
     kb_sum(message)
 
 
-@bot.message_handler(func=lambda m: m.text == "hide")
-def hide_button(message):
+@router.text("hide")
+def hide_button(message, args: str = ""):
     log_message(message, "Кнопка hide")
     hide_kb(message)
 
 
-@bot.message_handler(func=lambda m: True)
-def handle_all(message):
+@router.default
+def handle_all(message, args: str = ""):
     log_message(message)
     bot.reply_to(message, "Я понимаю только команды. Напиши /help для списка команд.")
 
 
-if __name__ == "__main__":
+BACKUP_DBS = [DB_PATH]  # базы этого бота для start_backup_scheduler (host.py собирает со всех ботов)
+
+
+def startup() -> None:
+    """Подготовка перед приёмом обновлений; общие фоновые задачи запускает вызывающий."""
     # Настройка команд бота перед запуском
     _setup_bot_commands()
 
     logging.info("Бот запущен")
-    logging.info(f"Доступно моделей: {len(MODELS_DATA)}")
+    logging.info("Доступно моделей: %d", len(MODELS_DATA))
     active_model = get_active_model()
     if active_model:
-        logging.info(f"Активная модель: {active_model['label']} ({active_model['key']})")
+        logging.info("Активная модель: %s (%s)", active_model['label'], active_model['key'])
+
 
-    bot.infinity_polling()
\ No newline at end of file
+if __name__ == "__main__":
+    startup()
+    start_backup_scheduler(BACKUP_DBS)  # включается через BACKUP_INTERVAL_SEC
+    start_retention_scheduler()  # чистка заметок и logs/, включается через RETENTION_INTERVAL_SEC
+    run_bot(bot)  # long polling или webhook — по BOT_MODE
\ No newline at end of file
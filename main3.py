@@ -4,35 +4,62 @@ main.py — DailyZodiakBot (развлекательный контент без
 Команды:
   /start                  — регистрация, выбор знака и часа
   /set_sign <знак>        — установить знак (или нажать кнопку с названием)
-  /set_time <0..23>       — час утра/дня для рассылки (по времени сервера)
+  /set_time <ЧЧ[:ММ]>     — время рассылки по вашему местному времени
+  /set_tz <пояс>          — часовой пояс IANA (например, Asia/Yekaterinburg)
   /subscribe              — включить подписку
   /unsubscribe            — выключить подписку
   /me                     — мои настройки
   /today                  — выслать «гороскоп дня» прямо сейчас
+  /week, /month           — прогноз на 7 / 30 дней (из заранее посчитанного календаря)
   /signs                  — показать список знаков
 
 Рассылка:
-  - фоновый поток проверяет раз в минуту: кому отправить сейчас;
-  - условие: subscribed=1, notify_hour == now.hour, last_sent_date != today.
+  - у каждого пользователя в БД посчитан next_send_at (UTC) — следующий слот
+    по его поясу; планировщик спит до ближайшего next_send_at (или до смены
+    настроек, которая его приближает) и забирает next_send_at <= now;
+  - должники ставятся в таблицу outbox (атомарно со сдвигом слота), воркеры
+    разбирают её: аренда -> отправка пулом с лимитом скорости (broadcast.py) ->
+    подтверждение; недоставленные — повтор с паузой, затем dead letter;
+  - реплик может быть несколько: планирует только лидер (аренда в bot.db),
+    воркеры outbox работают во всех.
 """
 
 from __future__ import annotations
+import os
+import socket
 import logging
 import threading
 import time
 import hashlib
-from datetime import datetime, date
+from collections import OrderedDict
+from datetime import datetime, date, timedelta, timezone
+from zoneinfo import ZoneInfo
 
 import telebot
-from telebot import types
+from telebot import types, apihelper
 
 import db3 as db
-from config3 import TOKEN, DEFAULT_NOTIFY_HOUR
+from backup import start_backup_scheduler
+from retention import register_policy, start_retention_scheduler
+from broadcast import Broadcaster
+from webhook import run_bot
+from logsetup import setup_logging
+import perf
+import metrics
+import profiling
+from config3 import (TOKEN, DB_PATH, DEFAULT_NOTIFY_HOUR, TELEGRAM_API_URL,
+                     OUTBOX_WORKERS, OUTBOX_MAX_ATTEMPTS, OUTBOX_RETENTION_DAYS, LEADER_LEASE_SEC)
 
 log = logging.getLogger(__name__)
 
+# очередь + поток записи, JSON в logs/main3.log (см. logsetup.py); из host.py — уже настроено
+setup_logging("main3")
+
+if TELEGRAM_API_URL:
+    apihelper.API_URL = TELEGRAM_API_URL  # локальный/фейковый Bot API
 bot = telebot.TeleBot(TOKEN)
 db.init_db()  # создаём схемы, если их нет
+register_policy(DB_PATH, "outbox", "created_at", OUTBOX_RETENTION_DAYS)  # история доставок
 
 # ---------- справочник знаков: канон, синонимы, эмодзи ----------
 CANON_SIGNS = [
@@ -117,6 +144,52 @@ def make_daily_text(sign: str, for_date: date) -> str:
     )
 
 
+# Текст зависит только от (sign, date): на день всего 12 разных текстов.
+# Кэш держит их для последних TEXT_CACHE_DAYS дат — рассылка на миллион
+# человек делает 12 генераций, а не миллион.
+TEXT_CACHE_DAYS = 4
+_texts: "OrderedDict[date, dict[str, str]]" = OrderedDict()
+profiling.register_gauge("main3: дат текстов в кэше", lambda: len(_texts))
+_texts_lock = threading.Lock()
+
+def daily_text(sign: str, for_date: date) -> str:
+    """make_daily_text с мемоизацией: все 12 знаков на дату считаются разом."""
+    day = _texts.get(for_date)
+    if day is None:
+        day = {s: make_daily_text(s, for_date) for s in CANON_SIGNS}
+        with _texts_lock:
+            day = _texts.setdefault(for_date, day)
+            while len(_texts) > TEXT_CACHE_DAYS:
+                _texts.popitem(last=False)  # вытесняем самую давно добавленную дату
+    return day.get(sign) or make_daily_text(sign, for_date)
+
+
+WEEKDAYS = ["Пн", "Вт", "Ср", "Чт", "Пт", "Сб", "Вс"]
+FORECAST_DAYS = 31  # горизонт календаря прогнозов (/month показывает 30 дней)
+
+def make_short_text(sign: str, for_date: date) -> str:
+    """Одна строка прогноза для /week и /month — те же «фишки», что и в make_daily_text."""
+    seed = sign.encode("utf-8") + for_date.isoformat().encode("utf-8")
+    focus = _pick(FOCUS, seed, ":focus")
+    color = _pick(COLOR, seed, ":color")
+    number = _pick(NUMBER, seed, ":num")
+    return f"{WEEKDAYS[for_date.weekday()]} {for_date.strftime('%d.%m')} — {focus}, цвет {color}, число {number}"
+
+def ensure_forecasts(today: date) -> int:
+    """
+    Досчитывает календарь прогнозов (forecasts в bot.db) до today + FORECAST_DAYS
+    и убирает прошедшие даты. Обычно — одно чтение MAX(for_date) и ничего больше.
+    """
+    last = db.forecasts_until()
+    start = max(today, date.fromisoformat(last) + timedelta(days=1)) if last else today
+    rows = [(s, (start + timedelta(days=i)).isoformat(), make_short_text(s, start + timedelta(days=i)))
+            for i in range((today + timedelta(days=FORECAST_DAYS) - start).days)
+            for s in CANON_SIGNS]
+    if rows:
+        db.save_forecasts(rows, purge_before=(today - timedelta(days=1)).isoformat())
+    return len(rows)
+
+
 # ---------- вспомогательные утилиты ----------
 def user_mention(m: types.Message) -> str:
     u = m.from_user
@@ -129,6 +202,21 @@ def parse_hour(token: str) -> int | None:
     except Exception:
         return None
 
+def parse_time(token: str) -> tuple[int, int] | None:
+    """'9' или '9:30' -> (9, 30)."""
+    hh, _, mm = token.strip().partition(":")
+    hour = parse_hour(hh)
+    try:
+        minute = int(mm) if mm else 0
+    except ValueError:
+        return None
+    if hour is None or not 0 <= minute <= 59:
+        return None
+    return hour, minute
+
+def local_today(tz: str) -> date:
+    return datetime.now(ZoneInfo(tz)).date()
+
 
 # ---------- команды ----------
 @bot.message_handler(commands=["start", "help"])
@@ -138,9 +226,11 @@ def cmd_start(message: types.Message) -> None:
         "Привет! Я пришлю *гороскоп дня* без всяких API — для настроения.\n\n"
         "Сначала выбери знак и час отправки:\n"
         "• /set_sign <знак>  или нажми кнопку со знаком\n"
-        "• /set_time <0..23> час (по времени сервера)\n\n"
+        "• /set_time <ЧЧ[:ММ]> время (по твоему поясу)\n"
+        "• /set_tz <пояс> — например, /set_tz Asia/Novosibirsk\n\n"
         "Полезное:\n"
         "• /today — прислать на сегодня\n"
+        "• /week и /month — прогноз на неделю и месяц\n"
         "• /subscribe и /unsubscribe\n"
         "• /me — показать мои настройки\n"
         "• /signs — список знаков\n"
@@ -164,7 +254,6 @@ def cmd_set_sign(message: types.Message) -> None:
     if not s:
         bot.reply_to(message, "Не узнал знак. Напиши один из: " + ", ".join(CANON_SIGNS))
         return
-    db.ensure_user(message.from_user.id)
     db.set_sign(message.from_user.id, s)
     bot.reply_to(message, f"Знак сохранён: {SIGN_EMOJI[s]} {s.capitalize()}")
 
@@ -172,25 +261,33 @@ def cmd_set_sign(message: types.Message) -> None:
 @bot.message_handler(commands=["set_time"])
 def cmd_set_time(message: types.Message) -> None:
     parts = message.text.split(maxsplit=1)
-    hour = parse_hour(parts[1]) if len(parts) == 2 else None
-    if hour is None:
-        bot.reply_to(message, "Формат: /set_time <час 0..23>  (например: /set_time 9)")
+    hm = parse_time(parts[1]) if len(parts) == 2 else None
+    if hm is None:
+        bot.reply_to(message, "Формат: /set_time <ЧЧ[:ММ]>  (например: /set_time 9 или /set_time 7:30)")
         return
-    db.ensure_user(message.from_user.id)
-    db.set_notify_hour(message.from_user.id, hour)
-    bot.reply_to(message, f"Час отправки сохранён: {hour}:00")
+    db.set_notify_hour(message.from_user.id, *hm)
+    bot.reply_to(message, f"Время отправки сохранено: {hm[0]}:{hm[1]:02d}")
+
+
+@bot.message_handler(commands=["set_tz"])
+def cmd_set_tz(message: types.Message) -> None:
+    parts = message.text.split(maxsplit=1)
+    tz = parts[1].strip() if len(parts) == 2 else ""
+    if not tz or not db.valid_tz(tz):
+        bot.reply_to(message, "Формат: /set_tz <пояс IANA>  (например: /set_tz Europe/Moscow, /set_tz Asia/Omsk)")
+        return
+    db.set_tz(message.from_user.id, tz)
+    bot.reply_to(message, f"Часовой пояс сохранён: {tz}")
 
 
 @bot.message_handler(commands=["subscribe"])
 def cmd_subscribe(message: types.Message) -> None:
-    db.ensure_user(message.from_user.id)
     db.set_subscribed(message.from_user.id, True)
     bot.reply_to(message, "Подписка включена. Я пришлю сообщение в заданный час.")
 
 
 @bot.message_handler(commands=["unsubscribe"])
 def cmd_unsubscribe(message: types.Message) -> None:
-    db.ensure_user(message.from_user.id)
     db.set_subscribed(message.from_user.id, False)
     bot.reply_to(message, "Подписка выключена.")
 
@@ -202,60 +299,207 @@ def cmd_me(message: types.Message) -> None:
         bot.reply_to(message, "Ещё не настроено. Используй /set_sign и /set_time.")
         return
     sign = row["sign"] or "не задан"
-    hour = row["notify_hour"]
+    hour, minute = row["notify_hour"], row["notify_minute"]
     sub = "включена" if row["subscribed"] else "выключена"
     bot.reply_to(
         message,
-        f"Мои настройки:\nЗнак: {sign}\nЧас: {hour}:00\nПодписка: {sub}"
+        f"Мои настройки:\nЗнак: {sign}\nВремя: {hour}:{minute:02d} ({row['tz']})\nПодписка: {sub}"
     )
 
 
 @bot.message_handler(commands=["today"])
 def cmd_today(message: types.Message) -> None:
-    db.ensure_user(message.from_user.id)
-    row = db.get_user(message.from_user.id)
-    if not row or not row["sign"]:
+    row = db.profile(message.from_user.id)
+    if not row["sign"]:
         bot.reply_to(message, "Сначала /set_sign <знак>.")
         return
-    txt = make_daily_text(row["sign"], date.today())
+    txt = daily_text(row["sign"], local_today(row["tz"]))
     bot.send_message(message.chat.id, txt, parse_mode="Markdown")
 
 
+def _send_forecast(message: types.Message, days: int, title: str) -> None:
+    row = db.profile(message.from_user.id)
+    if not row["sign"]:
+        bot.reply_to(message, "Сначала /set_sign <знак>.")
+        return
+    today = local_today(row["tz"])
+    lines = db.get_forecasts(row["sign"], today.isoformat(), days)
+    if len(lines) < days:  # календарь ещё не досчитан (например, сразу после старта)
+        ensure_forecasts(today)
+        lines = db.get_forecasts(row["sign"], today.isoformat(), days)
+    s = row["sign"]
+    bot.send_message(message.chat.id, f"{SIGN_EMOJI[s]} {s.capitalize()} — {title}\n\n" + "\n".join(lines))
+
+
+@bot.message_handler(commands=["week"])
+def cmd_week(message: types.Message) -> None:
+    _send_forecast(message, 7, "прогноз на неделю")
+
+
+@bot.message_handler(commands=["month"])
+def cmd_month(message: types.Message) -> None:
+    _send_forecast(message, 30, "прогноз на месяц")
+
+
+@bot.message_handler(commands=["perf"])
+def cmd_perf(message: types.Message) -> None:
+    perf.send_report(bot, message)
+
+
+@bot.message_handler(commands=["profile"])
+def cmd_profile(message: types.Message) -> None:
+    profiling.handle_command(bot, message, (message.text or "").partition(" ")[2])
+
+
 # ---------- обработка нажатий по клавиатуре со знаками ----------
 @bot.message_handler(func=lambda m: (m.text or "").strip().lower() in CANON_SIGNS)
 def kb_pick_sign(message: types.Message) -> None:
     s = (message.text or "").strip().lower()
-    db.ensure_user(message.from_user.id)
     db.set_sign(message.from_user.id, s)
     bot.reply_to(message, f"Знак сохранён: {SIGN_EMOJI[s]} {s.capitalize()}")
 
 
+# время каждого обработчика — и при запуске python main3.py, и из host.py
+metrics.instrument_bot(bot, "main3")
+
+
 # ---------- планировщик ежедневной отправки ----------
+# Планировщик (producer) только ставит должников в outbox и сдвигает им слот;
+# отправляют воркеры (consumers), которые берут строки outbox в аренду.
+# Падение процесса ничего не теряет: неподтверждённая аренда истечёт,
+# и строку возьмёт следующий воркер (доставка «хотя бы один раз»).
+SEND_BATCH = 500      # строк в одной транзакции планировщика / одной аренде воркера
+RETRY_DELAY = 60      # базовая пауза перед повтором, дальше — экспоненциально
+IDLE_WAKE = 3600      # если рассылать некому — всё равно проснуться раз в час
+LEASE_SEC = 120       # аренда должна покрывать отправку целой пачки
+OUTBOX_POLL = 5       # как часто воркер без работы заглядывает в очередь
+LEADER_LEASE = "scheduler"
+LEADER_RENEW = LEADER_LEASE_SEC / 3  # продлеваем с запасом: две неудачи подряд ещё не теряют аренду
+NODE_ID = f"{socket.gethostname()}:{os.getpid()}"  # уникален между процессами и хостами
+broadcaster = Broadcaster(bot.send_message)
+
+_wake = threading.Event()
+_planned_ts = [float("inf")]  # когда планировщик собирается проснуться
+# появилась работа в outbox: будим всех ждущих воркеров (notify_all); счётчик
+# поколений не даёт потерять сигнал, пришедший, пока воркер ещё отправлял
+_outbox_ready = threading.Condition()
+_outbox_gen = [0]
+
+
+def _notify_outbox() -> None:
+    with _outbox_ready:
+        _outbox_gen[0] += 1
+        _outbox_ready.notify_all()
+
+
+def _on_user_change(row) -> None:
+    # разбудить, только если новый слот раньше запланированного пробуждения
+    if row["next_send_at"] is not None and row["next_send_at"] < _planned_ts[0]:
+        _wake.set()
+
+db.add_user_listener(_on_user_change)
+
+
+def _now_ts() -> float:
+    return datetime.now(timezone.utc).timestamp()
+
+
+def enqueue_due(now_ts: float, token: int | None = None) -> int:
+    """
+    Все, у кого next_send_at <= now, — в outbox страницами по SEND_BATCH.
+    token — fencing token аренды лидера: каждая пачка пишется, только пока аренда наша.
+    """
+    fence = (LEADER_LEASE, NODE_ID, token) if token is not None else None
+    queued = 0
+    for batch in db.iter_due(now_ts, page_size=SEND_BATCH):
+        queued += db.enqueue_due(batch, now_ts, fence)
+    if queued:
+        _notify_outbox()
+    return queued
+
+
 def scheduler_loop() -> None:
-    log.info("Scheduler started")
+    log.info("Scheduler started on %s", NODE_ID)
+    token = None
     while True:
-        now = datetime.now()               # время сервера
-        today_str = now.strftime("%Y-%m-%d")
-        hour = now.hour
+        _wake.clear()
+        now_ts = _now_ts()
         try:
-            due = db.list_due_users(today_str, hour)
-            for u in due:
-                # Сгенерировать текст и отправить:
-                txt = make_daily_text(u["sign"], now.date())
-                try:
-                    bot.send_message(u["user_id"], txt, parse_mode="Markdown")
-                except Exception as e:
-                    log.warning("Send failed to %s: %r", u["user_id"], e)
-                # Отметить отправку за сегодня:
-                db.mark_sent_today(u["user_id"], today_str)
+            prev, token = token, db.acquire_lease(LEADER_LEASE, NODE_ID, LEADER_LEASE_SEC, now_ts)
+            if token != prev:
+                log.info("Scheduler: %s", f"leader (token {token})" if token else "standby")
+            if token is None:
+                wake_at = now_ts + LEADER_RENEW  # резерв: пробуем перехватить аренду
+            else:
+                ensure_forecasts(date.today())
+                queued = enqueue_due(now_ts, token)
+                if queued:
+                    log.info("Scheduler: %d deliveries queued", queued)
+                # спим до ближайшего слота; раньше — если кто-то выбрал более ранний слот
+                # или пора продлевать аренду
+                nxt = db.next_due_ts()
+                wake_at = min(nxt if nxt is not None else now_ts + IDLE_WAKE, now_ts + LEADER_RENEW)
+        except db.LeaseLost as e:
+            log.warning("Scheduler: %s", e)
+            token, wake_at = None, now_ts
         except Exception as e:
             log.exception("Scheduler error: %r", e)
-        time.sleep(60)  # проверяем раз в минуту
+            wake_at = now_ts + min(RETRY_DELAY, LEADER_RENEW)
+        _planned_ts[0] = wake_at
+        _wake.wait(max(wake_at - _now_ts(), 0.0))
+
+
+def deliver_batch(owner: str) -> int:
+    """
+    Берёт в аренду пачку из outbox, отправляет, подтверждает доставленных,
+    остальным — повтор или dead letter. Возвращает размер пачки.
+    """
+    rows = db.lease_outbox(owner, SEND_BATCH, LEASE_SEC, _now_ts())
+    if not rows:
+        return 0
+    # ключ задания — id строки outbox: у одного пользователя в аренде может быть
+    # две строки (вчерашний повтор и сегодняшняя), и каждую надо подтвердить отдельно
+    jobs, users = [], {}
+    for r in rows:
+        # дата гороскопа — местная дата слота пользователя
+        jobs.append((r["user_id"], daily_text(r["sign"], date.fromisoformat(r["send_date"])), r["id"]))
+        users[r["id"]] = r["user_id"]
+    res = broadcaster.run(jobs, parse_mode="Markdown")
+    db.ack_outbox(res.delivered, owner)
+    db.retry_outbox(res.failed, owner, _now_ts(), "send failed", OUTBOX_MAX_ATTEMPTS, RETRY_DELAY)
+    db.dead_outbox(res.blocked, owner, "blocked by user")
+    db.dead_outbox(res.rejected, owner, "rejected by Telegram")  # 400 и т.п.: повтор не поможет
+    for uid in {users[i] for i in res.blocked}:  # бот заблокирован — дальше слать бессмысленно
+        db.set_subscribed(uid, False)
+    if res.failed or res.blocked or res.rejected:
+        log.warning("Outbox: %d delivered, %d to retry, %d blocked, %d rejected",
+                    len(res.delivered), len(res.failed), len(res.blocked), len(res.rejected))
+    return len(rows)
+
+
+def outbox_worker(owner: str) -> None:
+    log.info("Outbox worker %s started", owner)
+    while True:
+        seen = _outbox_gen[0]
+        try:
+            if deliver_batch(owner):
+                continue
+            nxt = db.outbox_next_ready_ts()
+            timeout = OUTBOX_POLL if nxt is None else min(OUTBOX_POLL, max(nxt - _now_ts(), 0.0))
+        except Exception as e:
+            log.exception("Outbox worker %s error: %r", owner, e)
+            timeout = OUTBOX_POLL
+        with _outbox_ready:
+            _outbox_ready.wait_for(lambda: _outbox_gen[0] != seen, timeout)
 
 
 def start_scheduler() -> None:
     t = threading.Thread(target=scheduler_loop, name="daily-scheduler", daemon=True)
     t.start()
+    # имя владельца аренды outbox уникально между процессами: хост + pid + номер
+    for i in range(OUTBOX_WORKERS):
+        threading.Thread(target=outbox_worker, args=(f"{NODE_ID}:{i}",),
+                         name=f"outbox-{i}", daemon=True).start()
 
 
 # ---------- меню команд в клиенте (см. Л2) ----------
@@ -263,8 +507,11 @@ def setup_bot_commands() -> None:
     cmds = [
         types.BotCommand("start", "Начало и помощь"),
         types.BotCommand("set_sign", "Установить знак зодиака"),
-        types.BotCommand("set_time", "Установить час отправки"),
+        types.BotCommand("set_time", "Установить время отправки"),
+        types.BotCommand("set_tz", "Установить часовой пояс"),
         types.BotCommand("today", "Прислать на сегодня"),
+        types.BotCommand("week", "Прогноз на неделю"),
+        types.BotCommand("month", "Прогноз на месяц"),
         types.BotCommand("subscribe", "Включить подписку"),
         types.BotCommand("unsubscribe", "Выключить подписку"),
         types.BotCommand("me", "Мои настройки"),
@@ -274,7 +521,24 @@ def setup_bot_commands() -> None:
 
 
 # ---------- точка входа ----------
-if __name__ == "__main__":
+POLLING = {"skip_pending": True}  # параметры infinity_polling
+BACKUP_DBS = [DB_PATH]            # база этого бота для start_backup_scheduler
+
+
+def startup() -> None:
     setup_bot_commands()        # удобство для пользователей [oai_citation:8‡L2_Текст к лекции.pdf](file-service://file-6kQEVmhZuKhD1nBDo1XNnq)
     start_scheduler()           # запускаем фоновую проверку
-    bot.infinity_polling(skip_pending=True)  # запуск long polling (паттерн Л2/Л3) [oai_citation:9‡L2_Текст к лекции.pdf](file-service://file-6kQEVmhZuKhD1nBDo1XNnq) [oai_citation:10‡L3.pdf](file-service://file-TzQZFVK22mksuAGPBby5ME)
+
+
+def shutdown() -> None:
+    db.release_lease(LEADER_LEASE, NODE_ID)  # резерв станет лидером сразу, не дожидаясь истечения
+
+
+if __name__ == "__main__":
+    startup()
+    start_backup_scheduler(BACKUP_DBS)  # онлайн-бэкап, если задан BACKUP_INTERVAL_SEC
+    start_retention_scheduler()         # чистка outbox, если задан RETENTION_INTERVAL_SEC
+    try:
+        run_bot(bot, **POLLING)  # long polling (паттерн Л2/Л3) или webhook по BOT_MODE [oai_citation:9‡L2_Текст к лекции.pdf](file-service://file-6kQEVmhZuKhD1nBDo1XNnq) [oai_citation:10‡L3.pdf](file-service://file-TzQZFVK22mksuAGPBby5ME)
+    finally:
+        shutdown()
@@ -0,0 +1,387 @@
+"""
+metrics.py — счётчики и гистограммы в текстовом формате Prometheus, без внешних пакетов.
+
+Что меряется:
+  - bot_handler_seconds{bot,handler}     — каждый обработчик telebot и шаг
+                                           register_next_step_handler (instrument_bot);
+  - router_command_seconds{command}      — команды и кнопки main.py (router.py);
+  - db_call_seconds{module,function}     — каждая публичная функция db.py / db3.py
+                                           (instrument_module в конце модуля);
+  - openrouter_request_seconds{model,status} — запросы к моделям (openrouter_client.py);
+  - openrouter_tokens_total{model,kind}  — токены из usage ответов (kind: prompt / completion);
+  - telegram_api_seconds{method,status}  — вызовы Bot API: sendMessage, editMessageText, ...
+                                           (instrument_telegram);
+  - upstream_request_seconds{service}    — прочие внешние API (погода в main.py);
+  - *_errors_total — исключения там же.
+
+Обёртки обработчиков ещё и раскладывают время вызова на db / upstream /
+telegram (потоковый _span) и пишут его в perf.py — оттуда команда /perf.
+
+Отдаётся GET /metrics отдельным HTTP-сервером на METRICS_LISTEN (например
+127.0.0.1:9108) — в обоих режимах. Порт webhook смотрит в интернет (или стоит
+за прокси, и тогда все запросы приходят с loopback), поэтому метрик там нет;
+доступ к METRICS_LISTEN ограничивается адресом, на котором он слушает.
+Там же — JSON-страницы других модулей (register_page: /stats webhook-сервера).
+
+Накладные расходы — словарь меток, bisect по границам и короткая блокировка
+на одно наблюдение (~1-2 мкс). Границы гистограмм (секунды): METRICS_BUCKETS,
+через запятую.
+"""
+
+from __future__ import annotations
+import os
+import json
+import time
+import bisect
+import inspect
+import logging
+import functools
+import threading
+from typing import Callable, Sequence
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from dotenv import load_dotenv
+
+import perf
+import profiling
+
+load_dotenv()  # модуль импортируется раньше, чем боты читают .env
+
+log = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+BUCKETS = tuple(sorted(float(b) for b in os.getenv("METRICS_BUCKETS", "").split(",") if b.strip())) or DEFAULT_BUCKETS
+METRICS_LISTEN = os.getenv("METRICS_LISTEN", "")
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, doc: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.doc = doc
+        self.labelnames = tuple(labelnames)
+        self._children: dict[tuple, object] = {}
+        self._lock = threading.Lock()
+        REGISTRY.register(self)
+
+    def labels(self, *values):
+        key = tuple(str(v) for v in values)
+        child = self._children.get(key)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(key, self._new_child())
+        return child
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.doc}", f"# TYPE {self.name} {self.kind}"]
+        for key, child in sorted(self._children.items()):
+            lines.extend(self._render_child(key, child))
+        return lines
+
+    def _render_child(self, key: tuple, child) -> list[str]:
+        raise NotImplementedError
+
+
+class _CounterValue:
+    __slots__ = ("value", "lock")
+
+    def __init__(self):
+        self.value = 0.0
+        self.lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0) -> None:
+        with self.lock:
+            self.value += amount
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _new_child(self) -> _CounterValue:
+        return _CounterValue()
+
+    def _render_child(self, key: tuple, child: _CounterValue) -> list[str]:
+        return [f"{self.name}_total{_labels(self.labelnames, key)} {child.value}"]
+
+
+class _HistogramValue:
+    __slots__ = ("bounds", "counts", "sum", "lock")
+
+    def __init__(self, bounds: tuple):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)  # последняя ячейка — +Inf
+        self.sum = 0.0
+        self.lock = threading.Lock()
+
+    def observe(self, value: float) -> None:
+        i = bisect.bisect_left(self.bounds, value)
+        with self.lock:
+            self.counts[i] += 1
+            self.sum += value
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, doc: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, doc, labelnames)
+
+    def _new_child(self) -> _HistogramValue:
+        return _HistogramValue(self.buckets)
+
+    def _render_child(self, key: tuple, child: _HistogramValue) -> list[str]:
+        with child.lock:
+            counts, total = list(child.counts), child.sum
+        lines, acc = [], 0
+        for bound, n in zip(self.buckets + (float("inf"),), counts):
+            acc += n
+            le = 'le="%s"' % ("+Inf" if bound == float("inf") else repr(bound))
+            lines.append(f"{self.name}_bucket{_labels(self.labelnames, key, le)} {acc}")
+        lines.append(f"{self.name}_sum{_labels(self.labelnames, key)} {total}")
+        lines.append(f"{self.name}_count{_labels(self.labelnames, key)} {acc}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self.metrics: list[_Metric] = []
+
+    def register(self, metric: _Metric) -> None:
+        self.metrics.append(metric)
+
+    def render(self) -> str:
+        lines: list[str] = []
+        for m in self.metrics:
+            lines.extend(m.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+HANDLER_SECONDS = Histogram("bot_handler_seconds", "Время обработчика telebot", ("bot", "handler"))
+HANDLER_ERRORS = Counter("bot_handler_errors", "Исключения в обработчиках", ("bot", "handler"))
+COMMAND_SECONDS = Histogram("router_command_seconds", "Время команды/кнопки main.py", ("command",))
+DB_SECONDS = Histogram("db_call_seconds", "Время функций db.py / db3.py", ("module", "function"))
+DB_ERRORS = Counter("db_call_errors", "Исключения в функциях db.py / db3.py", ("module", "function"))
+OPENROUTER_SECONDS = Histogram("openrouter_request_seconds", "Запросы к OpenRouter", ("model", "status"))
+OPENROUTER_TOKENS = Counter("openrouter_tokens", "Токены OpenRouter (usage ответа)", ("model", "kind"))
+TELEGRAM_SECONDS = Histogram("telegram_api_seconds", "Вызовы Bot API", ("method", "status"))
+UPSTREAM_SECONDS = Histogram("upstream_request_seconds", "Прочие внешние API (погода, ...)", ("service",))
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# текущий обработчик в потоке: parts — секунды по видам (perf.PARTS), name — имя для /perf
+_span = threading.local()
+
+
+def charge(kind: str, seconds: float) -> None:
+    """Добавляет время к разбивке текущего обработчика (вне обработчика — ничего)."""
+    parts = getattr(_span, "parts", None)
+    if parts is not None:
+        parts[kind] += seconds
+
+
+def name_span(name: str) -> None:
+    """Имя текущего вызова в /perf вместо имени функции (роутер: /команда)."""
+    _span.name = name
+
+
+def timed(hist: Histogram, errors: Counter | None, *labels: str, kind: str | None = None) -> Callable:
+    """
+    Декоратор: время вызова в hist{labels}, исключение — errors{labels}.
+    kind ("db", "upstream") — ещё и в разбивку времени текущего обработчика
+    для /perf; вложенные вызовы того же вида не суммируются.
+    """
+    def deco(fn: Callable) -> Callable:
+        h = hist.labels(*labels)
+        e = errors.labels(*labels) if errors else None
+        depth_attr = f"depth_{kind}"
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if kind:
+                depth = getattr(_span, depth_attr, 0)
+                setattr(_span, depth_attr, depth + 1)
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            except Exception:
+                if e is not None:
+                    e.inc()
+                raise
+            finally:
+                elapsed = time.perf_counter() - start
+                h.observe(elapsed)
+                if kind:
+                    setattr(_span, depth_attr, depth)
+                    if depth == 0:
+                        charge(kind, elapsed)
+        wrapper.__wrapped_metrics__ = True
+        return wrapper
+    return deco
+
+
+def instrument_module(namespace: dict, module: str) -> None:
+    """
+    Оборачивает публичные функции, определённые в модуле (передайте globals()).
+    Вызовы изнутри модуля тоже идут через обёртки — время вложенных функций
+    видно отдельно. Генераторы и @contextmanager пропускаются: их вызов
+    только создаёт объект.
+    """
+    for name, fn in list(namespace.items()):
+        if (name.startswith("_") or not inspect.isfunction(fn) or fn.__module__ != namespace["__name__"]
+                or getattr(fn, "__wrapped_metrics__", False)
+                or inspect.isgeneratorfunction(inspect.unwrap(fn))):
+            continue
+        namespace[name] = timed(DB_SECONDS, DB_ERRORS, module, name, kind="db")(fn)
+
+
+def _run_handler(bot_name: str, handler: str, title: str, call: Callable, args: tuple):
+    """Вызов обработчика: гистограмма + запись в perf с разбивкой db/upstream/telegram."""
+    if getattr(_span, "parts", None) is not None:  # обработчик из обработчика — время уже идёт во внешний
+        return call()
+    parts = _span.parts = dict.fromkeys(perf.PARTS, 0.0)
+    _span.name = None
+    if profiling.cprofile_active():  # идёт /profile cpu
+        call = functools.partial(profiling.run_profiled, call)
+    error = False
+    start = time.perf_counter()
+    try:
+        return call()
+    except Exception:
+        error = True
+        HANDLER_ERRORS.labels(bot_name, handler).inc()
+        raise
+    finally:
+        total = time.perf_counter() - start
+        _span.parts = None
+        HANDLER_SECONDS.labels(bot_name, handler).observe(total)
+        user = getattr(args[0], "from_user", None) if args else None
+        perf.record(bot_name, _span.name or title, total, parts, getattr(user, "id", None), error)
+
+
+def _wrap_handler(bot_name: str, handler: dict) -> None:
+    fn = handler["function"]
+    commands = (handler.get("filters") or {}).get("commands")
+    title = "/" + commands[0] if commands else fn.__name__
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        return _run_handler(bot_name, fn.__name__, title, lambda: fn(*args, **kwargs), args)
+    wrapper.__wrapped_metrics__ = True
+    handler["function"] = wrapper
+
+
+def instrument_bot(bot, name: str) -> None:
+    """
+    Время каждого обработчика бота. Зарегистрированные обработчики
+    (bot.*_handlers) оборачиваются по имени функции; шаги
+    register_next_step_handler telebot вызывает через bot._exec_task —
+    их меряем там. Вызывать после регистрации обработчиков; повторный
+    вызов (модуль бота, затем webhook.run_bots) ничего не оборачивает
+    дважды и не меняет имя бота в метках.
+    """
+    for attr, handlers in vars(bot).items():
+        if not attr.endswith("_handlers") or not isinstance(handlers, list):
+            continue
+        for handler in handlers:
+            fn = handler.get("function") if isinstance(handler, dict) else None
+            if fn is not None and not getattr(fn, "__wrapped_metrics__", False):
+                _wrap_handler(name, handler)
+
+    if getattr(bot, "_metrics_name", None):
+        return
+    bot._metrics_name = name
+    exec_task = bot._exec_task
+
+    def _exec_task(task, *args, **kwargs):
+        handler = getattr(task, "__name__", "task")
+        if handler == "_run_middlewares_and_handler" or bot.threaded:
+            # обычные обработчики уже обёрнуты; в режиме threaded задача только ставится в пул
+            return exec_task(task, *args, **kwargs)
+        return _run_handler(name, handler, handler, lambda: exec_task(task, *args, **kwargs), args)
+
+    bot._exec_task = _exec_task
+
+
+_telegram_patched = False
+
+
+def instrument_telegram() -> None:
+    """Время каждого запроса к Bot API по методу (apihelper._make_request)."""
+    global _telegram_patched
+    if _telegram_patched:
+        return
+    from telebot import apihelper
+    make_request = apihelper._make_request
+
+    def _make_request(token, method_name, *args, **kwargs):
+        start = time.perf_counter()
+        status = "error"
+        try:
+            result = make_request(token, method_name, *args, **kwargs)
+            status = "ok"
+            return result
+        finally:
+            elapsed = time.perf_counter() - start
+            TELEGRAM_SECONDS.labels(method_name, status).observe(elapsed)
+            charge("telegram", elapsed)
+
+    apihelper._make_request = _make_request
+    _telegram_patched = True
+
+
+_pages: dict[str, Callable[[], object]] = {}
+
+
+def register_page(path: str, fn: Callable[[], object]) -> None:
+    """GET path на сервере METRICS_LISTEN отдаёт fn() в JSON."""
+    _pages[path] = fn
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self) -> None:
+        path = self.path.split("?", 1)[0]
+        if path == "/metrics":
+            body, ctype = REGISTRY.render().encode("utf-8"), CONTENT_TYPE
+        elif path in _pages:
+            body, ctype = json.dumps(_pages[path](), ensure_ascii=False).encode("utf-8"), "application/json"
+        else:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", ctype)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args) -> None:
+        pass
+
+
+def start_http_server(listen: str = METRICS_LISTEN) -> ThreadingHTTPServer | None:
+    """Отдельный сервер /metrics (и register_page) на listen ("host:port"); пусто — не запускается."""
+    if not listen:
+        return None
+    host, _, port = listen.rpartition(":")
+    server = ThreadingHTTPServer((host or "127.0.0.1", int(port)), _Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    log.info("Metrics on http://%s:%d/metrics", *server.server_address[:2])
+    return server
@@ -7,9 +7,12 @@ from dataclasses import dataclass
 from typing import Dict, List, Optional
 from dotenv import load_dotenv
 
+from metrics import OPENROUTER_SECONDS, OPENROUTER_TOKENS, charge
+
 load_dotenv()
 
-OPENROUTER_API = 'https://openrouter.ai/api/v1/chat/completions'
+# адрес можно подменить (локальный симулятор benchmarks/fake_openrouter.py, прокси)
+OPENROUTER_API = os.getenv('OPENROUTER_API_URL') or 'https://openrouter.ai/api/v1/chat/completions'
 OPENROUTER_API_KEY = os.getenv('OPENROUTER_API_KEY')
 
 
@@ -29,6 +32,7 @@ def _friendly_status(status: int) -> str:
         403: 'Нет прав доступа к модели.',
         404: 'Эндпоинт не найден. Проверьте URL /api/v1/chat/completions.',
         405: 'Превышен лимит бесплатной модели. Попробуйте позднее.',
+        429: 'Слишком много запросов к модели. Попробуйте позднее.',
         500: 'Внутренняя ошибка сервера OpenRouter. Попробуйте позже.',
         502: 'Плохой шлюз. Сервер OpenRouter временно недоступен.',
         503: 'Сервис OpenRouter временно недоступен. Попробуйте позже.',
@@ -52,7 +56,7 @@ class OpenRouterClient:
     3. Валидируем и нормализуем.
        Проверяем наличие ключа, модели, формируем 
        «дружественные» сообщения об ошибках (401/404/429/5xx), 
-       гарантируем одинаковый тип возврата (text: str, latency, ms: int).
+       гарантируем одинаковый тип возврата (text: str, latency, ms: int, usage: dict).
     """
 
     def __init__(self):
@@ -65,7 +69,7 @@ class OpenRouterClient:
 
     def chat_once(self, messages: List[dict], model: str, temperature: float = 0.7, max_tokens: int = 1000) -> tuple:
         """
-        Отправляет запрос к модели и возвращает ответ и время выполнения.
+        Отправляет запрос к модели и возвращает ответ, время выполнения и расход токенов.
 
         Args:
             messages: Список сообщений в формате OpenAI
@@ -74,7 +78,9 @@ class OpenRouterClient:
             max_tokens: Максимальное количество токенов
 
         Returns:
-            tuple: (текст ответа, время выполнения в мс)
+            tuple: (текст ответа, время выполнения в мс, usage) — usage как в ответе
+            OpenRouter: prompt_tokens, completion_tokens, total_tokens и cost
+            (в кредитах OpenRouter ≈ USD; пустой dict, если провайдер не прислал)
 
         Raises:
             OpenRouterError: При ошибках API
@@ -89,9 +95,11 @@ class OpenRouterClient:
             "messages": messages,
             "temperature": temperature,
             "max_tokens": max_tokens,
+            "usage": {"include": True},  # OpenRouter добавит в usage стоимость запроса (cost)
         }
 
         start_time = time.time()
+        status = "error"
 
         try:
             response = requests.post(
@@ -103,6 +111,7 @@ class OpenRouterClient:
 
             # Обработка HTTP ошибок
             if response.status_code != 200:
+                status = str(response.status_code)
                 friendly_msg = _friendly_status(response.status_code)
                 raise OpenRouterError(response.status_code, friendly_msg)
 
@@ -113,14 +122,24 @@ class OpenRouterClient:
                 raise OpenRouterError(500, "Пустой ответ от модели")
 
             text = data["choices"][0]["message"]["content"]
+            usage = data.get("usage") or {}
             end_time = time.time()
             latency_ms = int((end_time - start_time) * 1000)
+            status = "ok"
+            OPENROUTER_TOKENS.labels(model, "prompt").inc(usage.get("prompt_tokens") or 0)
+            OPENROUTER_TOKENS.labels(model, "completion").inc(usage.get("completion_tokens") or 0)
 
-            return text, latency_ms
+            return text, latency_ms, usage
 
+        except OpenRouterError:
+            raise
         except requests.exceptions.Timeout:
             raise OpenRouterError(504, "Таймаут запроса к OpenRouter")
         except requests.exceptions.ConnectionError:
             raise OpenRouterError(503, "Ошибка соединения с OpenRouter")
         except Exception as e:
-            raise OpenRouterError(500, f"Неизвестная ошибка: {str(e)}")
\ No newline at end of file
+            raise OpenRouterError(500, f"Неизвестная ошибка: {str(e)}")
+        finally:
+            elapsed = time.time() - start_time
+            OPENROUTER_SECONDS.labels(model, status).observe(elapsed)
+            charge("upstream", elapsed)
\ No newline at end of file
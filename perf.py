@@ -0,0 +1,110 @@
+"""
+perf.py — «горячие» команды прямо из Telegram: админская команда /perf.
+
+Каждый вызов обработчика (обёртка из metrics.instrument_bot) записывается
+сюда с разбивкой времени:
+  db       — функции db.py / db3.py (внешний вызов, вложенные не суммируются);
+  upstream — внешние API: OpenRouter, погода;
+  telegram — запросы к Bot API из обработчика (sendMessage, editMessageText, ...);
+  остальное — собственный код обработчика.
+
+Память ограничена: на команду — счётчики и кольцевой буфер последних
+PERF_WINDOW длительностей (по нему считаются p50/p95/p99), плюс общий
+кольцевой буфер последних PERF_RECENT вызовов — из него /perf выбирает самые
+медленные. Запись — добавление в deque под блокировкой, сортировка только
+при показе отчёта.
+
+Доступ к /perf — пользователям из ADMIN_IDS (id через запятую).
+"""
+
+from __future__ import annotations
+import os
+import time
+import threading
+from collections import deque
+from datetime import datetime
+
+from dotenv import load_dotenv
+
+load_dotenv()  # модуль импортируется раньше, чем боты читают .env
+
+PERF_WINDOW = int(os.getenv("PERF_WINDOW", "512"))
+PERF_RECENT = int(os.getenv("PERF_RECENT", "1000"))
+ADMIN_IDS = frozenset(int(x) for x in os.getenv("ADMIN_IDS", "").replace(" ", "").split(",") if x)
+
+PARTS = ("db", "upstream", "telegram")
+
+
+class _CommandStats:
+    __slots__ = ("calls", "errors", "window", "parts")
+
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.window: deque = deque(maxlen=PERF_WINDOW)
+        self.parts = dict.fromkeys(PARTS, 0.0)  # суммарно за всё время
+
+
+_lock = threading.Lock()
+_stats: dict[tuple[str, str], _CommandStats] = {}
+_recent: deque = deque(maxlen=PERF_RECENT)  # (ts, bot, command, total, parts, user_id)
+
+
+def is_admin(user_id) -> bool:
+    return user_id in ADMIN_IDS
+
+
+def record(bot: str, command: str, total: float, parts: dict, user_id=None, error: bool = False) -> None:
+    """Один вызов обработчика: total и parts — секунды."""
+    with _lock:
+        st = _stats.get((bot, command))
+        if st is None:
+            st = _stats[(bot, command)] = _CommandStats()
+        st.calls += 1
+        st.errors += error
+        st.window.append(total)
+        for k in PARTS:
+            st.parts[k] += parts[k]
+        _recent.append((time.time(), bot, command, total, dict(parts), user_id))
+
+
+def _pct(sorted_values: list, q: float) -> float:
+    return sorted_values[min(len(sorted_values) - 1, int(q * len(sorted_values)))]
+
+
+def report(top: int = 15, slowest: int = 5) -> str:
+    """Текст для /perf: команды по суммарному времени и самые медленные недавние вызовы."""
+    with _lock:
+        rows = [(bot, cmd, st.calls, st.errors, sorted(st.window), dict(st.parts)) for (bot, cmd), st in _stats.items()]
+        recent = sorted(_recent, key=lambda r: r[3], reverse=True)[:slowest]
+    if not rows:
+        return "Пока нет вызовов."
+
+    ms = lambda s: f"{s * 1000:.0f}"  # noqa: E731
+    rows.sort(key=lambda r: sum(r[4]) / len(r[4]) * r[2], reverse=True)
+    lines = ["команда            вызовы  p50  p95  p99 мс | db/up/tg ср. мс"]
+    for bot, cmd, calls, errors, window, parts in rows[:top]:
+        name = cmd if len({r[0] for r in rows}) == 1 else f"{bot}:{cmd}"
+        err = f" !{errors}" if errors else ""
+        lines.append(f"{name[:18]:18} {calls:6}{err} {ms(_pct(window, .5)):>4} {ms(_pct(window, .95)):>4} "
+                     f"{ms(_pct(window, .99)):>4} | "
+                     + "/".join(ms(parts[k] / calls) for k in PARTS))
+    lines.append("")
+    lines.append("медленные недавние:")
+    for ts, bot, cmd, total, parts, user_id in recent:
+        lines.append(f"{datetime.fromtimestamp(ts):%H:%M:%S} {cmd[:18]:18} {ms(total):>5} мс "
+                     f"(db {ms(parts['db'])}, up {ms(parts['upstream'])}, tg {ms(parts['telegram'])}) id={user_id}")
+    return "\n".join(lines)
+
+
+def send_report(bot, message) -> None:
+    """Обработчик /perf для любого из ботов."""
+    if not is_admin(message.from_user.id):
+        bot.reply_to(message, "Команда только для администраторов.")
+        return
+    text = report()[:3500]  # с экранированием и <pre> — в пределах 4096 символов сообщения
+    bot.send_message(message.chat.id, f"<pre>{_escape(text)}</pre>", parse_mode="HTML")
+
+
+def _escape(text: str) -> str:
+    return text.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
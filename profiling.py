@@ -0,0 +1,326 @@
+"""
+profiling.py — профилирование работающего процесса бота без перезапуска.
+
+Зачем: когда процесс разрастается по памяти или грузит CPU, перезапуск
+уничтожает улики. Здесь профиль снимается на ходу и приходит файлом.
+
+Админская команда /profile (ADMIN_IDS, см. perf.py):
+  /profile [сек]        — сэмплирующий профиль всех потоков (по умолчанию
+                          PROFILE_SECONDS): раз в PROFILE_INTERVAL снимаются
+                          стеки потоков, на Linux — только тех, что реально
+                          тратили CPU; отчёт — топ функций и стеков (.txt);
+  /profile cpu [сек]    — cProfile каждого вызова обработчика за это время,
+                          результат — .pstats (python -m pstats) и текстовый топ;
+  /profile mem          — tracemalloc: первый вызов запускает трассировку,
+                          следующие присылают разницу с прошлым снимком
+                          (топ строк по приросту) и размеры кэшей / числа
+                          next-step обработчиков (register_gauge);
+  /profile mem stop     — выключить tracemalloc (пока он включён, выделение
+                          памяти в несколько раз дороже).
+
+Сигналы (не Windows): SIGUSR1 — сэмплирующий профиль, SIGUSR2 — снимок
+памяти; отчёты пишутся в LOG_DIR (profile-*.txt, mem-*.txt).
+
+Выключенный профилировщик ничего не стоит: нет ни потока, ни трассировки,
+обёртка обработчика проверяет одну глобальную переменную.
+"""
+
+from __future__ import annotations
+import io
+import os
+import sys
+import time
+import signal
+import pstats
+import cProfile
+import logging
+import threading
+import tempfile
+import tracemalloc
+from collections import Counter
+from datetime import datetime
+from typing import Callable
+
+from dotenv import load_dotenv
+
+import perf
+
+load_dotenv()  # модуль импортируется раньше, чем боты читают .env
+
+log = logging.getLogger(__name__)
+
+PROFILE_SECONDS = int(os.getenv("PROFILE_SECONDS", "30"))
+PROFILE_MAX_SECONDS = 300
+PROFILE_INTERVAL = float(os.getenv("PROFILE_INTERVAL", "0.005"))
+# глубина стека tracemalloc: 1 — только строка выделения; 10 кадров замедляют
+# выделение памяти в ~15 раз против ~4 раз у одного кадра
+PROFILE_MEM_FRAMES = int(os.getenv("PROFILE_MEM_FRAMES", "1"))
+LOG_DIR = os.getenv("LOG_DIR", "logs")
+
+_busy = threading.Lock()                 # одна сессия профилирования за раз
+_cprofiles: list | None = None           # идёт /profile cpu: профили вызовов обработчиков
+_cprofiles_lock = threading.Lock()
+_mem_snapshot: tracemalloc.Snapshot | None = None
+_mem_lock = threading.Lock()
+_gauges: dict[str, Callable[[], int]] = {}
+
+
+def register_gauge(name: str, fn: Callable[[], int]) -> None:
+    """Число, которое стоит видеть в отчёте памяти: размер кэша, очереди и т.п."""
+    _gauges[name] = fn
+
+
+# ---------- сэмплирующий профиль ----------
+
+def _thread_cpu_clocks() -> dict[int, int] | None:
+    """ident потока -> id часов его CPU-времени; None — платформа не умеет."""
+    if not hasattr(time, "pthread_getcpuclockid"):
+        return None
+    clocks = {}
+    for t in threading.enumerate():
+        try:
+            clocks[t.ident] = time.pthread_getcpuclockid(t.ident)
+        except (OSError, TypeError):
+            pass
+    return clocks
+
+
+def sample(seconds: float, interval: float = PROFILE_INTERVAL) -> str:
+    """Снимает стеки всех потоков seconds секунд; текстовый отчёт."""
+    own = threading.get_ident()
+    names = {t.ident: t.name for t in threading.enumerate()}
+    clocks = _thread_cpu_clocks()
+    last_cpu: dict[int, int] = {}
+    self_hits: Counter = Counter()
+    total_hits: Counter = Counter()
+    stacks: Counter = Counter()
+    samples = 0
+    end = time.monotonic() + seconds
+    while time.monotonic() < end:
+        for ident, frame in sys._current_frames().items():
+            if ident == own:
+                continue
+            if clocks is not None:  # только потоки, которые с прошлого раза тратили CPU
+                clock = clocks.get(ident)
+                if clock is None:
+                    clocks.update(_thread_cpu_clocks() or {})
+                    clock = clocks.get(ident)
+                try:
+                    cpu = time.clock_gettime_ns(clock) if clock is not None else None
+                except OSError:
+                    cpu = None
+                if cpu is not None:
+                    busy = cpu != last_cpu.get(ident)
+                    last_cpu[ident] = cpu
+                    if not busy:
+                        continue
+            stack = []
+            f = frame
+            while f is not None:
+                code = f.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{f.f_lineno})")
+                f = f.f_back
+            samples += 1
+            self_hits[stack[0].rsplit(":", 1)[0] + ")"] += 1
+            for fn in {s.rsplit(":", 1)[0] + ")" for s in stack}:
+                total_hits[fn] += 1
+            thread = names.get(ident, str(ident)).rstrip("0123456789-")
+            stacks[(thread,) + tuple(reversed(stack[:12]))] += 1
+        time.sleep(interval)
+
+    mode = "CPU (потоки, тратившие процессор)" if clocks is not None else "wall (все потоки)"
+    lines = [f"Сэмплирующий профиль: {seconds:.0f} с, интервал {interval * 1000:.1f} мс, режим {mode}",
+             f"Сэмплов: {samples}", ""]
+    if not samples:
+        lines.append("Потоки не тратили CPU за это время.")
+        return "\n".join(lines)
+    lines.append("Функции по собственному времени (self %, total %):")
+    for fn, n in self_hits.most_common(30):
+        lines.append(f"{n * 100 / samples:6.1f} {total_hits[fn] * 100 / samples:6.1f}  {fn}")
+    lines += ["", "Функции по включённому времени (total %):"]
+    for fn, n in total_hits.most_common(30):
+        lines.append(f"{n * 100 / samples:6.1f}  {fn}")
+    lines += ["", "Частые стеки (поток; корень -> лист):"]
+    for stack, n in stacks.most_common(15):
+        lines.append(f"{n * 100 / samples:6.1f}% [{stack[0]}]")
+        lines.extend(f"         {s}" for s in stack[1:])
+    return "\n".join(lines)
+
+
+# ---------- cProfile обработчиков ----------
+
+def cprofile_active() -> bool:
+    return _cprofiles is not None
+
+
+def run_profiled(call: Callable):
+    """Вызов обработчика под собственным cProfile (профиль на поток не включить снаружи)."""
+    prof = cProfile.Profile()
+    try:
+        return prof.runcall(call)
+    finally:
+        with _cprofiles_lock:
+            if _cprofiles is not None:
+                _cprofiles.append(prof)
+
+
+def cprofile(seconds: float) -> tuple[bytes, str]:
+    """Собирает профили обработчиков за seconds; (.pstats в байтах, текстовый топ)."""
+    global _cprofiles
+    _cprofiles = []
+    time.sleep(seconds)
+    with _cprofiles_lock:
+        profiles, _cprofiles = _cprofiles, None
+    if not profiles:
+        return b"", "За это время обработчики не вызывались."
+    stats = pstats.Stats(profiles[0])
+    for p in profiles[1:]:
+        stats.add(p)
+    out = io.StringIO()
+    stats.stream = out
+    print(f"cProfile обработчиков: {seconds:.0f} с, вызовов: {len(profiles)}", file=out)
+    stats.sort_stats("cumulative").print_stats(40)
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "handlers.pstats")
+        stats.dump_stats(path)
+        with open(path, "rb") as f:
+            return f.read(), out.getvalue()
+
+
+# ---------- память ----------
+
+def _rss_kb() -> int | None:
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1])
+    except OSError:
+        return None
+    return None
+
+
+def memory_report(stop: bool = False) -> str:
+    """Первый вызов запускает tracemalloc; следующие — прирост с прошлого снимка."""
+    with _mem_lock:
+        return _memory_report(stop)
+
+
+def _memory_report(stop: bool) -> str:
+    global _mem_snapshot
+    if stop:
+        tracemalloc.stop()
+        _mem_snapshot = None
+        return "tracemalloc выключен."
+    rss = _rss_kb()
+    lines = [f"RSS: {rss / 1024:.1f} МБ" if rss else "RSS: н/д", f"Потоков: {threading.active_count()}"]
+    for name, fn in sorted(_gauges.items()):
+        try:
+            lines.append(f"{name}: {fn()}")
+        except Exception as e:
+            lines.append(f"{name}: ошибка {e!r}")
+    if not tracemalloc.is_tracing():
+        tracemalloc.start(PROFILE_MEM_FRAMES)
+        _mem_snapshot = tracemalloc.take_snapshot()
+        lines += ["", "tracemalloc запущен; повторите команду позже — придёт разница."]
+        return "\n".join(lines)
+
+    snap = tracemalloc.take_snapshot().filter_traces((
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap*>"),
+    ))
+    current, peak = tracemalloc.get_traced_memory()
+    lines.append(f"tracemalloc: сейчас {current / 1024 / 1024:.1f} МБ, пик {peak / 1024 / 1024:.1f} МБ")
+    lines += ["", "Прирост с прошлого снимка по строкам:"]
+    for diff in snap.compare_to(_mem_snapshot, "lineno")[:25]:
+        lines.append(str(diff))
+    if tracemalloc.get_traceback_limit() > 1:
+        lines += ["", "Крупнейший прирост по стеку:"]
+        for diff in snap.compare_to(_mem_snapshot, "traceback")[:3]:
+            lines.append(f"{diff.size_diff / 1024:+.1f} КиБ, {diff.count_diff:+d} блоков")
+            lines.extend("    " + line for line in diff.traceback.format())
+    _mem_snapshot = snap
+    return "\n".join(lines)
+
+
+# ---------- команда и сигналы ----------
+
+def _send_file(bot, chat_id: int, name: str, data: bytes, caption: str | None = None) -> None:
+    from telebot.types import InputFile
+    bot.send_document(chat_id, InputFile(io.BytesIO(data), file_name=name), caption=caption)
+
+
+def _stamp() -> str:
+    return datetime.now().strftime("%Y%m%d-%H%M%S")
+
+
+def _run_session(bot, chat_id: int, mode: str, seconds: float) -> None:
+    try:
+        if mode == "cpu":
+            raw, text = cprofile(seconds)
+            if raw:
+                _send_file(bot, chat_id, f"handlers-{_stamp()}.pstats", raw, "python -m pstats <файл>")
+            _send_file(bot, chat_id, f"cprofile-{_stamp()}.txt", text.encode("utf-8"))
+        else:
+            _send_file(bot, chat_id, f"profile-{_stamp()}.txt", sample(seconds).encode("utf-8"))
+    except Exception as e:
+        log.exception("Profiling session failed: %r", e)
+        bot.send_message(chat_id, f"Профилирование не удалось: {e!r}")
+    finally:
+        _busy.release()
+
+
+def handle_command(bot, message, args: str) -> None:
+    """Обработчик /profile для любого из ботов (разбор аргументов — см. docstring модуля)."""
+    if not perf.is_admin(message.from_user.id):
+        bot.reply_to(message, "Команда только для администраторов.")
+        return
+    parts = args.split()
+    mode = parts.pop(0) if parts and not parts[0].isdigit() else "sample"
+    if mode == "mem":
+        report = memory_report(stop=bool(parts and parts[0] == "stop"))
+        _send_file(bot, message.chat.id, f"mem-{_stamp()}.txt", report.encode("utf-8"))
+        return
+    if mode not in ("sample", "cpu"):
+        bot.reply_to(message, "Использование: /profile [сек] | /profile cpu [сек] | /profile mem [stop]")
+        return
+    seconds = min(int(parts[0]) if parts and parts[0].isdigit() else PROFILE_SECONDS, PROFILE_MAX_SECONDS)
+    if not _busy.acquire(blocking=False):
+        bot.reply_to(message, "Профилирование уже идёт.")
+        return
+    bot.reply_to(message, f"Профилирую {seconds} с ({mode}), отчёт придёт файлом.")
+    # сессия — в своём потоке: полоса обработки этого чата не ждёт
+    threading.Thread(target=_run_session, args=(bot, message.chat.id, mode, seconds),
+                     name="profile", daemon=True).start()
+
+
+def _write_report(prefix: str, make: Callable[[], str]) -> None:
+    try:
+        os.makedirs(LOG_DIR, exist_ok=True)
+        path = os.path.join(LOG_DIR, f"{prefix}-{_stamp()}.txt")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(make())
+        log.warning("Profiling report written: %s", path)
+    except Exception as e:
+        log.exception("Profiling report failed: %r", e)
+
+
+def install_signal_handlers() -> None:
+    """SIGUSR1 — сэмплирующий профиль, SIGUSR2 — снимок памяти (только из главного потока)."""
+    if not hasattr(signal, "SIGUSR1") or threading.current_thread() is not threading.main_thread():
+        return
+
+    def on_usr1(signum, frame) -> None:
+        if _busy.acquire(blocking=False):
+            def run() -> None:
+                try:
+                    _write_report("profile", lambda: sample(PROFILE_SECONDS))
+                finally:
+                    _busy.release()
+            threading.Thread(target=run, name="profile", daemon=True).start()
+
+    def on_usr2(signum, frame) -> None:
+        threading.Thread(target=_write_report, args=("mem", memory_report), name="profile-mem", daemon=True).start()
+
+    signal.signal(signal.SIGUSR1, on_usr1)
+    signal.signal(signal.SIGUSR2, on_usr2)
@@ -0,0 +1,150 @@
+"""
+prompt_budget.py — размер запроса к модели под конкретный вопрос (main.py).
+
+Вместо одинаковых max_tokens=400 и обрезки вопроса по символам (q[:600]):
+  - estimate_tokens() — локальная оценка числа токенов без токенизатора модели:
+    латиница ≈ 4 символа на токен, кириллица и цифры ≈ 3, знак препинания — токен.
+    Для русских текстов она ближе к реальным токенизаторам, чем «символы / 4»,
+    и слегка завышает — лимиты выходят с запасом;
+  - classify() — тип вопроса по ключевым словам: short (что такое / кто / сколько),
+    explain (объясни / почему / как работает), code, creative, прочее — default;
+  - plan() — вопрос, обрезанный до LLM_INPUT_TOKENS токенов (по границе слова),
+    и max_tokens по типу (LLM_MAX_TOKENS, например "short=150,code=600"; по умолчанию
+    не больше прежних 400);
+  - system_prompt() — компактный вариант: короткий промпт персонажа
+    (characters.prompt_short) и одна строка правил с подсказкой длины ответа,
+    чтобы модель укладывалась в max_tokens, а не обрывалась на полуслове.
+    PROMPT_STYLE=full возвращает прежний длинный промпт с правилами 1–5.
+
+LLM_BUDGET=0 выключает подбор: max_tokens=400, вопрос до 600 символов, полный промпт —
+как было до этого модуля (сравнение «до/после» — benchmarks/prompt_budget_report.py).
+"""
+
+from __future__ import annotations
+import os
+import re
+from dataclasses import dataclass
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+LLM_BUDGET = os.getenv("LLM_BUDGET", "1") != "0"
+LLM_INPUT_TOKENS = int(os.getenv("LLM_INPUT_TOKENS", "200"))
+PROMPT_STYLE = os.getenv("PROMPT_STYLE", "compact")  # compact | full
+
+DEFAULT_MAX_TOKENS = {"short": 150, "explain": 350, "code": 400, "creative": 200, "default": 250}
+LEGACY_MAX_TOKENS = 400
+LEGACY_INPUT_CHARS = 600
+
+
+def _parse_max_tokens(spec: str) -> dict:
+    limits = dict(DEFAULT_MAX_TOKENS)
+    for item in filter(None, spec.replace(" ", "").split(",")):
+        kind, _, value = item.partition("=")
+        if kind in limits and value.isdigit():
+            limits[kind] = int(value)
+    return limits
+
+
+LLM_MAX_TOKENS = _parse_max_tokens(os.getenv("LLM_MAX_TOKENS", ""))
+
+# ---------- оценка токенов ----------
+_PIECE_RE = re.compile(r"[A-Za-z]+|[^\W\d_]+|\d+|\S", re.UNICODE)
+MESSAGE_OVERHEAD = 4  # служебные токены роли и разделителей на сообщение
+
+
+def _piece_tokens(piece: str) -> int:
+    c = piece[0]
+    if c.isascii() and c.isalpha():
+        return (len(piece) + 3) // 4
+    if c.isalnum():
+        return (len(piece) + 2) // 3
+    return 1
+
+
+def estimate_tokens(text: str) -> int:
+    return sum(_piece_tokens(m.group()) for m in _PIECE_RE.finditer(text or ""))
+
+
+def estimate_messages(messages: list[dict]) -> int:
+    return sum(estimate_tokens(str(m.get("content") or "")) + MESSAGE_OVERHEAD for m in messages)
+
+
+def trim_to_tokens(text: str, limit: int) -> str:
+    """Начало текста не длиннее limit токенов; режется по границе слова, с «…»."""
+    used = 0
+    for m in _PIECE_RE.finditer(text):
+        tokens = _piece_tokens(m.group())
+        if used + tokens > limit:
+            cut = m.start()
+            if tokens > 4:  # длинное «слово» без пробелов (ссылка, base64) режем внутри
+                cut += (limit - used) * len(m.group()) // tokens
+            return text[:cut].rstrip() + "…"
+        used += tokens
+    return text
+
+
+# ---------- тип вопроса ----------
+_KINDS = (  # порядок важен: первое совпадение
+    ("code", re.compile(r"```|\bкод|\bфункци|\bскрипт|\bпрограмм|\bpython\b|\bsql\b|\bregex|\bрегуляр", re.I)),
+    ("creative", re.compile(r"\bстих|\bхайку|\bсказк|\bисторию\b|\bрассказ\b|\bшутк|\bанекдот|\bпесн", re.I)),
+    ("explain", re.compile(r"\bобъясн|\bпочему\b|\bзачем\b|\bкак работа|\bчем .+ отлича|\bсравни|"
+                           r"\bрасскажи|\bопиши|\bразбер|\bпошагов|\bпо шагам", re.I)),
+    ("short", re.compile(r"^\s*(что такое|кто (такой|такая|такие)|кто\b|когда\b|где\b|сколько\b|какой\b|"
+                         r"какая\b|какое\b|да или нет)", re.I)),
+)
+
+
+def classify(question: str) -> str:
+    for kind, pattern in _KINDS:
+        if pattern.search(question):
+            return "short" if kind == "short" and len(question.split()) > 15 else kind
+    return "default"
+
+
+@dataclass
+class Budget:
+    kind: str
+    text: str        # вопрос после обрезки
+    max_tokens: int
+    input_tokens: int
+
+
+def plan(question: str) -> Budget:
+    """Обрезанный вопрос и max_tokens для него."""
+    question = question.strip()
+    if not LLM_BUDGET:
+        text = question[:LEGACY_INPUT_CHARS]
+        return Budget("legacy", text, LEGACY_MAX_TOKENS, estimate_tokens(text))
+    kind = classify(question)
+    text = trim_to_tokens(question, LLM_INPUT_TOKENS)
+    return Budget(kind, text, LLM_MAX_TOKENS[kind], estimate_tokens(text))
+
+
+# ---------- system prompt ----------
+FULL_RULES = (
+    "Правила:\n"
+    "1) Всегда держи стиль и манеру речи выбранного персонажа. При необходимости – переформулируй.\n"
+    "2) Технические ответы давай корректно и по пунктам, но в характерной манере.\n"
+    "3) Не раскрывай, что ты 'играешь роль'.\n"
+    "4) Не используй длинные дословные цитаты из фильмов/книг (>10 слов).\n"
+    "5) Если стиль персонажа выражен слабо – переформулируй ответ и усили характер персонажа, "
+    "сохраняя фактическую точность.\n"
+)
+COMPACT_RULES = "Не выходи из роли, факты точны, без длинных цитат."
+
+
+def system_prompt(character: dict, max_tokens: int | None = None, style: str | None = None) -> str:
+    style = style or (PROMPT_STYLE if LLM_BUDGET else "full")
+    if style == "full":
+        return (f"Ты отвечаешь строго в образе персонажа: {character['name']}.\n"
+                f"{character['prompt']}\n{FULL_RULES}")
+    # у персонажа, добавленного вручную, короткого промпта может не быть — берём обычный
+    short = character.get("prompt_short") or character["prompt"]
+    return f"{short} {COMPACT_RULES}{_length_hint(max_tokens)}"
+
+
+def _length_hint(max_tokens: int | None) -> str:
+    # слово по-русски ≈ 2 токена; просим чуть меньше, чтобы ответ закончился сам
+    return f" Ответ до {max_tokens * 2 // 5} слов." if max_tokens else ""
@@ -0,0 +1,208 @@
+"""
+retention.py — политики хранения: старые заметки, логи, кэш-таблицы.
+
+Что делает один проход (run_retention):
+  - по каждой политике удаляет строки старше N дней маленькими пачками
+    (DELETE ... LIMIT через rowid), между пачками коммит и пауза,
+    чтобы не держать блокировку записи долго;
+  - переводит базу в auto_vacuum=INCREMENTAL (один раз, через VACUUM)
+    и возвращает свободные страницы PRAGMA incremental_vacuum порциями;
+  - сжимает gzip закрытые логи logs/<имя>_<дата_время>.log и logs/<имя>_<дата>.log,
+    которые давно не менялись, и удаляет архивы старше LOG_KEEP_DAYS.
+
+Политики для таблиц регистрируются через register_policy(): сюда же
+добавляются будущие таблицы логов/кэша.
+
+Настройки (переменные окружения, 0 — не чистить):
+  NOTES_RETENTION_DAYS     — сколько дней хранить заметки
+  LOG_COMPRESS_DAYS        — через сколько дней без изменений сжимать лог
+  LOG_KEEP_DAYS            — сколько дней хранить сжатые логи
+  RETENTION_INTERVAL_SEC   — период фоновой чистки (0 — выключена)
+  RETENTION_BATCH          — строк в одной пачке DELETE
+  VACUUM_PAGES             — страниц за один шаг incremental_vacuum
+
+Запуск вручную: python retention.py
+"""
+
+from __future__ import annotations
+import os
+import gzip
+import glob
+import shutil
+import sqlite3
+import logging
+import threading
+import time
+from dataclasses import dataclass
+from typing import List
+
+from db import DB_PATH as NOTES_DB_PATH
+
+log = logging.getLogger(__name__)
+
+NOTES_RETENTION_DAYS = int(os.getenv("NOTES_RETENTION_DAYS", "0"))
+LOG_DIR = os.getenv("LOG_DIR", "logs")
+LOG_COMPRESS_DAYS = int(os.getenv("LOG_COMPRESS_DAYS", "2"))
+LOG_KEEP_DAYS = int(os.getenv("LOG_KEEP_DAYS", "30"))
+RETENTION_INTERVAL_SEC = int(os.getenv("RETENTION_INTERVAL_SEC", "0"))
+RETENTION_BATCH = int(os.getenv("RETENTION_BATCH", "500"))
+RETENTION_PAUSE = float(os.getenv("RETENTION_PAUSE", "0.01"))
+VACUUM_PAGES = int(os.getenv("VACUUM_PAGES", "256"))
+
+
+@dataclass(frozen=True)
+class RetentionPolicy:
+    db_path: str
+    table: str
+    ts_column: str  # колонка с временем в формате SQLite ('YYYY-MM-DD HH:MM:SS')
+    days: int
+
+
+POLICIES: List[RetentionPolicy] = []
+
+
+def register_policy(db_path: str, table: str, ts_column: str, days: int) -> None:
+    """Добавляет политику; days <= 0 — таблица не чистится."""
+    if days > 0:
+        POLICIES.append(RetentionPolicy(db_path, table, ts_column, days))
+
+
+register_policy(NOTES_DB_PATH, "notes", "created_at", NOTES_RETENTION_DAYS)
+
+
+# ---------- таблицы ----------
+def purge_table(policy: RetentionPolicy, batch: int = RETENTION_BATCH, pause: float = RETENTION_PAUSE) -> int:
+    """Удаляет устаревшие строки пачками, возвращает сколько удалено."""
+    # имена таблиц/колонок приходят только из кода (register_policy), не от пользователей
+    sql = (
+        f"DELETE FROM {policy.table} WHERE rowid IN ("
+        f"SELECT rowid FROM {policy.table} WHERE {policy.ts_column} < datetime('now', ?) LIMIT ?)"
+    )
+    cutoff = f"-{policy.days} days"
+    total = 0
+    conn = sqlite3.connect(policy.db_path, timeout=5.0)
+    try:
+        while True:
+            cur = conn.execute(sql, (cutoff, batch))
+            conn.commit()
+            total += cur.rowcount
+            if cur.rowcount < batch:
+                break
+            time.sleep(pause)  # даём обработчикам вклиниться между пачками
+    finally:
+        conn.close()
+    if total:
+        log.info("Retention: %s.%s purged %d rows older than %d days",
+                 policy.db_path, policy.table, total, policy.days)
+    return total
+
+
+def ensure_incremental_vacuum(db_path: str) -> None:
+    """
+    Включает auto_vacuum=INCREMENTAL. Для новой базы хватает PRAGMA,
+    для существующей режим вступает в силу только после полного VACUUM —
+    он выполняется один раз.
+    """
+    conn = sqlite3.connect(db_path, timeout=30.0)
+    try:
+        if conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2:
+            return
+        conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        log.info("Retention: %s switching to auto_vacuum=INCREMENTAL (one-time VACUUM)", db_path)
+        conn.execute("VACUUM")
+    finally:
+        conn.close()
+
+
+def reclaim_pages(db_path: str, pages: int = VACUUM_PAGES, pause: float = RETENTION_PAUSE) -> int:
+    """Возвращает свободные страницы ОС порциями по pages; результат — сколько освобождено."""
+    conn = sqlite3.connect(db_path, timeout=5.0, isolation_level=None)
+    freed = 0
+    try:
+        while True:
+            free = conn.execute("PRAGMA freelist_count").fetchone()[0]
+            if not free:
+                break
+            conn.execute(f"PRAGMA incremental_vacuum({int(pages)})").fetchall()
+            left = conn.execute("PRAGMA freelist_count").fetchone()[0]
+            freed += free - left
+            if left >= free:  # auto_vacuum не включён — дальше не продвинемся
+                break
+            time.sleep(pause)
+    finally:
+        conn.close()
+    if freed:
+        log.info("Retention: %s reclaimed %d pages", db_path, freed)
+    return freed
+
+
+# ---------- файлы логов ----------
+# закрытые логи: <имя>_YYYY-MM-DD_HHMMSS[-n].log после ротации logsetup.TimedSizeRotatingHandler
+# и <имя>_YYYY-MM-DD.log — дневные файлы прежнего логирования
+_ROTATED_LOGS = ("*_[0-9][0-9][0-9][0-9]-[0-9][0-9]-[0-9][0-9]_*.log",
+                 "*_[0-9]*-[0-9][0-9]-[0-9][0-9].log")
+
+
+def _closed_logs(log_dir: str, suffix: str = "") -> list[str]:
+    return sorted({p for pattern in _ROTATED_LOGS for p in glob.glob(os.path.join(log_dir, pattern + suffix))})
+
+
+def rotate_logs(log_dir: str = LOG_DIR, compress_days: int = LOG_COMPRESS_DAYS, keep_days: int = LOG_KEEP_DAYS) -> None:
+    """
+    Сжимает закрытые логи <имя>_<дата_время>.log и <имя>_<дата>.log (bot, main3,
+    crud), не менявшиеся compress_days дней, и удаляет архивы старше keep_days.
+    Открытые файлы (<имя>.log) под шаблоны не попадают.
+    """
+    now = time.time()
+    if compress_days > 0:
+        for path in _closed_logs(log_dir):
+            if now - os.path.getmtime(path) < compress_days * 86400:
+                continue
+            with open(path, "rb") as src, gzip.open(path + ".gz.part", "wb") as dst:
+                shutil.copyfileobj(src, dst)
+            os.replace(path + ".gz.part", path + ".gz")
+            shutil.copystat(path, path + ".gz")  # возраст архива = возраст лога
+            os.remove(path)
+            log.info("Retention: compressed %s", path)
+    if keep_days > 0:
+        for path in _closed_logs(log_dir, ".gz"):
+            if now - os.path.getmtime(path) >= keep_days * 86400:
+                os.remove(path)
+                log.info("Retention: removed %s", path)
+
+
+# ---------- полный проход и фоновый поток ----------
+def run_retention() -> None:
+    for db_path in sorted({p.db_path for p in POLICIES}):
+        ensure_incremental_vacuum(db_path)
+    for policy in POLICIES:
+        purge_table(policy)
+    for db_path in sorted({p.db_path for p in POLICIES}):
+        reclaim_pages(db_path)
+    rotate_logs()
+
+
+def retention_loop(interval: int, stop: threading.Event) -> None:
+    log.info("Retention scheduler started: every %d s", interval)
+    while True:
+        try:
+            run_retention()
+        except Exception as e:
+            log.exception("Retention error: %r", e)
+        if stop.wait(interval):
+            break
+
+
+def start_retention_scheduler(interval: int = RETENTION_INTERVAL_SEC) -> threading.Event | None:
+    """Запускает фоновую чистку; при interval <= 0 ничего не делает."""
+    if interval <= 0:
+        return None
+    stop = threading.Event()
+    t = threading.Thread(target=retention_loop, args=(interval, stop), name="retention", daemon=True)
+    t.start()
+    return stop
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(name)s: %(message)s")
+    run_retention()
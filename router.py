@@ -0,0 +1,136 @@
+"""
+router.py — маршрутизация текстовых сообщений одним поиском в словаре.
+
+Зачем:
+  - у telebot каждый message_handler — предикат, и обычное сообщение
+    проверяется всеми подряд (десяток lambda m: m.text == "..." + команды),
+    пока не найдётся подходящий;
+  - аргументы команд разбирались повторяющимся
+    message.text.replace('/ask', '', 1) — ломается на форме /ask@botname.
+
+Router регистрирует у бота один обработчик текста и внутри выбирает
+функцию по словарю: команда (без @botname, без учёта регистра) или
+надпись кнопки. Обработчик получает (message, args): args — текст после
+команды или результат заранее скомпилированного парсера (parse=...).
+
+Пример:
+    router = Router()
+
+    @router.command("ask")
+    def cmd_ask(message, args): ...
+
+    @router.command("ask_model", parse=regex_args(r"(\\d+)\\s+(.+)"))
+    def cmd_ask_model(message, args): ...   # args = ('7', 'вопрос') или None
+
+    @router.text("Погода")
+    def kb_weather(message, args): ...
+
+    router.install(bot)
+
+Цепочки register_next_step_handler по-прежнему работают: telebot проверяет
+их раньше обработчиков сообщений.
+
+На каждое сообщение dispatch пишет одну запись лога «handled» с полями
+user_id, command (/имя, надпись кнопки или *), size (длина текста)
+и latency_ms (время обработчика); то же время — в гистограмму
+router_command_seconds{command} (metrics.py).
+"""
+
+from __future__ import annotations
+import re
+import time
+import logging
+from typing import Callable, Optional
+
+from metrics import COMMAND_SECONDS, name_span
+
+Handler = Callable[..., object]
+
+log = logging.getLogger(__name__)
+
+
+_COMMAND = re.compile(r"/([^\s@]+)(?:@\S*)?\s*(.*)", re.S)
+
+
+def split_command(text: str) -> tuple[Optional[str], str]:
+    """'/Ask@MyBot  вопрос' -> ('ask', 'вопрос'); не команда -> (None, text)."""
+    m = _COMMAND.match(text)
+    if m is None:
+        return None, text
+    return m.group(1).lower(), m.group(2).strip()
+
+
+def regex_args(pattern: str, flags: int = re.S) -> Callable[[str], Optional[tuple]]:
+    """Парсер аргументов по регулярке (компилируется один раз): группы или None."""
+    rx = re.compile(pattern, flags)
+
+    def parse(args: str) -> Optional[tuple]:
+        m = rx.fullmatch(args)
+        return m.groups() if m else None
+    return parse
+
+
+class Router:
+    def __init__(self):
+        self.commands: dict[str, tuple[Handler, Optional[Callable]]] = {}
+        self.texts: dict[str, Handler] = {}
+        self.fallback: Optional[Handler] = None
+
+    def command(self, *names: str, parse: Optional[Callable[[str], object]] = None):
+        def deco(fn: Handler) -> Handler:
+            for name in names:
+                self.commands[name.lower()] = (fn, parse)
+            return fn
+        return deco
+
+    def text(self, *labels: str):
+        """Надпись кнопки reply-клавиатуры — точное совпадение текста."""
+        def deco(fn: Handler) -> Handler:
+            for label in labels:
+                self.texts[label] = fn
+            return fn
+        return deco
+
+    def default(self, fn: Handler) -> Handler:
+        """Всё, что не нашлось ни среди команд, ни среди кнопок."""
+        self.fallback = fn
+        return fn
+
+    def route(self, text: str) -> tuple[str, Optional[Handler], object]:
+        """Имя маршрута (для логов), функция и аргументы; функция None — обработчика нет."""
+        name, args = split_command(text)
+        if name is None:
+            fn = self.texts.get(text)
+            return (text, fn, "") if fn else ("*", self.fallback, "")
+        fn, parse = self.commands.get(name, (None, None))
+        if fn is None:
+            return "*", self.fallback, args
+        return "/" + name, fn, parse(args) if parse else args
+
+    def resolve(self, text: str) -> tuple[Optional[Handler], object]:
+        """Функция и аргументы для текста сообщения; (None, ...) — обработчика нет."""
+        _, fn, args = self.route(text)
+        return fn, args
+
+    def dispatch(self, message) -> None:
+        text = message.text or ""
+        command, fn, args = self.route(text)
+        if fn is None:
+            return
+        name_span(command)  # /perf покажет команду, а не «dispatch»
+        start = time.perf_counter()
+        try:
+            fn(message, args)
+        finally:
+            elapsed = time.perf_counter() - start
+            COMMAND_SECONDS.labels(command).observe(elapsed)
+            log.info("handled %s", command, extra={
+                "user_id": message.from_user.id if message.from_user else None,
+                "command": command,
+                "size": len(text),
+                "latency_ms": round(elapsed * 1000, 2),
+            })
+
+    def install(self, bot) -> None:
+        """Один обработчик текстовых сообщений вместо цепочки предикатов."""
+        bot.register_message_handler(self.dispatch, content_types=["text"])
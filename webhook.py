@@ -0,0 +1,252 @@
+"""
+webhook.py — приём обновлений через webhook как альтернатива long polling.
+
+Зачем:
+  - infinity_polling — один цикл getUpdates на процесс и задержка опроса;
+    с webhook Telegram сам присылает каждое обновление POST-запросом;
+  - HTTP-поток только сверяет секрет (X-Telegram-Bot-Api-Secret-Token),
+    разбирает JSON и кладёт его в полосу своего чата (lanes.py) — 200 уходит
+    сразу, обработчики бота работают в потоках полос по порядку внутри чата;
+  - очередь полосы полна — отвечаем 503: Telegram повторит доставку позже
+    (backpressure вместо неограниченного роста памяти).
+
+Режим выбирается переменной BOT_MODE (polling | webhook); main.py, main3.py
+и crud.py запускаются одной функцией run_bot(bot), несколько ботов в одном
+процессе (host.py) — run_bots(): общие полосы обработки, один HTTP-сервер
+webhook (путь на бота) и один пул HTTP-соединений к Bot API.
+
+Настройки webhook (переменные окружения, читаются при запуске run_bot):
+  WEBHOOK_URL      — внешний https-адрес без пути; задан — вызываем setWebhook,
+                     пусто — регистрацией занимается прокси / фейковый API
+  WEBHOOK_PATH     — путь на нашем сервере (по умолчанию /telegram; у нескольких ботов — /telegram/<имя>)
+  WEBHOOK_SECRET   — секрет заголовка; пусто при заданном WEBHOOK_URL — генерируется
+  WEBHOOK_LISTEN   — адрес:порт локального сервера (0.0.0.0:8080)
+  BOT_LANES, BOT_LANE_DEPTH — число полос обработки и ёмкость очереди каждой (lanes.py)
+  BOT_HTTP_POOL    — соединений в общем пуле к Bot API
+
+GET-запросов сервер webhook не обслуживает: за обратным прокси все запросы
+приходят с 127.0.0.1, и адрес клиента ничего не защищает. /stats (счётчики
+сервера и состояние полос в JSON) и /metrics (Prometheus, metrics.py) отдаёт
+отдельный сервер на METRICS_LISTEN — его порт наружу не публикуют.
+
+Нагрузочная проверка: python benchmarks/post_updates.py (POST записанных/синтетических обновлений).
+"""
+
+from __future__ import annotations
+import os
+import hmac
+import json
+import secrets
+import logging
+import time
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+from telebot import types, apihelper
+
+import metrics
+import profiling
+from lanes import LanePool, attach, raw_chat_key
+
+log = logging.getLogger(__name__)
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+MAX_BODY = 1 << 20  # обновление Telegram заметно меньше; больше — не от Telegram
+
+
+def _parse_listen(value: str) -> tuple[str, int]:
+    host, _, port = value.rpartition(":")
+    return host or "0.0.0.0", int(port)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive: Telegram и нагрузочный скрипт держат соединения
+
+    def do_POST(self) -> None:
+        app: WebhookServer = self.server.app
+        route = app.routes.get(self.path.split("?", 1)[0])
+        # отказ до чтения тела: непрочитанное тело сломало бы keep-alive — закрываем соединение
+        if route is None:
+            self.close_connection = True
+            return self._reply(404)
+        bot, secret = route
+        # байты, а не str: compare_digest на не-ASCII строке (заголовок декодирован
+        # как latin-1) бросает TypeError — это был бы 500 вместо 403
+        if secret and not hmac.compare_digest(self.headers.get(SECRET_HEADER, "").encode("latin-1", "replace"),
+                                              secret.encode()):
+            app.count("forbidden")
+            self.close_connection = True
+            return self._reply(403)
+        try:
+            length = int(self.headers.get("Content-Length") or 0)
+        except ValueError:
+            length = 0
+        if not 0 < length <= MAX_BODY:
+            app.count("bad")
+            self.close_connection = True
+            return self._reply(413 if length > MAX_BODY else 400)
+        try:
+            data = json.loads(self.rfile.read(length))
+        except ValueError:
+            app.count("bad")
+            return self._reply(400)
+        if not isinstance(data, dict) or "update_id" not in data:
+            app.count("bad")
+            return self._reply(400)
+        if not app.pool.submit(raw_chat_key(data), lambda: app.process(bot, data), block=False):
+            app.count("busy")
+            return self._reply(503, {"Retry-After": "1"})
+        app.count("accepted")
+        self._reply(200)
+
+    def do_GET(self) -> None:
+        self.close_connection = True
+        self._reply(404)
+
+    def _reply(self, code: int, headers: dict | None = None) -> None:
+        self.send_response(code)
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.send_header("Content-Length", "0")
+        if self.close_connection:
+            self.send_header("Connection", "close")
+        self.end_headers()
+
+    def log_message(self, fmt: str, *args) -> None:  # по строке на запрос в stderr не нужно
+        log.debug("webhook %s " + fmt, self.address_string(), *args)
+
+
+class _HTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 128  # backlog listen(): по умолчанию 5, всплеск соединений ждал бы повтора SYN
+
+
+class WebhookServer:
+    """
+    HTTP-сервер webhook поверх полос обработки. Ботов может быть несколько —
+    каждый на своём пути (add_bot); полосы общие.
+    """
+
+    def __init__(self, listen: tuple[str, int] = ("0.0.0.0", 8080), pool: LanePool | None = None):
+        self.listen = listen
+        self.pool = pool or LanePool(name="webhook")
+        self.routes: dict = {}
+        self.stats = {"accepted": 0, "busy": 0, "forbidden": 0, "bad": 0}
+        self._stats_lock = threading.Lock()
+        self._httpd: _HTTPServer | None = None
+
+    def count(self, key: str) -> None:
+        with self._stats_lock:
+            self.stats[key] += 1
+
+    def add_bot(self, bot, path: str, secret: str | None = None) -> None:
+        # обработчики выполняются в потоках полос: собственный пул telebot
+        # вернул бы и гонки внутри чата, и неограниченную очередь
+        bot.threaded = False
+        self.routes[path] = (bot, secret)
+
+    @staticmethod
+    def process(bot, data: dict) -> None:
+        # исходный метод класса — на случай, если бот подключён и к polling-полосам (lanes.attach)
+        type(bot).process_new_updates(bot, [types.Update.de_json(data)])
+
+    def snapshot(self) -> dict:
+        return {"server": dict(self.stats), "lanes": self.pool.stats()}
+
+    def start(self) -> None:
+        """Запускает HTTP-сервер в фоновом потоке (потоки полос уже работают)."""
+        self._httpd = _HTTPServer(self.listen, _Handler)
+        self._httpd.app = self
+        threading.Thread(target=self._httpd.serve_forever, name="webhook-http", daemon=True).start()
+        metrics.register_page("/stats", self.snapshot)
+        log.info("Webhook server on %s:%d, paths: %s", *self._httpd.server_address[:2], ", ".join(self.routes))
+
+    def stop(self) -> None:
+        if self._httpd:
+            self._httpd.shutdown()
+            self._httpd.server_close()
+
+
+def share_http_session(pool_size: int | None = None) -> None:
+    """
+    Один requests.Session на все потоки и всех ботов процесса: по умолчанию
+    telebot заводит сессию (и пул соединений) в каждом потоке.
+    """
+    if apihelper.session is not None:
+        return
+    pool_size = pool_size or int(os.getenv("BOT_HTTP_POOL", "32"))
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=pool_size)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    apihelper.session = session
+
+
+def _poll_forever(name: str, bot, kwargs: dict) -> None:
+    # infinity_polling сам переживает сетевые ошибки; здесь — от всего остального,
+    # чтобы падение одного бота не останавливало процесс с другими
+    while True:
+        try:
+            bot.infinity_polling(**kwargs)
+            return
+        except Exception as e:
+            log.exception("Polling of %s crashed: %r; restarting in 5 s", name, e)
+            time.sleep(5)
+
+
+def run_bots(bots: dict, polling: dict | None = None) -> None:
+    """
+    Запуск нескольких ботов в одном процессе: bots — имя -> TeleBot,
+    polling — имя -> параметры infinity_polling. BOT_MODE=webhook — один
+    сервер (путь WEBHOOK_PATH, у нескольких ботов WEBHOOK_PATH/<имя>),
+    иначе — цикл getUpdates на бота в своём потоке. Полосы обработки и пул
+    HTTP-соединений общие. Блокирует до остановки процесса.
+    """
+    polling = polling or {}
+    share_http_session()
+    metrics.instrument_telegram()
+    for name, bot in bots.items():
+        metrics.instrument_bot(bot, name)
+        profiling.register_gauge(f"{name}: next-step обработчиков",
+                                 lambda b=bot: sum(map(len, b.next_step_backend.handlers.values())))
+    metrics.start_http_server()
+    profiling.install_signal_handlers()
+    pool = LanePool(name="lane")
+
+    if os.getenv("BOT_MODE", "polling").lower() != "webhook":
+        for name, bot in bots.items():
+            bot.remove_webhook()  # после работы в режиме webhook getUpdates отвечал бы 409
+            attach(bot, pool)
+            threading.Thread(target=_poll_forever, args=(name, bot, polling.get(name, {})),
+                             name=f"polling-{name}", daemon=True).start()
+        threading.Event().wait()  # работают фоновые потоки; ждём Ctrl+C / сигнала
+        return
+
+    url = os.getenv("WEBHOOK_URL", "").rstrip("/")
+    base = os.getenv("WEBHOOK_PATH", "/telegram")
+    secret = os.getenv("WEBHOOK_SECRET") or (secrets.token_urlsafe(32) if url else None)
+    server = WebhookServer(listen=_parse_listen(os.getenv("WEBHOOK_LISTEN", "0.0.0.0:8080")), pool=pool)
+    paths = {name: base if len(bots) == 1 else f"{base}/{name}" for name in bots}
+    for name, bot in bots.items():
+        server.add_bot(bot, paths[name], secret)
+    server.start()
+    if url:
+        for name, bot in bots.items():
+            bot.set_webhook(url=url + paths[name], secret_token=secret,
+                            drop_pending_updates=polling.get(name, {}).get("skip_pending") or None)
+            log.info("Webhook registered: %s%s", url, paths[name])
+    elif not secret:
+        log.warning("Webhook without WEBHOOK_SECRET: any POST is accepted")
+    if not metrics.METRICS_LISTEN:
+        log.info("METRICS_LISTEN is not set: /stats and /metrics are not served")
+    threading.Event().wait()
+
+
+def run_bot(bot, **polling_kwargs) -> None:
+    """
+    Точка входа одного бота: BOT_MODE=webhook — сервер webhook, иначе infinity_polling(**polling_kwargs).
+    В обоих режимах обновления обрабатываются полосами по чатам (lanes.py).
+    Блокирует до остановки процесса.
+    """
+    run_bots({"bot": bot}, {"bot": polling_kwargs})